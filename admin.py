@@ -0,0 +1,187 @@
+"""Admin reporting: account tables, CSV export and site statistics.
+
+Account tables are sorted and paged in SQL. Relationship sizes (wishlists,
+chats, ratings, products) come from one grouped COUNT per relationship over
+the ids on the page, so no collection is ever loaded. Exports stream every
+row the same way, a chunk of ids at a time.
+
+Site statistics (signups, messages and ratings per day, the distribution of
+ratings and table totals) would scan the biggest tables on every view, so
+refresh_stats() stores them in stat_rollups and the dashboard only reads
+that. A 'stats.refresh' job reschedules itself every STATS_REFRESH_INTERVAL
+seconds; `flask stats-refresh` runs it by hand.
+"""
+import csv
+import io
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+
+import jobs
+from models import db, IST, Artisan, Chat, Message, Product, Rating, StatRollup, User, Wishlist
+
+STATS_DAYS = 30
+EXPORT_CHUNK_ROWS = 500
+DAILY_METRICS = (
+    ('users.signups', 'User signups', User.created_at),
+    ('artisans.signups', 'Artisan signups', Artisan.created_at),
+    ('messages.sent', 'Messages', Message.timestamp),
+    ('ratings.given', 'Ratings', Rating.created_at),
+)
+TOTALS = (('users', User), ('artisans', Artisan), ('products', Product), ('chats', Chat),
+          ('messages', Message), ('ratings', Rating))
+
+
+class AccountTable:
+    def __init__(self, model, columns, counts, sortable):
+        self.model = model
+        self.columns = columns  # (field, label)
+        self.counts = counts  # (field, label, foreign key to the account)
+        self.sortable = sortable
+
+    @property
+    def headers(self):
+        return [(field, label) for field, label in self.columns] + \
+               [(field, label) for field, label, _ in self.counts]
+
+
+TABLES = {
+    'users': AccountTable(
+        User,
+        [('id', 'ID'), ('name', 'Name'), ('email', 'Email'), ('created_at', 'Created At')],
+        [('wishlists', 'Wishlists', Wishlist.user_id), ('chats', 'Chats', Chat.user_id),
+         ('ratings', 'Ratings', Rating.user_id)],
+        ('id', 'name', 'email', 'created_at'),
+    ),
+    'artisans': AccountTable(
+        Artisan,
+        [('id', 'ID'), ('name', 'Name'), ('email', 'Email'), ('craft_type', 'Craft Type'),
+         ('location', 'Location'), ('rating', 'Rating'), ('total_ratings', 'Total Ratings'),
+         ('created_at', 'Created At')],
+        [('products', 'Products', Product.artisan_id), ('chats', 'Chats', Chat.artisan_id)],
+        ('id', 'name', 'email', 'rating', 'total_ratings', 'created_at'),
+    ),
+}
+
+
+def _select(table):
+    return select(*[getattr(table.model, field) for field, _ in table.columns])
+
+def _add_counts(table, rows):
+    """Fill in each row's relationship sizes with one grouped COUNT apiece"""
+    ids = [row['id'] for row in rows]
+    for field, _, key in table.counts:
+        counts = dict(db.session.execute(
+            select(key, func.count()).where(key.in_(ids)).group_by(key)
+        ).all()) if ids else {}
+        for row in rows:
+            row[field] = counts.get(row['id'], 0)
+
+def fetch_page(name, sort='id', descending=False, page=1, per_page=50):
+    """One page of an account table; returns (rows, total rows)"""
+    table = TABLES[name]
+    if sort not in table.sortable:
+        raise ValueError(f'cannot sort {name} by {sort!r}')
+    model = table.model
+    column = getattr(model, sort)
+    order = [column.desc(), model.id.desc()] if descending else [column, model.id]
+    total = db.session.scalar(select(func.count()).select_from(model))
+    rows = [dict(row._mapping) for row in db.session.execute(
+        _select(table).order_by(*order).limit(per_page).offset((page - 1) * per_page)
+    )]
+    _add_counts(table, rows)
+    return rows, total
+
+def export_csv(name):
+    """Yield an account table with its relationship sizes as CSV text chunks"""
+    table = TABLES[name]
+    fields = [field for field, _ in table.headers]
+    rows = db.session.execute(
+        _select(table).order_by(table.model.id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+
+    for partition in rows.partitions():
+        chunk = [dict(row._mapping) for row in partition]
+        _add_counts(table, chunk)
+        for row in chunk:
+            if row.get('created_at') is not None:
+                row['created_at'] = row['created_at'].isoformat()
+            writer.writerow([row[field] for field in fields])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# Site statistics
+def _now():
+    return datetime.now(IST).replace(tzinfo=None)
+
+def refresh_stats(days=STATS_DAYS):
+    """Recompute every rollup in one transaction; returns the number of rows"""
+    now = _now()
+    since = datetime.combine((now - timedelta(days=days - 1)).date(), datetime.min.time())
+    rows = []
+
+    def add(metric, bucket, value):
+        rows.append({'metric': metric, 'bucket': str(bucket), 'value': value, 'computed_at': now})
+
+    for metric, _, column in DAILY_METRICS:
+        day = func.date(column)
+        for bucket, count in db.session.execute(
+                select(day, func.count()).where(column >= since).group_by(day)):
+            add(metric, bucket, count)
+    for stars, count in db.session.execute(select(Rating.rating, func.count()).group_by(Rating.rating)):
+        add('ratings.stars', stars, count)
+    for name, model in TOTALS:
+        add('totals', name, db.session.scalar(select(func.count()).select_from(model)))
+
+    db.session.execute(delete(StatRollup))
+    db.session.execute(insert(StatRollup.__table__), rows)
+    db.session.commit()
+    return len(rows)
+
+def load_stats(days=STATS_DAYS):
+    """The stored rollups arranged for the dashboard, or None before the first refresh"""
+    rollups = StatRollup.query.all()
+    if not rollups:
+        return None
+    values = {(r.metric, r.bucket): r.value for r in rollups}
+    computed_at = max(r.computed_at for r in rollups)
+
+    today = computed_at.date()
+    daily = []
+    for offset in range(days):
+        day = (today - timedelta(days=offset)).isoformat()
+        daily.append((day, [values.get((metric, day), 0) for metric, _, _ in DAILY_METRICS]))
+
+    stars = [(n, values.get(('ratings.stars', str(n)), 0)) for n in range(5, 0, -1)]
+    rated = sum(count for _, count in stars)
+    return {
+        'computed_at': computed_at,
+        'daily_labels': [label for _, label, _ in DAILY_METRICS],
+        'daily': daily,
+        'stars': [(n, count, round(100 * count / rated, 1) if rated else 0) for n, count in stars],
+        'totals': [(name, values.get(('totals', name), 0)) for name, _ in TOTALS],
+    }
+
+def schedule_refresh(queue, interval, slot=None):
+    """Queue the stats refresh for a time slot, the current one by default
+
+    Slots are interval-long and the job's idempotency key names its slot, so
+    however many processes ask, each slot is refreshed once.
+    """
+    now = time.time()
+    slot = int(now // interval) if slot is None else slot
+    queue.enqueue('stats.refresh', idempotency_key=f'stats.refresh:{interval}:{slot}',
+                  delay=max(slot * interval - now, 0), interval=interval)
+
+@jobs.task('stats.refresh')
+def refresh_stats_job(interval):
+    refresh_stats()
+    schedule_refresh(jobs.get_queue(), interval, int(time.time() // interval) + 1)
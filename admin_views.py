@@ -0,0 +1,61 @@
+"""Admin pages under /admin: the stats dashboard, paged account tables and
+CSV exports. Every request must carry ?key=ADMIN_KEY.
+
+Registered as the 'admin' blueprint by app.create_app().
+"""
+from flask import Blueprint, Response, abort, current_app, jsonify, render_template, request, stream_with_context
+
+from cache import current_cache
+from views import catalog_export_response
+import admin
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+def is_admin_request():
+    return request.args.get("key") == current_app.config['ADMIN_KEY']
+
+@bp.route('/dashboard')
+def dashboard():
+    if not is_admin_request():
+        return "Unauthorized", 401
+    return render_template('admin_dashboard.html', stats=admin.load_stats())
+
+@bp.route('/<any(users, artisans):table>')
+def table_page(table):
+    if not is_admin_request():
+        return "Unauthorized", 401
+    sort = request.args.get('sort', 'id')
+    descending = request.args.get('order') == 'desc'
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config['ADMIN_PAGE_SIZE']
+    try:
+        rows, total = admin.fetch_page(table, sort, descending, page, per_page)
+    except ValueError:
+        abort(400)
+    return render_template(
+        'admin_table.html', table=table, headers=admin.TABLES[table].headers,
+        sortable=admin.TABLES[table].sortable, rows=rows, total=total, sort=sort,
+        descending=descending, page=page, pages=max((total + per_page - 1) // per_page, 1),
+    )
+
+@bp.route('/<any(users, artisans):table>/export')
+def export_table(table):
+    if not is_admin_request():
+        return "Unauthorized", 401
+    return Response(
+        stream_with_context(admin.export_csv(table)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={table}.csv'},
+    )
+
+@bp.route('/cache/stats')
+def cache_stats():
+    if not is_admin_request():
+        return "Unauthorized", 401
+    return jsonify(current_cache.stats())
+
+@bp.route('/products/export')
+def export_products():
+    if not is_admin_request():
+        return "Unauthorized", 401
+    return catalog_export_response(request.args.get('format', 'csv'))
@@ -0,0 +1,83 @@
+"""Fingerprinted, long-cached static file URLs.
+
+asset_url('css/kalamitra.css') returns /static/css/kalamitra.css?v=<hash>,
+where the hash covers the file's contents. A request carrying a fingerprint,
+or for a content-addressed upload (images/<sha256>/...), is cacheable forever
+and gets Cache-Control: public, max-age=1 year, immutable. Other static
+responses keep Flask's ETag/Last-Modified revalidation and Range support.
+
+File delivery can be handed to the front-end server with STATIC_SENDFILE:
+    None           Flask streams the file (default)
+    'x-sendfile'   X-Sendfile header with the absolute path (Apache, lighttpd)
+    'x-accel'      X-Accel-Redirect to STATIC_ACCEL_PREFIX + path (nginx)
+"""
+import hashlib
+import os
+import re
+
+from flask import current_app, request, url_for
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+CONTENT_ADDRESSED_RE = re.compile(r'(^|/)images/[0-9a-f]{2}/[0-9a-f]{64}/')
+
+_fingerprints = {}
+
+
+def fingerprint(path):
+    """Short content hash of a file, cached until its size or mtime changes"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    value = digest.hexdigest()[:12]
+    _fingerprints[path] = (key, value)
+    return value
+
+
+def asset_url(filename):
+    """url_for('static') with a content fingerprint for immutable caching"""
+    if CONTENT_ADDRESSED_RE.search(filename):
+        return url_for('static', filename=filename)
+    version = fingerprint(os.path.join(current_app.static_folder, filename))
+    return url_for('static', filename=filename, v=version)
+
+
+def versioned_url(url):
+    """Fingerprint a stored /static/... URL such as an upload's image_url"""
+    static_prefix = current_app.static_url_path + '/'
+    if not url or not url.startswith(static_prefix):
+        return url
+    return asset_url(url[len(static_prefix):])
+
+
+def init_app(app):
+    if app.config['STATIC_SENDFILE']:
+        app.config['USE_X_SENDFILE'] = True
+
+    app.jinja_env.globals['asset_url'] = asset_url
+    app.add_template_filter(versioned_url, 'versioned')
+
+    @app.after_request
+    def cache_static_files(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+            return response
+        filename = request.view_args.get('filename', '')
+        if request.args.get('v') or CONTENT_ADDRESSED_RE.search(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+
+        if app.config['STATIC_SENDFILE'] == 'x-accel' and 'X-Sendfile' in response.headers:
+            path = response.headers.pop('X-Sendfile')
+            relative = os.path.relpath(path, app.static_folder).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = f"{app.config['STATIC_ACCEL_PREFIX']}/{relative}"
+        return response
@@ -0,0 +1,43 @@
+"""Current account lookup and the login_required decorator.
+
+The logged-in account (a User or an Artisan, per session['user_type']) is
+loaded at most once per request and kept on g.principal.
+"""
+from functools import wraps
+
+from flask import flash, g, jsonify, redirect, session, url_for
+
+from models import db, User, Artisan
+
+PRINCIPAL_MODELS = {'user': User, 'artisan': Artisan}
+
+
+def current_principal():
+    """The logged-in User or Artisan, or None"""
+    if 'principal' not in g:
+        model = PRINCIPAL_MODELS.get(session.get('user_type'))
+        user_id = session.get('user_id')
+        g.principal = db.session.get(model, user_id) if model and user_id else None
+    return g.principal
+
+
+def login_required(user_type=None, message='Please login first!', login_endpoint=None, api=False):
+    """Only let the given account type ('user', 'artisan' or either) through
+
+    Others are redirected to the login page with a flash message, or get a
+    401 when api is set.
+    """
+    login_endpoint = login_endpoint or ('main.artisan_login' if user_type == 'artisan' else 'main.login')
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            principal = current_principal()
+            if principal is None or (user_type and session.get('user_type') != user_type):
+                if api:
+                    return jsonify(error=message), 401
+                flash(message, 'error')
+                return redirect(url_for(login_endpoint))
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,295 @@
+"""Benchmark harness for the main page flows.
+
+Drives the app through its test client (in process, with SQL statements
+counted per request) or a running server over HTTP, and reports p50/p90/p99
+latency, throughput and queries per request for each scenario:
+
+    index      home page and the next directory page from /api/artisans
+    profile    a random artisan profile as a logged-in user
+    dashboard  the user dashboard (wishlist)
+    chat       the chat list and one conversation
+    rate       rating an artisan (writes)
+
+Cold start is measured too, in fresh interpreters: importing app, running
+create_app() and serving the first request.
+
+Users and artisans are sampled from the database, so seed it first. Results
+are written as JSON; compare() reports scenarios whose latency regressed
+against an earlier run.
+"""
+import json
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from http.cookiejar import CookieJar
+
+from flask import request_finished
+from sqlalchemy import func, select
+
+import query_budget
+from models import db, User, Artisan, Product, Chat
+from seed import SEED_PASSWORD
+
+SCENARIOS = ('index', 'profile', 'dashboard', 'chat', 'rate')
+SAMPLE_SIZE = 500
+
+# Statements run by the last request on each thread, as counted by
+# query_budget; the test client handles a request on the calling thread
+_last_request = threading.local()
+
+
+def _record_statement_count(sender, response, **extra):
+    _last_request.statements = query_budget.get_query_count()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class TestClientDriver:
+    """Requests through app.test_client(); logs in by setting the session"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+        request_finished.connect(_record_statement_count, app)
+
+    def login(self, user_id, email):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['user_type'] = 'user'
+
+    def request(self, method, path, data=None):
+        _last_request.statements = None
+        start = time.perf_counter()
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        elapsed = time.perf_counter() - start
+        return response.status_code, elapsed, _last_request.statements
+
+
+class HTTPDriver:
+    """Requests against a running server; logs in through the login form"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(CookieJar()), _NoRedirect())
+
+    def login(self, user_id, email):
+        self.request('POST', '/login', {'email': email, 'password': SEED_PASSWORD})
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        return status, time.perf_counter() - start, None
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Measure each request on its own; a redirect is a successful response here
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def load_samples(sample_size=SAMPLE_SIZE):
+    """Ids the scenarios pick from: users, artisans and chats"""
+    users = db.session.execute(
+        select(User.id, User.email).order_by(func.random()).limit(sample_size)).all()
+    artisan_ids = db.session.scalars(
+        select(Artisan.id).order_by(func.random()).limit(sample_size)).all()
+    chats = db.session.execute(
+        select(Chat.id, Chat.user_id, User.email).join(User, User.id == Chat.user_id)
+        .order_by(func.random()).limit(sample_size)).all()
+    if not users or not artisan_ids:
+        raise RuntimeError('No users or artisans to benchmark with; run "flask seed" first')
+    return {'users': users, 'artisan_ids': artisan_ids, 'chats': chats}
+
+
+def scenario_steps(name, samples, rng):
+    """(login, [(method, path, data), ...]) for one iteration of a scenario"""
+    user = rng.choice(samples['users'])
+    artisan_id = rng.choice(samples['artisan_ids'])
+    if name == 'index':
+        return None, [('GET', '/', None), ('GET', '/api/artisans', None)]
+    if name == 'profile':
+        return user, [('GET', f'/artisan/{artisan_id}', None)]
+    if name == 'dashboard':
+        return user, [('GET', '/user/dashboard', None)]
+    if name == 'chat':
+        if samples['chats']:
+            chat_id, user_id, email = rng.choice(samples['chats'])
+            return (user_id, email), [('GET', '/chat', None), ('GET', f'/chat/{chat_id}', None)]
+        return user, [('GET', '/chat', None)]
+    if name == 'rate':
+        return user, [('POST', f'/artisan/{artisan_id}/rate', {'rating': str(rng.randint(1, 5))})]
+    raise ValueError(f'Unknown scenario: {name}')
+
+
+def run_scenario(make_driver, name, samples, requests, concurrency, random_seed):
+    """Issue about `requests` requests for a scenario across worker threads"""
+    results, lock = [], threading.Lock()
+    per_worker = max(1, requests // concurrency)
+
+    def worker(index):
+        rng = random.Random(f'{random_seed}-{name}-{index}')
+        driver = make_driver()
+        local = []
+        while len(local) < per_worker:
+            user, steps = scenario_steps(name, samples, rng)
+            if user:
+                driver.login(*user)
+            for method, path, data in steps:
+                local.append(driver.request(method, path, data))
+        with lock:
+            results.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - start
+
+    latencies = [elapsed for _, elapsed, _ in results]
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for status, _, _ in results if status >= 400),
+        'throughput_rps': round(len(results) / wall_time, 2),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p90': round(percentile(latencies, 90) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3),
+        },
+        'queries_per_request': {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        } if queries else None,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+STARTUP_SCRIPT = '''
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+assert application.test_client().get('/').status_code == 200
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - created) * 1000, 'total_ms': (served - start) * 1000}))
+'''
+
+
+def measure_startup(runs=3):
+    """Best of runs fresh-interpreter cold starts, in ms per phase"""
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True,
+                                text=True, check=True).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+    return {phase: round(min(sample[phase] for sample in samples), 2) for phase in samples[0]}
+
+
+def run(app, scenarios=SCENARIOS, requests=200, concurrency=1, base_url=None,
+        random_seed=42, echo=print):
+    """Run the scenarios and return the results document"""
+    with app.app_context():
+        samples = load_samples()
+        row_counts = {model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+                      for model in (User, Artisan, Product, Chat)}
+        database = db.engine.url.render_as_string(hide_password=True)
+
+    startup = None
+    if not base_url:
+        startup = measure_startup()
+        echo(f"{'startup':<10} import {startup['import_ms']:.1f}ms  create_app {startup['create_app_ms']:.1f}ms  "
+             f"first request {startup['first_request_ms']:.1f}ms  total {startup['total_ms']:.1f}ms")
+
+    if base_url:
+        make_driver = lambda: HTTPDriver(base_url)
+    else:
+        make_driver = lambda: TestClientDriver(app)
+
+    results = {}
+    for name in scenarios:
+        results[name] = run_scenario(make_driver, name, samples, requests, concurrency, random_seed)
+        latency = results[name]['latency_ms']
+        queries = results[name]['queries_per_request']
+        echo(f"{name:<10} {results[name]['requests']:>6} req  "
+             f"p50 {latency['p50']:>8.2f}ms  p99 {latency['p99']:>8.2f}ms  "
+             f"{results[name]['throughput_rps']:>8.1f} req/s"
+             + (f"  {queries['mean']:.1f} queries/req" if queries else ''))
+
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': _git_revision(),
+        'target': base_url or 'test-client',
+        'database': database,
+        'row_counts': row_counts,
+        'concurrency': concurrency,
+        'startup_ms': startup,
+        'scenarios': results,
+    }
+
+
+def compare(baseline, current, max_regression=0.2):
+    """Scenarios whose p50 or p99 latency, or phases of startup, grew by more
+    than max_regression
+
+    Returns (scenario, metric, baseline_ms, current_ms) tuples.
+    """
+    regressions = []
+    if baseline.get('startup_ms') and current.get('startup_ms'):
+        for phase in ('create_app_ms', 'total_ms'):
+            old, new = baseline['startup_ms'][phase], current['startup_ms'][phase]
+            if new > old * (1 + max_regression):
+                regressions.append(('startup', phase[:-3], old, new))
+    for name, result in current['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        for metric in ('p50', 'p99'):
+            old, new = previous['latency_ms'][metric], result['latency_ms'][metric]
+            if old and new > old * (1 + max_regression):
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,108 @@
+"""Publish/subscribe fan-out for real-time chat delivery.
+
+MemoryBroker delivers within a single process. When the app runs several
+worker processes, set CHAT_BROKER_URL to a redis:// URL so every worker
+sees every publish (requires the redis package).
+
+Subscribers use the same interface for both backends:
+
+    with broker.subscribe('chat:1') as subscription:
+        message = subscription.get(timeout=15)  # None on timeout
+
+Views reach the app's broker through current_broker.
+"""
+import json
+import queue
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+
+class MemoryBroker:
+    """In-process broker with one bounded queue per subscriber"""
+
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                # A stalled client catches up from the messages API on reconnect
+                pass
+
+    @contextmanager
+    def subscribe(self, channel):
+        subscription = _QueueSubscription(self.max_pending)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+
+
+class _QueueSubscription(queue.Queue):
+    def get(self, timeout=None):
+        try:
+            return super().get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class RedisBroker:
+    """Cross-process broker on Redis pub/sub"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CHAT_BROKER_URL points at Redis but the redis package is not installed')
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self._redis.publish(channel, json.dumps(message))
+
+    @contextmanager
+    def subscribe(self, channel):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(channel)
+        try:
+            yield _RedisSubscription(pubsub)
+        finally:
+            pubsub.close()
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def get(self, timeout=None):
+        message = self._pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+
+def create_broker(url=None):
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBroker(url)
+    return MemoryBroker()
+
+
+def init_app(app):
+    app.extensions['broker'] = create_broker(app.config['CHAT_BROKER_URL'])
+
+
+current_broker = LocalProxy(lambda: current_app.extensions['broker'])
@@ -0,0 +1,228 @@
+"""Faceted browse of artisans and products.
+
+Results are filtered on the normalized columns from taxonomy.py and come with
+facet counts. Each facet is counted with every filter except its own, so
+after picking a craft the other crafts still show how many artisans they
+have. A facet with no other filter applied is read from facet_counts, which
+is maintained on write; the others are grouped COUNTs over the same indexed
+filters.
+
+Distance filters take a point and a radius in km. The circle's bounding box
+narrows rows through the (latitude, longitude) index, then an
+equirectangular distance, plain arithmetic in SQL and within a fraction of a
+percent of the great-circle distance at these radii, trims the box to the
+circle and orders the results.
+"""
+import math
+
+from sqlalchemy import exists, func, select
+
+from models import db, Artisan, FacetCount, Product, price_band_expression
+import taxonomy
+
+KM_PER_DEGREE = 111.195
+MAX_RADIUS_KM = 1000
+
+FACETS = {
+    'artisans': ('craft', 'city'),
+    'products': ('category', 'price'),
+}
+
+artisans = Artisan.__table__
+products = Product.__table__
+
+
+class Filters:
+    """Browse filters; every one is optional
+
+    point is (latitude, longitude) and needs radius_km. price is a band slug
+    from taxonomy.price_band; min_price/max_price are inclusive bounds.
+    """
+    FIELDS = ('craft', 'city', 'category', 'price', 'min_price', 'max_price', 'point', 'radius_km')
+    # The filters each facet ignores when it is counted
+    FACET_FIELDS = {
+        'craft': ('craft',),
+        'city': ('city',),
+        'category': ('category',),
+        'price': ('price', 'min_price', 'max_price'),
+    }
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise TypeError(f'Unknown filters: {", ".join(sorted(unknown))}')
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+        if self.point is not None and not self.radius_km:
+            raise ValueError('a distance filter needs a radius')
+        if self.radius_km is not None and not 0 < self.radius_km <= MAX_RADIUS_KM:
+            raise ValueError(f'radius must be between 0 and {MAX_RADIUS_KM} km')
+        if self.price is not None:
+            try:
+                taxonomy.price_band_range(self.price)
+            except ValueError:
+                raise ValueError(f'unknown price band {self.price!r}')
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS if getattr(self, field) is not None}
+
+    def without(self, facet):
+        values = self.as_dict()
+        for field in self.FACET_FIELDS[facet]:
+            values.pop(field, None)
+        if 'point' not in values:
+            values.pop('radius_km', None)
+        return Filters(**values)
+
+    @property
+    def empty(self):
+        return not self.as_dict()
+
+    def cache_key(self):
+        return ','.join(f'{field}={value}' for field, value in sorted(self.as_dict().items()))
+
+
+# Filter clauses
+def _distance_squared(point):
+    """Squared equirectangular distance in km² from point to an artisan's city"""
+    latitude, longitude = point
+    lon_scale = math.cos(math.radians(latitude))
+    d_lat = (artisans.c.latitude - latitude) * KM_PER_DEGREE
+    d_lon = (artisans.c.longitude - longitude) * (KM_PER_DEGREE * lon_scale)
+    return d_lat * d_lat + d_lon * d_lon
+
+def _geo_clauses(point, radius_km):
+    latitude, longitude = point
+    lat_delta = radius_km / KM_PER_DEGREE
+    lon_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return [
+        artisans.c.latitude.between(latitude - lat_delta, latitude + lat_delta),
+        artisans.c.longitude.between(longitude - lon_delta, longitude + lon_delta),
+        _distance_squared(point) <= radius_km * radius_km,
+    ]
+
+def _artisan_clauses(filters):
+    clauses = []
+    if filters.craft:
+        clauses.append(artisans.c.craft_slug == filters.craft)
+    if filters.city:
+        clauses.append(artisans.c.city_slug == filters.city)
+    if filters.point is not None:
+        clauses.extend(_geo_clauses(filters.point, filters.radius_km))
+    return clauses
+
+def _product_clauses(filters):
+    clauses = []
+    if filters.category:
+        clauses.append(products.c.category_slug == filters.category)
+    if filters.price:
+        lower, upper = taxonomy.price_band_range(filters.price)
+        clauses.append(products.c.price >= lower)
+        if upper is not None:
+            clauses.append(products.c.price < upper)
+    if filters.min_price is not None:
+        clauses.append(products.c.price >= filters.min_price)
+    if filters.max_price is not None:
+        clauses.append(products.c.price <= filters.max_price)
+    return clauses
+
+# Core queries skip the ORM's soft-delete scope, so each one filters out
+# deleted rows itself; a deleted artisan's products are marked deleted too
+def _artisans_where(query, filters):
+    query = query.where(artisans.c.deleted_at.is_(None), *_artisan_clauses(filters))
+    product_clauses = _product_clauses(filters)
+    if product_clauses:
+        # Artisans with at least one product in the filtered range
+        query = query.where(exists().where(products.c.artisan_id == artisans.c.id,
+                                           products.c.deleted_at.is_(None), *product_clauses))
+    return query
+
+def _products_where(query, filters):
+    artisan_clauses = _artisan_clauses(filters)
+    if artisan_clauses:
+        query = query.join(artisans, artisans.c.id == products.c.artisan_id).where(*artisan_clauses)
+    return query.where(products.c.deleted_at.is_(None), *_product_clauses(filters))
+
+
+# Results
+def browse_artisans(filters, limit=20, offset=0):
+    """One page of artisans, nearest first with a point, else best rated
+
+    Returns (rows, next offset or None).
+    """
+    columns = [artisans.c.id, artisans.c.name, artisans.c.craft_type, artisans.c.craft_slug,
+               artisans.c.location, artisans.c.city_slug, artisans.c.rating, artisans.c.image_url]
+    order = [artisans.c.rating.desc(), artisans.c.id.desc()]
+    if filters.point is not None:
+        distance = _distance_squared(filters.point).label('distance_squared')
+        columns.append(distance)
+        order.insert(0, distance)
+    query = _artisans_where(select(*columns), filters).order_by(*order)
+    return _page(query, limit, offset)
+
+def browse_products(filters, limit=20, offset=0):
+    """One page of products, nearest first with a point, else newest"""
+    columns = [products.c.id, products.c.name, products.c.price, products.c.category,
+               products.c.category_slug, products.c.image_url, products.c.artisan_id]
+    order = [products.c.id.desc()]
+    if filters.point is not None:
+        distance = _distance_squared(filters.point).label('distance_squared')
+        columns.append(distance)
+        order.insert(0, distance)
+    query = _products_where(select(*columns), filters).order_by(*order)
+    return _page(query, limit, offset)
+
+def _page(query, limit, offset):
+    # Fetch one extra row to know whether another page exists
+    rows = [dict(row._mapping) for row in db.session.execute(query.limit(limit + 1).offset(offset))]
+    for row in rows:
+        distance_squared = row.pop('distance_squared', None)
+        if distance_squared is not None:
+            row['distance_km'] = round(math.sqrt(distance_squared), 1)
+    next_offset = offset + limit if len(rows) > limit else None
+    return rows[:limit], next_offset
+
+def count(kind, filters):
+    """Number of artisans or products matching the filters"""
+    if kind == 'artisans':
+        query = _artisans_where(select(func.count()).select_from(artisans), filters)
+    else:
+        query = _products_where(select(func.count()).select_from(products), filters)
+    return db.session.scalar(query)
+
+
+# Facets
+def _facet_column(kind, facet):
+    if kind == 'artisans':
+        return {'craft': artisans.c.craft_slug, 'city': artisans.c.city_slug}[facet]
+    return {'category': products.c.category_slug, 'price': price_band_expression(products.c.price)}[facet]
+
+def stored_facet_counts(kind, facet):
+    """{value: count} of a facet over everything, from facet_counts"""
+    return dict(db.session.execute(
+        select(FacetCount.value, FacetCount.count)
+        .where(FacetCount.facet == f'{kind}.{facet}', FacetCount.count > 0)
+    ).all())
+
+def facet_counts(kind, filters):
+    """{facet: {value: count}} for the kind's facets under the filters"""
+    counts = {}
+    for facet in FACETS[kind]:
+        others = filters.without(facet)
+        if others.empty:
+            counts[facet] = stored_facet_counts(kind, facet)
+            continue
+        column = _facet_column(kind, facet)
+        query = select(column, func.count())
+        query = _artisans_where(query.select_from(artisans), others) if kind == 'artisans' \
+            else _products_where(query.select_from(products), others)
+        counts[facet] = {value: n for value, n in db.session.execute(query.group_by(column)) if value is not None}
+    return counts
+
+def describe_facets(counts):
+    """Facet counts as labelled lists, largest first"""
+    return {
+        facet: [{'value': value, 'label': taxonomy.label(facet, value), 'count': n}
+                for value, n in sorted(values.items(), key=lambda item: (-item[1], item[0]))]
+        for facet, values in counts.items()
+    }
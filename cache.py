@@ -0,0 +1,176 @@
+"""Pluggable cache for query results and rendered fragments.
+
+Two backends share one interface:
+
+    LRUCache     in-process, bounded LRU with per-entry TTL (default)
+    SQLiteCache  key-value table in a local SQLite file, shared by every
+                 worker process on the host, so invalidations reach them all
+
+Select with CACHE_URL: unset for LRUCache, or sqlite:///path/to/cache.db.
+Values must be picklable plain data (dicts, lists, strings), never ORM
+instances. Hit/miss counters are kept per process. Views reach the app's
+cache through current_cache.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+MISSING = object()
+
+
+class BaseCache:
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.counters = Counter()
+
+    def get_or_set(self, key, compute, ttl=None):
+        """Return the cached value for key, computing and storing it on a miss
+
+        A computed None is returned but not stored.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        value = compute()
+        if value is not None:
+            self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['misses']
+        return {
+            'backend': type(self).__name__,
+            'entries': len(self),
+            'max_entries': self.max_entries,
+            'hit_ratio': round(self.counters['hits'] / lookups, 4) if lookups else None,
+            **{name: self.counters[name] for name in ('hits', 'misses', 'sets', 'deletes', 'evictions')},
+        }
+
+
+class LRUCache(BaseCache):
+    def __init__(self, max_entries=1024, default_ttl=300):
+        super().__init__(max_entries, default_ttl)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.counters['misses'] += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            self.counters['sets'] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.counters['deletes'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, path, max_entries=1024, default_ttl=300):
+        super().__init__(max_entries, default_ttl)
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread and process, opened on first use so
+        # startup doesn't touch the file and forked workers don't share one
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] < now:
+            self.counters['misses'] += 1
+            return MISSING
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self.counters['hits'] += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + (ttl or self.default_ttl), now),
+        )
+        self.counters['sets'] += 1
+        # Trim expired entries, then the least recently used ones over the limit
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        evicted = conn.execute("""
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)
+        """, (self.max_entries,)).rowcount
+        self.counters['evictions'] += max(evicted, 0)
+
+    def delete(self, *keys):
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            deleted = self._connect().execute(f"DELETE FROM cache WHERE key IN ({placeholders})", keys).rowcount
+            self.counters['deletes'] += max(deleted, 0)
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+
+def create_cache(url=None, max_entries=1024, default_ttl=300):
+    if url and url.startswith('sqlite:///'):
+        return SQLiteCache(url[len('sqlite:///'):], max_entries, default_ttl)
+    return LRUCache(max_entries, default_ttl)
+
+
+def init_app(app):
+    app.extensions['cache'] = create_cache(
+        app.config['CACHE_URL'], app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_DEFAULT_TTL'])
+
+
+current_cache = LocalProxy(lambda: current_app.extensions['cache'])
@@ -0,0 +1,220 @@
+"""Streaming product catalog import and export (CSV or JSON Lines).
+
+Imports read the file row by row and insert valid rows in batches of
+batch_size, one transaction per batch, so memory use doesn't grow with the
+file. Invalid rows are skipped and reported by line number. Columns:
+
+    name         required
+    price        required, a finite non-negative number
+    description, category
+    image        file name inside the accompanying zip of images
+    image_url    an existing content-addressed upload URL, e.g. from an export
+
+Exports stream every product with a server-side cursor and are written a
+chunk at a time.
+"""
+import csv
+import io
+import json
+import math
+import posixpath
+import zipfile
+
+from sqlalchemy import insert, select
+
+import images
+from models import db, Product, apply_facet_deltas, product_facets
+import taxonomy
+
+FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('id', 'artisan_id', 'name', 'description', 'price', 'category', 'image_url', 'created_at')
+MAX_REPORTED_ERRORS = 1000
+EXPORT_CHUNK_ROWS = 500
+
+
+class ImportResult:
+    def __init__(self):
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []  # (line number, message), the first MAX_REPORTED_ERRORS
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': [{'line': line, 'error': message} for line, message in self.errors],
+        }
+
+
+def detect_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return 'csv' if extension == 'csv' else default
+
+
+def iter_rows(stream, fmt):
+    """Yield (line number, row dict) from a binary stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None
+                continue
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def _text(row, field, max_length=None):
+    value = row.get(field)
+    value = str(value).strip() if value is not None else ''
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters')
+    return value or None
+
+
+def validate_row(row):
+    """Clean product values from an import row; raises ValueError"""
+    if row is None:
+        raise ValueError('not a valid JSON object')
+    name = _text(row, 'name', Product.name.type.length)
+    if not name:
+        raise ValueError('name is required')
+    try:
+        price = float(row.get('price'))
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if not math.isfinite(price):
+        raise ValueError('price must be a finite number')
+    if price < 0:
+        raise ValueError('price must not be negative')
+    return {
+        'name': name,
+        'description': _text(row, 'description') or '',
+        'price': round(price, 2),
+        'category': _text(row, 'category', Product.category.type.length),
+        'image': _text(row, 'image'),
+        'image_url': _text(row, 'image_url', Product.image_url.type.length),
+    }
+
+
+def import_products(artisan_id, stream, fmt, images_zip=None, store_image=None,
+                    image_extensions=(), upload_url_prefix='/static/uploads', batch_size=500,
+                    max_image_size=None):
+    """Insert the products in a CSV/JSONL stream for an artisan
+
+    images_zip is an optional seekable file with the images named in the
+    'image' column; store_image(data, extension) saves one and returns its
+    URL, raising ValueError for unreadable images. Images that unpack to more
+    than max_image_size bytes are rejected before they are read. Returns an
+    ImportResult.
+    """
+    result = ImportResult()
+    archive = zipfile.ZipFile(images_zip) if images_zip else None
+    table = Product.__table__
+    batch = []
+
+    def flush():
+        db.session.execute(insert(table), batch)
+        # Bulk inserts skip the ORM events that count facets
+        deltas = {}
+        for values in batch:
+            for facet in product_facets(values['category_slug'], values['price']).items():
+                deltas[facet] = deltas.get(facet, 0) + 1
+        apply_facet_deltas(db.session.connection(), deltas)
+        db.session.commit()
+        result.inserted += len(batch)
+        batch.clear()
+
+    try:
+        for line, row in iter_rows(stream, fmt):
+            try:
+                values = validate_row(row)
+                values['image_url'] = _resolve_image(
+                    values.pop('image'), values['image_url'], archive, store_image,
+                    image_extensions, upload_url_prefix, max_image_size)
+            except ValueError as e:
+                result.add_error(line, str(e))
+                continue
+            values['artisan_id'] = artisan_id
+            values['category_slug'] = taxonomy.category_slug(values['category'])
+            batch.append(values)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        if archive:
+            archive.close()
+    return result
+
+
+def _resolve_image(name, image_url, archive, store_image, image_extensions, upload_url_prefix,
+                   max_image_size=None):
+    if name:
+        if archive is None or store_image is None:
+            raise ValueError(f'image {name!r} given but no images zip was uploaded')
+        extension = name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+        if extension not in image_extensions:
+            raise ValueError(f'image {name!r} is not an allowed image type')
+        try:
+            info = archive.getinfo(name)
+        except KeyError:
+            raise ValueError(f'image {name!r} is not in the zip')
+        # The size recorded in the zip; reading stops there even if the
+        # entry holds more, so a small zip can't unpack into a huge image
+        if max_image_size is not None and info.file_size > max_image_size:
+            raise ValueError(f'image {name!r} is larger than {max_image_size} bytes')
+        data = archive.read(info)
+        return store_image(data, extension)
+    # Only URLs of the form images.save_original() produces, already in
+    # normal form, so '..' segments can't point outside the uploads
+    if image_url and not (posixpath.normpath(image_url) == image_url
+                          and image_url.startswith(upload_url_prefix + '/')
+                          and images.CONTENT_URL_RE.match(image_url)):
+        raise ValueError('image_url must point to an uploaded image')
+    return image_url
+
+
+def _export_query(artisan_id=None):
+    query = (select(*[Product.__table__.c[field] for field in EXPORT_FIELDS])
+             .where(Product.deleted_at.is_(None)).order_by(Product.id))
+    if artisan_id is not None:
+        query = query.where(Product.artisan_id == artisan_id)
+    return query.execution_options(yield_per=EXPORT_CHUNK_ROWS)
+
+
+def export_products(fmt, artisan_id=None):
+    """Yield the catalog as CSV or JSONL text chunks"""
+    rows = db.session.execute(_export_query(artisan_id))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    for partition in rows.partitions():
+        for row in partition:
+            values = dict(zip(EXPORT_FIELDS, row))
+            if values['created_at'] is not None:
+                values['created_at'] = values['created_at'].isoformat()
+            if writer:
+                writer.writerow(values.values())
+            else:
+                buffer.write(json.dumps(values, ensure_ascii=False) + '\n')
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,274 @@
+"""Chat between users and artisans: conversation list and pages, message
+history, the server-sent events stream and unread counts.
+
+Registered as the 'chat' blueprint by app.create_app(). New messages are
+fanned out through the app's broker (see broker.py).
+"""
+from datetime import datetime
+import json
+import threading
+import time
+
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
+                   session, url_for)
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload
+
+from auth import current_principal, login_required
+from broker import current_broker
+from models import db, Artisan, Chat, Message, mark_chat_read
+
+bp = Blueprint('chat', __name__)
+
+class OpenStreams:
+    """Chat event streams open in this process"""
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def open(self, limit=None):
+        """Count a new stream; False if limit streams are already open"""
+        with self._lock:
+            if limit is not None and self.count >= limit:
+                return False
+            self.count += 1
+            return True
+
+    def close(self):
+        with self._lock:
+            self.count -= 1
+
+@bp.record_once
+def create_stream_counter(state):
+    state.app.extensions['chat_streams'] = OpenStreams()
+
+@bp.route('/chat')
+@login_required()
+def chat_list():
+    if session.get('user_type') == 'user':
+        # The inner join leaves out chats with deleted artisans
+        chats = (Chat.query.join(Chat.artisan).options(contains_eager(Chat.artisan))
+                 .filter(Chat.user_id == session['user_id']))
+    else:
+        chats = Chat.query.options(joinedload(Chat.user)).filter_by(artisan_id=session['user_id'])
+    chats = chats.order_by(Chat.last_message_at.desc()).all()
+    
+    return render_template('chat_list.html', chats=chats)
+
+def is_chat_participant(chat):
+    if session.get('user_type') == 'user':
+        return chat.user_id == session['user_id']
+    return chat.artisan_id == session['user_id']
+
+def mark_read(chat):
+    """Mark a chat read for the current participant"""
+    # Checked on the loaded row first so reading a read chat doesn't write
+    user_type = session['user_type']
+    if getattr(chat, f'{user_type}_unread_count') and mark_chat_read(chat.id, user_type):
+        db.session.commit()
+
+def message_to_dict(message):
+    return {
+        'id': message.id,
+        'sender_type': message.sender_type,
+        'content': message.content,
+        'timestamp': message.timestamp.isoformat(),
+        'time_display': message.timestamp.strftime('%b %d, %I:%M %p'),
+    }
+
+def messages_since(chat_id, last_id, limit=None):
+    query = Message.query.filter(Message.chat_id == chat_id, Message.id > last_id).order_by(Message.id)
+    return query.limit(limit or current_app.config['CHAT_MESSAGES_LIMIT']).all()
+
+def message_cursor(message):
+    return f"{message.timestamp.isoformat()}_{message.id}"
+
+def older_messages(chat_id, before=None, limit=None):
+    """Newest page of messages older than the cursor, oldest first
+
+    Returns the messages and the cursor for the page before them, or None
+    when this page reaches the start of the conversation.
+    """
+    limit = limit or current_app.config['CHAT_PAGE_SIZE']
+    query = Message.query.filter(Message.chat_id == chat_id)
+    if before:
+        try:
+            timestamp, message_id = before.rsplit('_', 1)
+            timestamp, message_id = datetime.fromisoformat(timestamp), int(message_id)
+        except ValueError:
+            abort(400)
+        query = query.filter(or_(
+            Message.timestamp < timestamp,
+            and_(Message.timestamp == timestamp, Message.id < message_id),
+        ))
+    # Fetch one extra row to know whether older messages exist
+    rows = query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+    messages = rows[:limit][::-1]
+    cursor = message_cursor(messages[0]) if len(rows) > limit else None
+    return messages, cursor
+
+def chat_channel(chat_id):
+    return f'chat:{chat_id}'
+
+@bp.route('/chat/<int:chat_id>')
+@login_required()
+def chat_view(chat_id):
+    chat = Chat.query.options(joinedload(Chat.user), joinedload(Chat.artisan)).get_or_404(chat_id)
+    if chat.artisan is None:  # deleted, waiting to be purged
+        abort(404)
+    
+    # Verify user has access to this chat
+    if not is_chat_participant(chat):
+        flash('Unauthorized!', 'error')
+        return redirect(url_for('chat.chat_list'))
+    
+    # Marked read before loading, so everything marked is on the page
+    mark_read(chat)
+    messages, older_cursor = older_messages(chat_id)
+    return render_template('chat_view.html', chat=chat, messages=messages, older_cursor=older_cursor)
+
+@bp.route('/chat/<int:chat_id>/read', methods=['POST'])
+@login_required(api=True)
+def read_chat(chat_id):
+    """Mark a chat read up to its newest message, e.g. after a live delivery"""
+    chat = Chat.query.get_or_404(chat_id)
+    if not is_chat_participant(chat):
+        return jsonify(error='Unauthorized!'), 403
+    mark_read(chat)
+    return '', 204
+
+@bp.route('/notifications/summary')
+@login_required(api=True)
+def notifications_summary():
+    """Unread message counts for the navbar, from the chat counters alone"""
+    user_type = session['user_type']
+    participant = getattr(Chat, f'{user_type}_id')
+    unread = getattr(Chat, f'{user_type}_unread_count')
+    rows = db.session.execute(
+        select(Chat.id, unread).where(participant == session['user_id'], unread > 0)
+    ).all()
+    response = jsonify(unread=sum(count for _, count in rows), chats={str(chat_id): count for chat_id, count in rows})
+    # Polled often: let clients revalidate with If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@bp.route('/api/chat/<int:chat_id>/messages')
+@login_required(api=True)
+def api_chat_messages(chat_id):
+    chat = Chat.query.get_or_404(chat_id)
+    if not is_chat_participant(chat):
+        return jsonify(error='Unauthorized!'), 403
+    
+    # ?before=<cursor> pages back through history, ?since=<id> polls for new messages
+    if 'before' in request.args:
+        messages, older_cursor = older_messages(chat_id, request.args['before'])
+        return jsonify(messages=[message_to_dict(m) for m in messages], older_cursor=older_cursor)
+    
+    since = request.args.get('since', 0, type=int)
+    return jsonify(messages=[message_to_dict(m) for m in messages_since(chat_id, since)])
+
+@bp.route('/chat/<int:chat_id>/stream')
+def chat_stream(chat_id):
+    """Server-sent events stream of new messages in a chat"""
+    if current_principal() is None:
+        return 'Unauthorized', 401
+    chat = Chat.query.get_or_404(chat_id)
+    if not is_chat_participant(chat):
+        return 'Unauthorized', 403
+    
+    last_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+    heartbeat = current_app.config['CHAT_STREAM_HEARTBEAT']
+    # Streams end after CHAT_STREAM_MAX_AGE; the browser reconnects with
+    # Last-Event-ID, and the login and membership checks above run again
+    closes_at = time.monotonic() + current_app.config['CHAT_STREAM_MAX_AGE']
+    # The stream outlives the request context, so hold on to what it needs
+    app, broker = current_app._get_current_object(), current_broker._get_current_object()
+    streams = app.extensions['chat_streams']
+    
+    def events():
+        nonlocal last_id
+        with broker.subscribe(chat_channel(chat_id)) as subscription:
+            # Subscribed first, so anything committed before this point is
+            # picked up here and nothing falls between the two
+            with app.app_context():
+                backlog = [message_to_dict(m) for m in messages_since(chat_id, last_id)]
+            for message in backlog:
+                last_id = message['id']
+                yield f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+            
+            while (remaining := closes_at - time.monotonic()) > 0:
+                message = subscription.get(timeout=min(heartbeat, remaining))
+                if message is None:
+                    yield ': keepalive\n\n'
+                elif message['id'] > last_id:
+                    last_id = message['id']
+                    yield f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+    
+    # Each stream holds a server thread while open; past the limit the page
+    # polls the messages API instead
+    if not streams.open(current_app.config['CHAT_STREAM_LIMIT']):
+        return 'Too many open streams', 503, {'Retry-After': str(current_app.config['CHAT_POLL_INTERVAL'])}
+    response = Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    # Called by the server when the client goes away or the stream ends,
+    # whether or not the generator ever started
+    response.call_on_close(streams.close)
+    return response
+
+@bp.route('/chat/start/<int:artisan_id>')
+@login_required('user', 'Please login as user first!')
+def start_chat(artisan_id):
+    Artisan.query.get_or_404(artisan_id)  # deleted artisans are hidden too
+    # Check if chat already exists
+    existing_chat = Chat.query.filter_by(user_id=session['user_id'], artisan_id=artisan_id).first()
+    if existing_chat:
+        return redirect(url_for('chat.chat_view', chat_id=existing_chat.id))
+    
+    # Create new chat; a concurrent request may have created it first
+    new_chat = Chat(user_id=session['user_id'], artisan_id=artisan_id)
+    db.session.add(new_chat)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        new_chat = Chat.query.filter_by(user_id=session['user_id'], artisan_id=artisan_id).one()
+    
+    return redirect(url_for('chat.chat_view', chat_id=new_chat.id))
+
+@bp.route('/chat/<int:chat_id>/send', methods=['POST'])
+@login_required()
+def send_message(chat_id):
+    chat = Chat.query.get_or_404(chat_id)
+    if not is_chat_participant(chat):
+        flash('Unauthorized!', 'error')
+        return redirect(url_for('chat.chat_list'))
+    
+    content = request.form.get('message')
+    wants_json = request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+    
+    if not content:
+        if wants_json:
+            return jsonify(error='Message cannot be empty!'), 400
+        flash('Message cannot be empty!', 'error')
+        return redirect(url_for('chat.chat_view', chat_id=chat_id))
+    
+    new_message = Message(
+        chat_id=chat_id,
+        sender_id=session['user_id'],
+        sender_type=session.get('user_type'),
+        content=content
+    )
+    db.session.add(new_message)
+    db.session.commit()
+    
+    # Push to everyone watching the conversation
+    message = message_to_dict(new_message)
+    current_broker.publish(chat_channel(chat_id), message)
+    
+    if wants_json:
+        return jsonify(message=message), 201
+    return redirect(url_for('chat.chat_view', chat_id=chat_id))
@@ -0,0 +1,281 @@
+"""The app's `flask` CLI commands, registered by app.create_app().
+
+Run `flask --help` for the list.
+"""
+import multiprocessing
+import os
+import signal
+import threading
+import uuid
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from cache import current_cache as cache
+from models import db, Artisan, Product, rebuild_facet_counts, reconcile_artisan_ratings
+from views import (BROWSE_GENERATION_KEY, GENERATION_TTL, UPLOAD_URL_PREFIX, feeds_refreshed,
+                   import_catalog)
+import admin
+import benchmark
+import catalog
+import deletes
+import feeds
+import images
+import jobs
+import migrations
+import search
+import seed
+
+# Commands are collected here and added to each app's CLI by init_app
+cli = AppGroup('kalamitra')
+
+def cache_is_shared():
+    """Whether this process shares the servers' cache (CACHE_URL is set)
+
+    The default cache lives inside each server process, so clearing or
+    rotating it from the command line has no effect on running servers.
+    """
+    return bool(current_app.config['CACHE_URL'])
+
+def require_shared_cache():
+    if not cache_is_shared():
+        raise click.ClickException('CACHE_URL is not set, so each server process has its own in-memory '
+                                   'cache, which this command can\'t reach.')
+
+def warn_if_cache_private():
+    if not cache_is_shared():
+        click.echo('Warning: CACHE_URL is not set, so running servers keep serving their own cached '
+                   'data until it expires or they restart.', err=True)
+
+@cli.command('db-upgrade')
+def db_upgrade_command():
+    """Create missing tables and apply pending schema migrations"""
+    version = migrations.upgrade(echo=click.echo)
+    click.echo(f'Database is at schema version {version}.')
+
+@cli.command('reconcile-ratings')
+@click.option('--check', is_flag=True, help='Only report mismatches, do not repair them.')
+def reconcile_ratings_command(check):
+    """Recompute artisan rating counters from the ratings table"""
+    mismatches = reconcile_artisan_ratings(fix=not check)
+    if mismatches and not check:
+        cache.clear()
+        warn_if_cache_private()
+    for artisan_id, stored, actual in mismatches:
+        click.echo(f'Artisan {artisan_id}: stored sum/count {stored}, actual {actual}')
+    action = 'found' if check else 'repaired'
+    click.echo(f'{len(mismatches)} artisan(s) {action} out of sync.')
+
+@cli.command('stats-refresh')
+def stats_refresh_command():
+    """Recompute the admin dashboard's statistics rollups"""
+    rows = admin.refresh_stats()
+    click.echo(f'{rows} rollup rows written.')
+
+@cli.command('facets-rebuild')
+def facets_rebuild_command():
+    """Recount the browse facets from the artisans and products tables"""
+    values = rebuild_facet_counts(db.session.connection())
+    db.session.commit()
+    cache.set(BROWSE_GENERATION_KEY, uuid.uuid4().hex, ttl=GENERATION_TTL)
+    warn_if_cache_private()
+    click.echo(f'{values} facet values counted.')
+
+@cli.command('purge-deleted')
+@click.option('--retention', type=int, help='Seconds deleted rows are kept; defaults to SOFT_DELETE_RETENTION, '
+                                            'or 0 without SOFT_DELETE.')
+def purge_deleted_command(retention):
+    """Hard-delete artisans and products marked deleted, in batches"""
+    if retention is None:
+        retention = current_app.config['SOFT_DELETE_RETENTION'] if current_app.config['SOFT_DELETE'] else 0
+    purged = deletes.purge(retention, current_app.config['PURGE_BATCH_SIZE'])
+    click.echo(', '.join(f'{count} {table}' for table, count in purged.items()) + ' purged.')
+
+@cli.command('images-backfill')
+def images_backfill_command():
+    """Move existing uploads into content-addressed storage and build their variants"""
+    converted = 0
+    for model in (Artisan, Product):
+        for record in model.query.filter(model.image_url.isnot(None)):
+            if not record.image_url.startswith(UPLOAD_URL_PREFIX + '/'):
+                continue
+            source = os.path.join(current_app.config['UPLOAD_FOLDER'], record.image_url[len(UPLOAD_URL_PREFIX) + 1:])
+            if not os.path.exists(source):
+                click.echo(f'Missing file for {record!r}: {source}')
+                continue
+            extension = source.rsplit('.', 1)[-1]
+            try:
+                with open(source, 'rb') as f:
+                    path, url = images.save_original(f.read(), extension, current_app.config['UPLOAD_FOLDER'], UPLOAD_URL_PREFIX)
+                images.process_image(path)
+            except (ValueError, OSError) as e:
+                click.echo(f'Skipping {record!r}: {e}')
+                continue
+            if record.image_url != url:
+                record.image_url = url
+                converted += 1
+        db.session.commit()
+    cache.clear()
+    warn_if_cache_private()
+    click.echo(f'{converted} image(s) moved to content-addressed storage.')
+
+@cli.command('cache-clear')
+def cache_clear_command():
+    """Drop every cached query result and fragment"""
+    require_shared_cache()
+    cache.clear()
+    click.echo('Cache cleared.')
+
+@cli.command('cache-stats')
+def cache_stats_command():
+    """Show cache size and this process's hit/miss counters"""
+    require_shared_cache()
+    for name, value in cache.stats().items():
+        click.echo(f'{name}: {value}')
+
+@cli.command('search-rebuild')
+def search_rebuild_command():
+    """Rebuild the full-text search index from existing products and artisans"""
+    with db.engine.begin() as conn:
+        search.create_index(conn)
+        search.rebuild_index(conn)
+    click.echo('Search index rebuilt.')
+
+@cli.command('seed')
+@click.option('--scale', default=0.01, show_default=True,
+              help='Fraction of the full data set (100k users, 20k artisans, 500k products, ...).')
+@click.option('--users', type=int, help='Override the number of users.')
+@click.option('--artisans', type=int, help='Override the number of artisans.')
+@click.option('--products', type=int, help='Override the number of products.')
+@click.option('--ratings', type=int, help='Override the number of ratings.')
+@click.option('--wishlists', type=int, help='Override the number of wishlist entries.')
+@click.option('--chats', type=int, help='Override the number of chats.')
+@click.option('--messages', type=int, help='Override the number of chat messages.')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--random-seed', default=42, show_default=True)
+def seed_command(scale, batch_size, random_seed, **overrides):
+    """Bulk-generate synthetic data for load testing"""
+    seed.seed(scale, batch_size, random_seed, echo=click.echo, **overrides)
+    cache.clear()
+    warn_if_cache_private()
+    click.echo(f'Seeded accounts use the password "{seed.SEED_PASSWORD}".')
+
+@cli.command('benchmark')
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(benchmark.SCENARIOS),
+              help='Scenario to run (repeatable); all by default.')
+@click.option('--requests', default=200, show_default=True, help='Requests per scenario.')
+@click.option('--concurrency', default=1, show_default=True, help='Concurrent clients.')
+@click.option('--url', help='Benchmark a running server instead of the test client.')
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results to this JSON file.')
+@click.option('--compare', 'baseline', type=click.Path(exists=True, dir_okay=False),
+              help='Earlier results to check for latency regressions.')
+@click.option('--max-regression', default=0.2, show_default=True,
+              help='Allowed p50/p99 growth over the baseline, as a fraction.')
+def benchmark_command(scenarios, requests, concurrency, url, output, baseline, max_regression):
+    """Measure latency, throughput and queries per request of the main flows"""
+    results = benchmark.run(current_app._get_current_object(), scenarios or benchmark.SCENARIOS, requests, concurrency,
+                            base_url=url, echo=click.echo)
+    if output:
+        benchmark.save(results, output)
+        click.echo(f'Results written to {output}.')
+    if baseline:
+        regressions = benchmark.compare(benchmark.load(baseline), results, max_regression)
+        for name, metric, old, new in regressions:
+            click.echo(f'{name} {metric} regressed: {old:.2f}ms -> {new:.2f}ms')
+        if regressions:
+            raise SystemExit(1)
+        click.echo('No latency regressions.')
+
+@cli.command('catalog-import')
+@click.argument('artisan_id', type=int)
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--images', type=click.Path(exists=True, dir_okay=False), help='Zip of the images named in the image column.')
+@click.option('--format', 'fmt', type=click.Choice(catalog.FORMATS), help='Defaults to the file extension.')
+def catalog_import_command(artisan_id, path, images, fmt):
+    """Import products for an artisan from a CSV or JSONL file"""
+    if db.session.get(Artisan, artisan_id) is None:
+        raise click.ClickException(f'No artisan with id {artisan_id}.')
+    with open(path, 'rb') as stream:
+        images_zip = open(images, 'rb') if images else None
+        try:
+            result = import_catalog(artisan_id, stream, fmt or catalog.detect_format(path), images_zip)
+        finally:
+            if images_zip:
+                images_zip.close()
+    for line, message in result.errors:
+        click.echo(f'Line {line}: {message}')
+    click.echo(f'{result.inserted} products imported, {result.failed} rows skipped.')
+
+@cli.command('catalog-export')
+@click.option('--artisan', 'artisan_id', type=int, help='Only this artisan\'s products.')
+@click.option('--format', 'fmt', type=click.Choice(catalog.FORMATS), default='csv', show_default=True)
+@click.option('--output', type=click.File('w', encoding='utf-8'), default='-', help='Defaults to stdout.')
+def catalog_export_command(artisan_id, fmt, output):
+    """Write the product catalog as CSV or JSONL"""
+    for chunk in catalog.export_products(fmt, artisan_id):
+        output.write(chunk)
+
+@cli.command('feeds-refresh')
+def feeds_refresh_command():
+    """Recompute the trending and recommended product feeds"""
+    trends, recommendations = feeds.refresh()
+    feeds_refreshed()
+    warn_if_cache_private()
+    click.echo(f'{trends} trending products, {recommendations} recommendations stored.')
+
+@cli.command('jobs-worker')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to run.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def jobs_worker_command(processes, burst):
+    """Run background jobs from the queue"""
+    app = current_app._get_current_object()
+    
+    def work():
+        # A forked worker opens its own database connections
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        jobs.work(app, jobs.get_queue(), current_app.config['JOBS_POLL_INTERVAL'], stop, burst)
+    
+    # fork, so the workers inherit the loaded app
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=work, name=f'jobs-worker-{i}') for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    click.echo(f'Started {processes} job worker(s).')
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+@cli.command('jobs-status')
+@click.option('--failed', 'show_failed', is_flag=True, help='List the most recent failed jobs.')
+def jobs_status_command(show_failed):
+    """Show the background job backlog"""
+    queue = jobs.get_queue()
+    stats = queue.stats()
+    for status, count in stats['counts'].items():
+        click.echo(f'{status}: {count}')
+    if stats['oldest_due_seconds'] is not None:
+        click.echo(f"oldest due job waiting: {stats['oldest_due_seconds']}s")
+    for name, counts in sorted(stats['by_name'].items()):
+        click.echo(f"  {name}: " + ', '.join(f'{status} {count}' for status, count in sorted(counts.items())))
+    if show_failed:
+        for job in queue.failed_jobs():
+            last_line = (job['last_error'] or '').strip().splitlines()[-1:] or ['']
+            click.echo(f"#{job['id']} {job['name']} {job['payload']} after {job['attempts']} attempts: {last_line[0]}")
+
+@cli.command('jobs-retry')
+@click.option('--id', 'job_id', type=int, help='Only this job.')
+def jobs_retry_command(job_id):
+    """Queue failed jobs again"""
+    click.echo(f'{jobs.get_queue().retry_failed(job_id)} job(s) queued again.')
+
+
+def init_app(app):
+    for command in cli.commands.values():
+        app.cli.add_command(command)
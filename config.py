@@ -0,0 +1,105 @@
+"""App settings, read from the environment where they vary by deployment.
+
+create_app() applies these first and then any overrides passed to it, so
+tests and scripts can adjust a setting without touching the environment.
+Every setting's default is here; the modules' init_app() functions only
+read them.
+"""
+import os
+
+import database
+import passwords
+
+# Only accepted in debug and testing, see check_secrets()
+DEFAULT_SECRET_KEY = 'your-secret-key-change-this-in-production'
+DEFAULT_ADMIN_KEY = 'KEY_123'
+
+
+def configure(app):
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
+    app.config['SESSION_STORE_URL'] = os.environ.get('SESSION_STORE_URL')  # e.g. sqlite:////tmp/kalamitra-sessions.db
+    app.config['SESSION_ANONYMOUS_LIFETIME'] = 15 * 60  # seconds a session without a login is kept
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    database.configure(app)  # DATABASE_URL, DATABASE_REPLICA_URL, DB_POOL_* from the environment
+    app.config['UPLOAD_FOLDER'] = 'static/uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    app.config['STATIC_SENDFILE'] = os.environ.get('STATIC_SENDFILE')  # 'x-sendfile' or 'x-accel'
+    app.config['STATIC_ACCEL_PREFIX'] = '/_static_files'  # internal location nginx serves for x-accel
+    app.config['CACHE_URL'] = os.environ.get('CACHE_URL')  # e.g. sqlite:////tmp/kalamitra-cache.db
+    app.config['CACHE_MAX_ENTRIES'] = 1024
+    app.config['CACHE_DEFAULT_TTL'] = 300  # seconds
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # bearer token required by /metrics
+    app.config['SLOW_QUERY_THRESHOLD'] = 0.1  # seconds; None disables the log
+    app.config['SLOW_REQUEST_THRESHOLD'] = 1.0
+    app.config['SQL_QUERY_BUDGETS'] = {  # per-endpoint overrides of SQL_QUERY_BUDGET
+        'main.import_products': None,  # one INSERT per CATALOG_IMPORT_BATCH_SIZE rows
+        'admin.export_table': None,  # relationship counts per exported chunk
+        'main.delete_artisan_account': 25,  # facet recounts, product/artisan UPDATEs, purge job
+    }
+    app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', passwords.DEFAULT_METHOD)
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))  # 0 hashes inline
+    app.config['PASSWORD_HASH_MAX_PENDING'] = 16  # queued hashes before logins get a 503
+    app.config['PASSWORD_HASH_WAIT'] = 5  # seconds a request waits for a hashing slot
+    app.config['LOGIN_RATE_LIMIT_IP'] = (20, 300)  # attempts per seconds; None disables
+    app.config['LOGIN_RATE_LIMIT_EMAIL'] = (5, 300)
+    app.config['PROXY_FIX_HOPS'] = int(os.environ.get('PROXY_FIX_HOPS', 0))  # reverse proxies in front of the app; their X-Forwarded-For is trusted
+    app.config['CATALOG_IMPORT_MAX_SIZE'] = 512 * 1024 * 1024  # catalog and images zip uploads
+    app.config['CATALOG_IMPORT_BATCH_SIZE'] = 500  # rows per transaction
+    app.config['FEED_SIZE'] = 8  # products in trending/recommended strips
+    app.config['FEEDS_REFRESH_INTERVAL'] = int(os.environ.get('FEEDS_REFRESH_INTERVAL', 0)) or None  # seconds; else run flask feeds-refresh from cron
+    app.config['JOBS_URL'] = os.environ.get('JOBS_URL', 'sqlite:///' + os.path.join(app.instance_path, 'jobs.db'))
+    app.config['JOBS_IN_PROCESS_WORKER'] = os.environ.get('JOBS_IN_PROCESS_WORKER', '1') == '1'  # 0 when running flask jobs-worker
+    app.config['JOBS_POLL_INTERVAL'] = 1.0  # seconds between polls of an empty queue
+    app.config['JOBS_RETENTION'] = 7 * 24 * 3600  # seconds finished jobs are kept
+    app.config['STATS_REFRESH_INTERVAL'] = int(os.environ.get('STATS_REFRESH_INTERVAL', 3600)) or None  # seconds between admin stats rollups
+    app.config['ADMIN_KEY'] = os.environ.get('ADMIN_KEY', DEFAULT_ADMIN_KEY)
+    app.config['ADMIN_PAGE_SIZE'] = 50
+    app.config['SOFT_DELETE'] = os.environ.get('SOFT_DELETE', '0') == '1'  # keep deleted artisans/products restorable until purged
+    app.config['SOFT_DELETE_RETENTION'] = 30 * 24 * 3600  # seconds
+    app.config['PURGE_BATCH_SIZE'] = 1000  # rows deleted per purge transaction
+    app.config['ARTISANS_PER_PAGE'] = 24
+    app.config['SEARCH_RESULTS_LIMIT'] = 20
+    app.config['BROWSE_PAGE_SIZE'] = 20
+    app.config['BROWSE_DEFAULT_RADIUS_KM'] = 100
+    app.config['CHAT_MESSAGES_LIMIT'] = 100
+    app.config['CHAT_PAGE_SIZE'] = 50
+    app.config['CHAT_STREAM_HEARTBEAT'] = 15  # seconds between SSE keepalives
+    app.config['CHAT_STREAM_MAX_AGE'] = 300  # seconds before a stream closes and the browser reconnects
+    app.config['CHAT_STREAM_LIMIT'] = int(os.environ.get('CHAT_STREAM_LIMIT', 4))  # open streams per process; more poll instead
+    app.config['CHAT_POLL_INTERVAL'] = 5  # seconds between polls when a chat page has no stream
+    app.config['NOTIFICATIONS_POLL_INTERVAL'] = 30  # seconds between navbar unread polls
+    app.config['CHAT_BROKER_URL'] = os.environ.get('CHAT_BROKER_URL')  # e.g. redis://localhost:6379/0
+
+
+def check_secrets(app):
+    """Raise RuntimeError if SECRET_KEY or ADMIN_KEY is unset or left at its
+    default, unless the app runs in debug or testing mode"""
+    if app.debug or app.testing:
+        return
+    defaults = {'SECRET_KEY': DEFAULT_SECRET_KEY, 'ADMIN_KEY': DEFAULT_ADMIN_KEY}
+    missing = [name for name, default in defaults.items() if app.config[name] in (None, '', default)]
+    if missing:
+        raise RuntimeError(f"Set {' and '.join(missing)}; the built-in defaults are only for debug and testing")
+
+
+def check_multiprocess(app):
+    """Raise RuntimeError unless the app can run in more than one process
+
+    Sessions, the cache and the chat broker default to process memory, where
+    other workers can't see them. Login rate limits stay per process, so each
+    worker allows the full limit.
+    """
+    import broker
+    import cache
+    import sessions
+    private = {
+        'SESSION_STORE_URL': ('sessions and flash messages',
+                              isinstance(app.session_interface.store, sessions.MemorySessionStore)),
+        'CACHE_URL': ('cached pages and invalidations', isinstance(app.extensions['cache'], cache.LRUCache)),
+        'CHAT_BROKER_URL': ('live chat messages', isinstance(app.extensions['broker'], broker.MemoryBroker)),
+    }
+    missing = [name for name, (_, in_memory) in private.items() if in_memory]
+    if missing:
+        lost = ', '.join(private[name][0] for name in missing)
+        raise RuntimeError(f"Set {', '.join(missing)} to run more than one worker process; "
+                           f"otherwise {lost} are kept by each process separately")
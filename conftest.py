@@ -0,0 +1,60 @@
+import pytest
+
+from app import create_app
+from models import db, Artisan, User
+import migrations
+
+
+def make_app(tmp_path, overrides=None, migrate=True):
+    """A test app on a database in tmp_path, migrated unless migrate is False"""
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/test.db',
+        'JOBS_URL': f'sqlite:///{tmp_path}/jobs.db',
+        'JOBS_IN_PROCESS_WORKER': False,
+        'STATS_REFRESH_INTERVAL': None,
+        'FEEDS_REFRESH_INTERVAL': None,
+        'PASSWORD_HASH_WORKERS': 0,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        **(overrides or {}),
+    })
+    if migrate:
+        with app.app_context():
+            migrations.upgrade(echo=lambda message: None)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, account_id, user_type):
+    with client.session_transaction() as session:
+        session['user_id'] = account_id
+        session['user_type'] = user_type
+
+
+def make_user(app, name='Buyer'):
+    with app.app_context():
+        user = User(name=name, email=f'{name.lower()}@example.test', password='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def make_artisan(app, name='Potter', craft_type='Pottery'):
+    with app.app_context():
+        artisan = Artisan(name=name, email=f'{name.lower()}@example.test', password='x', craft_type=craft_type,
+                          location='Jaipur', contact='0000000000')
+        db.session.add(artisan)
+        db.session.commit()
+        return artisan.id
@@ -1,4 +1,5 @@
-from app import app, db
-with app.app_context():
-    db.create_all()
-    exit()
\ No newline at end of file
+from app import create_app
+import migrations
+with create_app().app_context():
+    migrations.upgrade()
+    exit()
@@ -0,0 +1,100 @@
+"""Database engine configuration from the environment.
+
+    DATABASE_URL            primary database (default sqlite:///kalamitra.db in
+                            the instance folder); postgresql:// and mysql+pymysql://
+                            URLs work once the matching driver is installed
+    DATABASE_REPLICA_URL    optional read replica for @read_replica views
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT
+                            connection pool tuning
+
+SQLite connections are switched to WAL with a busy timeout so concurrent
+writers wait for the lock instead of failing with "database is locked", and
+have foreign keys enforced so ON DELETE CASCADE takes effect.
+"""
+import os
+from functools import wraps
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = 'sqlite:///kalamitra.db'
+REPLICA_BIND = 'replica'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'busy_timeout': 5000,  # ms to wait for a write lock
+    'synchronous': 'NORMAL',  # safe with WAL, avoids an fsync per commit
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -20000,  # KiB
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',  # off by default in SQLite; needed for ON DELETE CASCADE
+}
+
+
+def _normalize_url(url):
+    # Heroku-style postgres:// URLs are not accepted by SQLAlchemy
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def configure(app):
+    """Fill the SQLALCHEMY_* settings from the environment"""
+    url = _normalize_url(os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL))
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLITE_PRAGMAS'] = dict(SQLITE_PRAGMAS)
+
+    options = {'pool_pre_ping': True}
+    if make_url(url).get_backend_name() != 'sqlite':
+        options.update(
+            pool_size=_env_int('DB_POOL_SIZE', 10),
+            max_overflow=_env_int('DB_MAX_OVERFLOW', 20),
+            pool_recycle=_env_int('DB_POOL_RECYCLE', 1800),
+            pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+        )
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_url = os.environ.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        app.config['SQLALCHEMY_BINDS'] = {REPLICA_BIND: _normalize_url(replica_url)}
+
+
+def init_app(app, db):
+    """Apply SQLite pragmas to every new connection of the app's engines"""
+    pragmas = app.config['SQLITE_PRAGMAS']
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', set_sqlite_pragmas)
+
+
+class RoutingSession(Session):
+    """Session that sends reads from @read_replica views to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and has_app_context()
+                and g.get('use_replica') and REPLICA_BIND in self._db.engines):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_replica(view):
+    """Let a read-only view query the read replica when one is configured"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
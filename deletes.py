@@ -0,0 +1,110 @@
+"""Deleting artisans and products without row-by-row cascades.
+
+Foreign keys cascade in the database (ON DELETE CASCADE) and the ORM
+relationships use passive_deletes, so deleting a product is one DELETE and
+its wishlist entries go with it without being loaded.
+
+An artisan can own thousands of products, chats and messages, and removing
+them in one statement would hold the SQLite write lock for as long as that
+takes. delete_artisan() therefore only marks the artisan and its products
+deleted, two UPDATEs that hide them from every ORM query at once (see
+models.SoftDeleteMixin), and the 'deletes.purge' job hard-deletes marked rows
+PURGE_BATCH_SIZE at a time, committing between batches.
+
+With SOFT_DELETE on, deleted products are marked the same way and everything
+marked is kept for SOFT_DELETE_RETENTION seconds before it is purged, so it
+can still be restored by clearing deleted_at; otherwise the purge runs as
+soon as the deletion commits. `flask purge-deleted` runs a purge by hand.
+"""
+from datetime import timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+
+import jobs
+from models import (db, Artisan, Chat, Message, Product, Rating, Wishlist, apply_facet_deltas,
+                    get_ist_time, price_band_expression)
+
+artisans = Artisan.__table__
+products = Product.__table__
+
+
+def _now():
+    return get_ist_time().replace(tzinfo=None)
+
+
+def schedule_purge(retention=None):
+    """Purge after the transaction commits, once what it deleted is due"""
+    if retention is None:
+        retention = current_app.config['SOFT_DELETE_RETENTION'] if current_app.config['SOFT_DELETE'] else 0
+    jobs.enqueue_after_commit('deletes.purge', delay=retention, retention=retention)
+
+
+def delete_product(product):
+    """Delete a product, or mark it deleted in soft-delete mode; the caller commits"""
+    if current_app.config['SOFT_DELETE']:
+        # Through the ORM so the facet counts drop it
+        product.deleted_at = _now()
+        schedule_purge()
+    else:
+        db.session.delete(product)
+
+
+def delete_artisan(artisan):
+    """Mark an artisan and its products deleted and queue the purge; the caller commits"""
+    now = _now()
+    live = (products.c.artisan_id == artisan.id) & products.c.deleted_at.is_(None)
+
+    # The products are marked with one UPDATE, which skips the ORM facet
+    # hooks, so their counts are taken off here with grouped counts
+    deltas = {}
+    for facet, column in (('products.category', products.c.category_slug),
+                          ('products.price', price_band_expression(products.c.price))):
+        for value, count in db.session.execute(select(column, func.count()).where(live).group_by(column)):
+            deltas[facet, value] = -count
+    apply_facet_deltas(db.session.connection(), deltas)
+    db.session.execute(update(products).where(live).values(deleted_at=now))
+
+    artisan.deleted_at = now
+    schedule_purge()
+
+
+def _delete_in_batches(table, ids_query, batch_size):
+    """Delete the rows whose ids ids_query selects, a committed batch at a time"""
+    deleted = 0
+    while True:
+        ids = db.session.scalars(ids_query.limit(batch_size)).all()
+        if not ids:
+            return deleted
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        deleted += len(ids)
+
+
+def purge(retention=0, batch_size=1000):
+    """Hard-delete artisans and products marked deleted more than retention seconds ago
+
+    Children go first, each in bounded batches, so no single statement
+    cascades through a whole catalog or conversation history. Returns
+    {table: rows deleted}.
+    """
+    cutoff = _now() - timedelta(seconds=retention)
+    purged_artisans = select(artisans.c.id).where(artisans.c.deleted_at <= cutoff)
+    purged_products = select(products.c.id).where(products.c.deleted_at <= cutoff)
+    chats = select(Chat.__table__.c.id).where(Chat.__table__.c.artisan_id.in_(purged_artisans))
+
+    steps = [
+        (Message.__table__, select(Message.__table__.c.id).where(Message.__table__.c.chat_id.in_(chats))),
+        (Chat.__table__, chats),
+        (Rating.__table__, select(Rating.__table__.c.id).where(Rating.__table__.c.artisan_id.in_(purged_artisans))),
+        (Wishlist.__table__,
+         select(Wishlist.__table__.c.id).where(Wishlist.__table__.c.product_id.in_(purged_products))),
+        (products, purged_products),
+        (artisans, purged_artisans),
+    ]
+    return {table.name: _delete_in_batches(table, ids_query, batch_size) for table, ids_query in steps}
+
+
+@jobs.task('deletes.purge')
+def purge_job(retention):
+    purge(retention, current_app.config['PURGE_BATCH_SIZE'])
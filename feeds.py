@@ -0,0 +1,178 @@
+"""Precomputed product feeds from wishlist activity.
+
+refresh() rebuilds two tables that pages read with a single indexed query:
+
+    product_trends           trending products: wishlist adds in the last
+                             TREND_WINDOW_DAYS, each weighted by
+                             0.5 ** (age in days / TREND_HALF_LIFE_DAYS)
+    product_recommendations  "wishlisted together" neighbours of each product,
+                             scored by cosine similarity of their wishlist sets
+
+Both are aggregated in the database (per-day counts and a grouped self-join
+of wishlists) and streamed back in order, so memory stays bounded by one
+product's neighbours. Each table is replaced in a single transaction, so
+readers see either the old or the new feed.
+"""
+import heapq
+import math
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import aliased
+
+from models import db, IST, Product, ProductRecommendation, ProductTrend, Wishlist
+
+TREND_WINDOW_DAYS = 30
+TREND_HALF_LIFE_DAYS = 7
+TREND_LIMIT = 200
+RECOMMENDATIONS_PER_PRODUCT = 10
+# Users with bigger wishlists add quadratic pairs but little signal
+MAX_WISHLIST_SIZE = 200
+MIN_CO_OCCURRENCE = 1
+BATCH_SIZE = 5000
+
+
+def _now():
+    return datetime.now(IST).replace(tzinfo=None)
+
+
+def compute_trends(now=None, window_days=TREND_WINDOW_DAYS, half_life_days=TREND_HALF_LIFE_DAYS,
+                   limit=TREND_LIMIT):
+    """[(product_id, score)] of the top trending products, best first"""
+    now = now or _now()
+    day = func.date(Wishlist.added_at)
+    daily = db.session.execute(
+        select(Wishlist.product_id, day, func.count())
+        .where(Wishlist.added_at >= now - timedelta(days=window_days))
+        .group_by(Wishlist.product_id, day)
+    )
+    scores = {}
+    today = now.date()
+    for product_id, added_on, count in daily:
+        if isinstance(added_on, str):
+            added_on = datetime.strptime(added_on, '%Y-%m-%d').date()
+        age = max((today - added_on).days, 0)
+        scores[product_id] = scores.get(product_id, 0.0) + count * 0.5 ** (age / half_life_days)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def iter_recommendations(per_product=RECOMMENDATIONS_PER_PRODUCT, max_wishlist_size=MAX_WISHLIST_SIZE,
+                         min_co_occurrence=MIN_CO_OCCURRENCE):
+    """Yield (product_id, recommended_id, score) for every product, best first"""
+    eligible_users = (
+        select(Wishlist.user_id).group_by(Wishlist.user_id)
+        .having(func.count() <= max_wishlist_size)
+    )
+    wishlisted_by = dict(db.session.execute(
+        select(Wishlist.product_id, func.count()).group_by(Wishlist.product_id)
+    ).all())
+
+    first, second = aliased(Wishlist), aliased(Wishlist)
+    pairs = db.session.execute(
+        select(first.product_id, second.product_id, func.count())
+        .join(second, (second.user_id == first.user_id) & (second.product_id != first.product_id))
+        .where(first.user_id.in_(eligible_users))
+        .group_by(first.product_id, second.product_id)
+        .having(func.count() >= min_co_occurrence)
+        .order_by(first.product_id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+
+    def best(product_id, candidates):
+        for score, recommended_id in sorted(candidates, reverse=True):
+            yield product_id, recommended_id, round(score, 6)
+
+    current, candidates = None, []
+    for product_id, other_id, together in pairs:
+        if product_id != current:
+            if current is not None:
+                yield from best(current, candidates)
+            current, candidates = product_id, []
+        score = together / math.sqrt(wishlisted_by[product_id] * wishlisted_by[other_id])
+        if len(candidates) < per_product:
+            heapq.heappush(candidates, (score, other_id))
+        else:
+            heapq.heappushpop(candidates, (score, other_id))
+    if current is not None:
+        yield from best(current, candidates)
+
+
+def _replace(model, rows):
+    """Swap a table's contents for rows in one transaction"""
+    db.session.execute(delete(model))
+    batch, total = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(insert(model.__table__), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model.__table__), batch)
+        total += len(batch)
+    db.session.commit()
+    return total
+
+
+def refresh():
+    """Rebuild both feed tables; returns (trend rows, recommendation rows)"""
+    now = _now()
+    trends = _replace(ProductTrend, (
+        {'product_id': product_id, 'score': round(score, 6), 'computed_at': now}
+        for product_id, score in compute_trends(now)
+    ))
+    recommendations = _replace(ProductRecommendation, (
+        {'product_id': product_id, 'recommended_id': recommended_id, 'score': score}
+        for product_id, recommended_id, score in iter_recommendations()
+    ))
+    return trends, recommendations
+
+
+# Reads
+FEED_COLUMNS = (Product.id, Product.name, Product.price, Product.image_url, Product.artisan_id)
+
+
+def _rows(result):
+    return [dict(row._mapping) for row in result]
+
+
+def trending_products(limit=8):
+    return _rows(db.session.execute(
+        select(*FEED_COLUMNS)
+        .join(ProductTrend, ProductTrend.product_id == Product.id)
+        .order_by(ProductTrend.score.desc())
+        .limit(limit)
+    ))
+
+
+def recommended_products(product_ids, exclude_artisan_id=None, limit=8):
+    """Best neighbours of a set of products, excluding the products themselves"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return []
+    score = func.max(ProductRecommendation.score)
+    query = (
+        select(*FEED_COLUMNS)
+        .join(ProductRecommendation, ProductRecommendation.recommended_id == Product.id)
+        .where(ProductRecommendation.product_id.in_(product_ids),
+               ProductRecommendation.recommended_id.notin_(product_ids))
+        .group_by(*FEED_COLUMNS)
+        .order_by(score.desc())
+        .limit(limit)
+    )
+    if exclude_artisan_id is not None:
+        query = query.where(Product.artisan_id != exclude_artisan_id)
+    return _rows(db.session.execute(query))
+
+
+def schedule_refresh(queue, interval, slot=None):
+    """Queue the feeds refresh for a time slot, the current one by default
+
+    As with the admin stats, the idempotency key names the slot, so each
+    slot is refreshed once however many processes work the queue.
+    """
+    now = time.time()
+    slot = int(now // interval) if slot is None else slot
+    queue.enqueue('feeds.refresh', idempotency_key=f'feeds.refresh:{interval}:{slot}',
+                  delay=max(slot * interval - now, 0), interval=interval)
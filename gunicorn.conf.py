@@ -0,0 +1,66 @@
+"""Gunicorn settings for production serving.
+
+    gunicorn -c gunicorn.conf.py
+
+The master loads the app once (preload_app) and forks the workers, which
+share it copy-on-write and open their own database connections. Each worker
+serves up to `threads` requests at a time. Server-sent event streams (the
+chat stream) hold a thread for as long as they are open, so each worker
+keeps at most CHAT_STREAM_LIMIT of them, and never more than half its
+threads; further chat pages poll for messages instead. Gunicorn reads PORT and WEB_CONCURRENCY itself; command-line
+options (--workers, --bind, ...) override these settings.
+
+More than one worker needs sessions, the cache and the chat broker shared
+between processes, so a worker refuses to boot without SESSION_STORE_URL,
+CACHE_URL and CHAT_BROKER_URL pointing at shared backends (see
+config.check_multiprocess()).
+
+    kill -HUP <master>    start new workers, then stop the old ones gracefully
+    kill -TERM <master>   let in-flight requests finish for graceful_timeout
+                          seconds, then exit
+
+Behind it put a reverse proxy (nginx, a cloud load balancer) to terminate
+TLS and buffer slow clients, set PROXY_FIX_HOPS, and point its health checks
+at /healthz and /readyz.
+"""
+import os
+import signal
+
+wsgi_app = os.environ.get('WSGI_APP', 'wsgi:app')
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+preload_app = True
+graceful_timeout = 30
+# Idle keep-alive connections are closed after this many seconds, so they
+# don't hold on to a worker thread
+keepalive = 5
+
+
+def post_worker_init(worker):
+    import config
+    import health
+    from models import db
+
+    app = worker.wsgi
+    # A preloaded app's connection pools were created in the master; drop
+    # them without closing the master's connections
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    if worker.cfg.workers > 1:
+        # Raising here stops gunicorn with "Worker failed to boot"
+        config.check_multiprocess(app)
+    # Chat streams each hold a thread; keep at least half the threads for
+    # other requests, so open chat pages can't starve the site or /readyz
+    app.config['CHAT_STREAM_LIMIT'] = min(app.config['CHAT_STREAM_LIMIT'], worker.cfg.threads // 2)
+
+    # Fail /readyz while in-flight requests finish, so the balancer moves
+    # traffic away from a stopping worker
+    handle_exit = worker.handle_exit
+
+    def drain(signum, frame):
+        health.start_draining(app)
+        handle_exit(signum, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.siginterrupt(signal.SIGTERM, False)
@@ -0,0 +1,55 @@
+"""Health checks for load balancers and process managers.
+
+    GET /healthz    liveness: the process is up and serving requests; never
+                    touches the database, so a slow database doesn't get
+                    healthy workers restarted
+    GET /readyz     readiness: the database and the job queue answer, the
+                    schema is current and the process isn't shutting down;
+                    503 with the failing checks otherwise
+
+gunicorn.conf.py calls start_draining() on a worker it is stopping,
+so /readyz fails and the balancer moves traffic away while in-flight
+requests finish.
+"""
+from flask import current_app, jsonify
+from sqlalchemy import text
+
+from models import db
+import jobs
+import migrations
+
+
+def start_draining(app):
+    app.extensions['draining'] = True
+
+
+def check_database():
+    with db.engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+        pending = migrations.pending_migrations(conn)
+    return f'pending migrations {pending}' if pending else None
+
+
+def check_jobs():
+    jobs.get_queue().ping()
+
+
+def init_app(app):
+    @app.route('/healthz')
+    def healthz():
+        return jsonify(status='ok')
+
+    @app.route('/readyz')
+    def readyz():
+        checks = {}
+        for name, check in (('database', check_database), ('jobs', check_jobs)):
+            try:
+                checks[name] = check() or 'ok'
+            except Exception as e:
+                current_app.logger.warning('Readiness check %s failed: %s', name, e)
+                checks[name] = f'error: {e.__class__.__name__}'
+        if current_app.extensions.get('draining'):
+            checks['process'] = 'draining'
+        ready = all(result == 'ok' for result in checks.values())
+        return jsonify(status='ok' if ready else 'unavailable', checks=checks,
+                       startup_ms=round(app.extensions['startup_seconds'] * 1000, 1)), 200 if ready else 503
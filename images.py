@@ -0,0 +1,110 @@
+"""Upload image pipeline: content-addressed storage and resized WebP variants.
+
+Each upload is stored once under the SHA-256 of its bytes:
+
+    <upload folder>/images/ab/abcdef.../original.jpg
+                                       /thumb.webp
+                                       /card.webp
+                                       /full.webp
+
+The original is written during the request; the variants are produced
+afterwards by a background job. Until a variant exists, variant_url() falls back
+to the original so pages never show a broken image.
+"""
+import hashlib
+import io
+import os
+import re
+
+from PIL import Image, ImageOps
+
+# Longest side in pixels for each variant
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'full': 1600,
+}
+VARIANT_FORMAT = 'webp'
+VARIANT_QUALITY = 80
+
+IMAGES_DIR = 'images'
+CONTENT_URL_RE = re.compile(r'^(?P<base>.*/images/[0-9a-f]{2}/[0-9a-f]{64})/original\.\w+$')
+
+_existing_variants = set()
+
+
+def content_dir(upload_folder, digest):
+    return os.path.join(upload_folder, IMAGES_DIR, digest[:2], digest)
+
+
+def save_original(data, extension, upload_folder, url_prefix):
+    """Store upload bytes under their content hash
+
+    Returns (path, url) of the original. Identical uploads share one file.
+    Raises ValueError if the bytes are not an image Pillow can read.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+    except Exception:
+        raise ValueError('Uploaded file is not a valid image')
+
+    digest = hashlib.sha256(data).hexdigest()
+    directory = content_dir(upload_folder, digest)
+    filename = f'original.{extension.lower()}'
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    url = f'{url_prefix}/{IMAGES_DIR}/{digest[:2]}/{digest}/{filename}'
+    return path, url
+
+
+def process_image(original_path):
+    """Write every missing variant next to the original"""
+    directory = os.path.dirname(original_path)
+    pending = {
+        name: size for name, size in VARIANTS.items()
+        if not os.path.exists(os.path.join(directory, f'{name}.{VARIANT_FORMAT}'))
+    }
+    if not pending:
+        return
+
+    with Image.open(original_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        # Largest first so each smaller variant resizes an already reduced image
+        for name, size in sorted(pending.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size), Image.LANCZOS)
+            path = os.path.join(directory, f'{name}.{VARIANT_FORMAT}')
+            tmp_path = f'{path}.tmp'
+            image.save(tmp_path, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+            os.replace(tmp_path, path)
+
+
+def variant_url(image_url, variant, upload_folder, url_prefix):
+    """URL of a sized variant, or the original while it is still processing
+
+    Legacy uploads that aren't content-addressed are returned unchanged.
+    """
+    match = CONTENT_URL_RE.match(image_url or '')
+    if not match:
+        return image_url
+    url = f"{match.group('base')}/{variant}.{VARIANT_FORMAT}"
+    if url not in _existing_variants:
+        path = os.path.join(upload_folder, url[len(url_prefix):].lstrip('/'))
+        if not os.path.exists(path):
+            return image_url
+        # Variants are never removed, so a positive check can be remembered
+        _existing_variants.add(url)
+    return url
+
+
+def variant_pending(image_url, variant, upload_folder, url_prefix):
+    """Whether variant_url() still falls back to the original"""
+    return bool(CONTENT_URL_RE.match(image_url or '')) and variant_url(
+        image_url, variant, upload_folder, url_prefix) == image_url
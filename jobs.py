@@ -0,0 +1,296 @@
+"""Durable background jobs in a local SQLite queue.
+
+Tasks are plain functions registered by name and called with the job's
+JSON payload as keyword arguments:
+
+    @jobs.task('images.process')
+    def process_image(path): ...
+
+    jobs.enqueue('images.process', path=path)
+    jobs.enqueue_after_commit('images.process', path=path)  # only if the
+                                                            # transaction commits
+
+A job with an idempotency_key is stored once; enqueueing the same key again
+is a no-op while the first job is kept (finished jobs are purged after
+JOBS_RETENTION seconds). Failed attempts are retried with exponential
+backoff up to max_attempts, after which the job stays 'failed' for
+inspection. Jobs left 'running' by a worker that died are picked up again
+once their lease expires.
+
+Config:
+    JOBS_URL                 sqlite:///path of the queue (default instance/jobs.db)
+    JOBS_IN_PROCESS_WORKER   also work the queue from a thread of each web
+                             process; turn off when running flask jobs-worker
+    JOBS_POLL_INTERVAL       seconds between polls of an empty queue
+    JOBS_RETENTION           seconds finished jobs are kept
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import traceback
+
+from flask import current_app
+from sqlalchemy import event
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_BASE = 5  # seconds before the first retry, doubled for each further one
+BACKOFF_MAX = 3600
+LEASE_SECONDS = 300  # a running job is presumed dead after this long
+
+_tasks = {}
+
+
+def task(name):
+    """Register a function as the handler for jobs called name"""
+    def decorator(func):
+        _tasks[name] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    def __init__(self, path, retention=7 * 24 * 3600):
+        self.path = path
+        self.retention = retention
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread and process; a forked worker must not
+        # reuse its parent's. The table is created by the first connection
+        # rather than at startup.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_table(conn)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def _create_table(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                idempotency_key TEXT UNIQUE,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_at REAL NOT NULL,
+                locked_until REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at)")
+
+    def enqueue(self, name, idempotency_key=None, delay=0, max_attempts=DEFAULT_MAX_ATTEMPTS, **payload):
+        """Add a job; returns its id, or None if the idempotency key is taken"""
+        now = time.time()
+        cursor = self._connect().execute(
+            """INSERT OR IGNORE INTO jobs
+               (name, payload, idempotency_key, status, max_attempts, run_at, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (name, json.dumps(payload), idempotency_key, QUEUED, max_attempts, now + delay, now),
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def claim(self):
+        """Lease the next due job to this worker, or return None"""
+        now = time.time()
+        row = self._connect().execute(
+            """UPDATE jobs SET status = ?, attempts = attempts + 1, locked_until = ?
+               WHERE id = (
+                   SELECT id FROM jobs
+                   WHERE (status = ? AND run_at <= ?) OR (status = ? AND locked_until < ?)
+                   ORDER BY run_at, id LIMIT 1)
+               RETURNING id, name, payload, attempts, max_attempts""",
+            (RUNNING, now + LEASE_SECONDS, QUEUED, now, RUNNING, now),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def complete(self, job_id):
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, locked_until = NULL WHERE id = ?",
+            (DONE, time.time(), job_id),
+        )
+
+    def fail(self, job, error):
+        """Schedule a retry with backoff, or mark the job failed for good"""
+        now = time.time()
+        if job['attempts'] < job['max_attempts']:
+            delay = min(BACKOFF_BASE * 2 ** (job['attempts'] - 1), BACKOFF_MAX)
+            delay *= random.uniform(0.8, 1.2)
+            status, run_at, finished_at = QUEUED, now + delay, None
+        else:
+            status, run_at, finished_at = FAILED, now, now
+        self._connect().execute(
+            """UPDATE jobs SET status = ?, run_at = ?, finished_at = ?, locked_until = NULL,
+               last_error = ? WHERE id = ?""",
+            (status, run_at, finished_at, error, job['id']),
+        )
+        return status
+
+    def retry_failed(self, job_id=None):
+        """Queue failed jobs (or one of them) again; returns how many"""
+        query = "UPDATE jobs SET status = ?, attempts = 0, run_at = ?, finished_at = NULL WHERE status = ?"
+        params = [QUEUED, time.time(), FAILED]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        return self._connect().execute(query, params).rowcount
+
+    def purge(self):
+        """Delete finished jobs older than the retention period"""
+        return self._connect().execute(
+            "DELETE FROM jobs WHERE status = ? AND finished_at < ?",
+            (DONE, time.time() - self.retention),
+        ).rowcount
+
+    def stats(self):
+        conn = self._connect()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+        by_name = {}
+        for row in conn.execute("SELECT name, status, COUNT(*) AS n FROM jobs GROUP BY name, status"):
+            counts[row['status']] += row['n']
+            by_name.setdefault(row['name'], {})[row['status']] = row['n']
+        oldest = conn.execute(
+            "SELECT MIN(run_at) FROM jobs WHERE status = ? AND run_at <= ?", (QUEUED, time.time())
+        ).fetchone()[0]
+        return {
+            'counts': counts,
+            'by_name': by_name,
+            'oldest_due_seconds': round(time.time() - oldest, 1) if oldest else None,
+        }
+
+    def ping(self):
+        """Open (or reuse) this thread's connection and run a trivial query"""
+        self._connect().execute("SELECT 1")
+
+    def failed_jobs(self, limit=20):
+        return [dict(row) for row in self._connect().execute(
+            """SELECT id, name, payload, attempts, last_error, finished_at FROM jobs
+               WHERE status = ? ORDER BY finished_at DESC LIMIT ?""", (FAILED, limit))]
+
+
+def create_queue(url, retention=7 * 24 * 3600):
+    if not url.startswith('sqlite:///'):
+        raise ValueError(f'Unsupported JOBS_URL: {url}')
+    return JobQueue(url[len('sqlite:///'):], retention)
+
+
+def run_job(app, queue, job):
+    """Run one claimed job in an app context; returns its new status"""
+    func = _tasks.get(job['name'])
+    try:
+        if func is None:
+            raise LookupError(f"No task registered for {job['name']!r}")
+        with app.app_context():
+            func(**json.loads(job['payload']))
+    except Exception:
+        app.logger.exception('Job %s (%s) failed on attempt %d', job['id'], job['name'], job['attempts'])
+        return queue.fail(job, traceback.format_exc(limit=5))
+    queue.complete(job['id'])
+    return DONE
+
+
+def on_worker_start(app, func):
+    """Call func(queue) whenever a worker starts working the app's queue
+
+    For scheduling recurring jobs: nothing is enqueued while the app starts
+    up, and nothing at all when no worker runs.
+    """
+    app.extensions.setdefault('jobs_on_worker_start', []).append(func)
+
+
+def work(app, queue, poll_interval=1.0, stop=None, burst=False):
+    """Process jobs until stop is set, or until the queue is empty with burst"""
+    stop = stop or threading.Event()
+    for func in app.extensions.get('jobs_on_worker_start', []):
+        with app.app_context():
+            func(queue)
+    last_purge = 0
+    while not stop.is_set():
+        if time.time() - last_purge > 3600:
+            queue.purge()
+            last_purge = time.time()
+        job = queue.claim()
+        if job is None:
+            if burst:
+                return
+            stop.wait(poll_interval)
+            continue
+        run_job(app, queue, job)
+
+
+def start_worker_thread(app, queue, poll_interval=1.0):
+    stop = threading.Event()
+    threading.Thread(target=work, args=(app, queue, poll_interval, stop), name='jobs-worker', daemon=True).start()
+    return stop
+
+
+# Enqueue after commit
+# Jobs queued with enqueue_after_commit wait in session.info until the
+# database transaction commits, so a worker never sees a job for rows that
+# were rolled back.
+def _enqueue_pending(session):
+    for queue, name, kwargs in session.info.pop('pending_jobs', []):
+        queue.enqueue(name, **kwargs)
+
+
+def _drop_pending(session, previous_transaction):
+    if previous_transaction.parent is None:
+        session.info.pop('pending_jobs', None)
+
+
+def _register_session_events(session):
+    # Every app shares db.session, so the listeners are added once
+    if not event.contains(session, 'after_commit', _enqueue_pending):
+        event.listen(session, 'after_commit', _enqueue_pending)
+        event.listen(session, 'after_soft_rollback', _drop_pending)
+
+
+def init_app(app, db):
+    os.makedirs(app.instance_path, exist_ok=True)
+    queue = create_queue(app.config['JOBS_URL'], app.config['JOBS_RETENTION'])
+    app.extensions['jobs'] = queue
+    app.extensions['jobs_session'] = db.session
+    _register_session_events(db.session)
+
+    if app.config['JOBS_IN_PROCESS_WORKER']:
+        # Started by the first request rather than at import, so CLI
+        # commands don't run jobs in the background
+        lock, started = threading.Lock(), []
+
+        @app.before_request
+        def start_in_process_worker():
+            if not started:
+                with lock:
+                    if not started:
+                        started.append(start_worker_thread(app, queue, app.config['JOBS_POLL_INTERVAL']))
+
+
+def get_queue():
+    return current_app.extensions['jobs']
+
+
+def enqueue(name, **kwargs):
+    return get_queue().enqueue(name, **kwargs)
+
+
+def enqueue_after_commit(name, **kwargs):
+    """Enqueue once the current database transaction commits"""
+    session = current_app.extensions['jobs_session']()
+    if not session.in_transaction():
+        # Begin now so that a rollback before any query still drops the job
+        session.begin()
+    session.info.setdefault('pending_jobs', []).append((get_queue(), name, kwargs))
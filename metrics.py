@@ -0,0 +1,214 @@
+"""Per-endpoint request instrumentation exported in Prometheus text format.
+
+For every request this records latency, SQL statement count (from
+query_budget) and time (from SQLAlchemy engine events), Jinja render time
+and response size, labelled by endpoint. GET /metrics serves the current values; set METRICS_TOKEN to
+require "Authorization: Bearer <token>".
+
+Slow statements and requests are logged when they exceed
+SLOW_QUERY_THRESHOLD / SLOW_REQUEST_THRESHOLD (seconds, None disables).
+Values are kept per process.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, abort, current_app, g, has_app_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import query_budget
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._series = defaultdict(lambda: [0] * (len(buckets) + 2))
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{_labels(key, le=bound)} {count}')
+            lines.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {values[-2]}')
+            lines.append(f'{self.name}_count{_labels(key)} {values[-2]}')
+            lines.append(f'{self.name}_sum{_labels(key)} {values[-1]:.6f}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            lines.append(f'{self.name}{_labels(key)} {value:g}')
+        return lines
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+REQUESTS = Counter('kalamitra_requests_total', 'Requests handled.')
+REQUEST_LATENCY = Histogram('kalamitra_request_duration_seconds', 'Request latency.', LATENCY_BUCKETS)
+SQL_STATEMENTS = Histogram('kalamitra_sql_statements_per_request', 'SQL statements per request.', COUNT_BUCKETS)
+SQL_TIME = Histogram('kalamitra_sql_duration_seconds', 'Total SQL time per request.', LATENCY_BUCKETS)
+TEMPLATE_TIME = Histogram('kalamitra_template_render_seconds', 'Jinja render time per template.', LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram('kalamitra_response_size_bytes', 'Response body size.', SIZE_BUCKETS)
+OPERATION_TIME = Histogram('kalamitra_operation_duration_seconds', 'Timed operations such as upload I/O.', LATENCY_BUCKETS)
+
+ALL_METRICS = (REQUESTS, REQUEST_LATENCY, SQL_STATEMENTS, SQL_TIME, TEMPLATE_TIME, RESPONSE_SIZE, OPERATION_TIME)
+
+
+def add_collector(app, collect):
+    """Add a callable returning extra exposition lines to the app's /metrics,
+    e.g. gauges read from another component at scrape time"""
+    app.extensions.setdefault('metrics_collectors', []).append(collect)
+
+
+def gauge(name, help_text, samples):
+    """Exposition lines for a gauge from (labels dict or None, value) pairs"""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+    for labels, value in samples:
+        key = tuple(sorted(labels.items())) if labels else ()
+        lines.append(f'{name}{_labels(key)} {value:g}')
+    return lines
+
+
+class timed:
+    """Context manager recording how long an operation took
+
+        with metrics.timed('upload'):
+            ...
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        OPERATION_TIME.observe(time.perf_counter() - self.start, operation=self.operation)
+
+
+# Statement timing, registered once for every engine; the app whose context
+# is active supplies the threshold and logger. Statements are started from
+# query_budget's listener, which also counts them.
+@query_budget.on_statement
+def _start_statement_timer(conn, statement):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_app_context():
+        return
+    if 'sql_time' in g:
+        g.sql_time += elapsed
+    threshold = current_app.config.get('SLOW_QUERY_THRESHOLD')
+    if threshold is not None and elapsed > threshold:
+        current_app.logger.warning('Slow query (%.3fs): %s', elapsed, statement)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _drop_statement_timer(exception_context):
+    # A failed statement gets no after_cursor_execute
+    starts = exception_context.connection.info.get('query_start') if exception_context.connection else None
+    if starts:
+        starts.pop()
+
+
+def _endpoint():
+    return request.url_rule.endpoint if request.url_rule else 'unmatched'
+
+
+def init_app(app):
+    @before_render_template.connect_via(app)
+    def start_template_timer(sender, template, context, **extra):
+        if 'template_starts' in g:
+            g.template_starts.append(time.perf_counter())
+
+    @template_rendered.connect_via(app)
+    def stop_template_timer(sender, template, context, **extra):
+        if g.get('template_starts'):
+            elapsed = time.perf_counter() - g.template_starts.pop()
+            TEMPLATE_TIME.observe(elapsed, template=template.name or 'string')
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        g.sql_time = 0.0
+        g.template_starts = []
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = _endpoint()
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(elapsed, endpoint=endpoint)
+        SQL_STATEMENTS.observe(query_budget.get_query_count(), endpoint=endpoint)
+        SQL_TIME.observe(g.sql_time, endpoint=endpoint)
+        # Streamed responses have no length up front
+        if not response.is_streamed:
+            RESPONSE_SIZE.observe(response.calculate_content_length() or 0, endpoint=endpoint)
+
+        threshold = app.config['SLOW_REQUEST_THRESHOLD']
+        if threshold is not None and elapsed > threshold:
+            app.logger.warning(
+                'Slow request %s %s (%s): %.3fs, %d SQL statements in %.3fs',
+                request.method, request.path, endpoint, elapsed,
+                query_budget.get_query_count(), g.sql_time,
+            )
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        lines = []
+        for metric in ALL_METRICS:
+            lines.extend(metric.render())
+        for collect in app.extensions.get('metrics_collectors', []):
+            lines.extend(collect())
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
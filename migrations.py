@@ -0,0 +1,329 @@
+"""Versioned schema migrations.
+
+db.create_all() only creates tables that are missing, so changes to existing
+tables (new columns, indexes, constraints) are applied here. Every migration
+is idempotent: a fresh database created from the current models already has
+the change and the migration only records its version.
+"""
+import re
+
+from sqlalchemy import inspect, text
+
+from models import db, rebuild_facet_counts
+import search
+import taxonomy
+
+
+def _has_column(conn, table, column):
+    return column in {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def _has_index(conn, table, name):
+    return name in {i['name'] for i in inspect(conn).get_indexes(table)}
+
+
+def _create_index(conn, name, table, columns, unique=False):
+    # Spelled out rather than taken from the models, which only describe
+    # the latest schema
+    if not _has_index(conn, table, name):
+        kind = 'UNIQUE INDEX' if unique else 'INDEX'
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"))
+
+
+def _drop_index(conn, table, name):
+    if _has_index(conn, table, name):
+        on_table = f' ON {table}' if conn.dialect.name == 'mysql' else ''
+        conn.execute(text(f"DROP INDEX {name}{on_table}"))
+
+
+# Migrations
+def add_artisan_rating_sum(conn):
+    """Add the running rating_sum counter and backfill it from ratings"""
+    if not _has_column(conn, 'artisans', 'rating_sum'):
+        conn.execute(text(
+            "ALTER TABLE artisans ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0"
+        ))
+    conn.execute(text("""
+        UPDATE artisans SET
+            rating_sum = (SELECT COALESCE(SUM(rating), 0) FROM ratings
+                          WHERE ratings.artisan_id = artisans.id),
+            total_ratings = (SELECT COUNT(*) FROM ratings
+                             WHERE ratings.artisan_id = artisans.id)
+    """))
+
+
+def add_lookup_indexes(conn):
+    """Index the hot lookup paths and enforce unique wishlist/chat pairs
+
+    Existing duplicates are merged first so the unique indexes can be built:
+    the oldest row of each pair is kept and messages of duplicate chats are
+    moved onto it. Messages of chats that no longer exist are left for
+    migration 7 to remove.
+    """
+    # The derived "keep" tables let MySQL delete from the table it selects from
+    conn.execute(text("""
+        DELETE FROM wishlists WHERE id NOT IN (SELECT id FROM
+            (SELECT MIN(id) AS id FROM wishlists GROUP BY user_id, product_id) AS keep)
+    """))
+    conn.execute(text("""
+        UPDATE messages SET chat_id = (
+            SELECT MIN(c2.id) FROM chats c1 JOIN chats c2
+                ON c1.user_id = c2.user_id AND c1.artisan_id = c2.artisan_id
+            WHERE c1.id = messages.chat_id)
+        WHERE chat_id NOT IN (SELECT MIN(id) FROM chats GROUP BY user_id, artisan_id)
+            AND chat_id IN (SELECT id FROM chats)
+    """))
+    conn.execute(text("""
+        DELETE FROM chats WHERE id NOT IN (SELECT id FROM
+            (SELECT MIN(id) AS id FROM chats GROUP BY user_id, artisan_id) AS keep)
+    """))
+    _create_index(conn, 'ix_artisans_rating_id', 'artisans', ['rating', 'id'])
+    _create_index(conn, 'ix_products_artisan_id', 'products', ['artisan_id'])
+    _create_index(conn, 'ix_ratings_artisan_id', 'ratings', ['artisan_id'])
+    _create_index(conn, 'ix_chats_artisan_id', 'chats', ['artisan_id'])
+    _create_index(conn, 'ix_wishlists_product_id', 'wishlists', ['product_id'])
+    _create_index(conn, 'ix_messages_chat_id_timestamp', 'messages', ['chat_id', 'timestamp'])
+    _create_index(conn, 'unique_user_product_wishlist', 'wishlists', ['user_id', 'product_id'], unique=True)
+    _create_index(conn, 'unique_user_artisan_chat', 'chats', ['user_id', 'artisan_id'], unique=True)
+
+
+def add_search_index(conn):
+    """Create the FTS5 search tables and index existing rows"""
+    search.create_index(conn)
+    search.rebuild_index(conn)
+
+
+def add_chat_history_paging(conn):
+    """Denormalize each chat's latest message and index history by cursor"""
+    for column in ('last_message_at DATETIME', 'last_message_preview VARCHAR(100)'):
+        if not _has_column(conn, 'chats', column.split()[0]):
+            conn.execute(text(f"ALTER TABLE chats ADD COLUMN {column}"))
+    conn.execute(text("""
+        UPDATE chats SET
+            last_message_at = COALESCE(
+                (SELECT MAX(timestamp) FROM messages WHERE messages.chat_id = chats.id),
+                created_at),
+            last_message_preview = (
+                SELECT SUBSTR(content, 1, 100) FROM messages
+                WHERE messages.chat_id = chats.id
+                ORDER BY timestamp DESC, id DESC LIMIT 1)
+    """))
+    _create_index(conn, 'ix_messages_chat_id_timestamp_id', 'messages', ['chat_id', 'timestamp', 'id'])
+    _create_index(conn, 'ix_chats_user_id_last_message_at', 'chats', ['user_id', 'last_message_at'])
+    _create_index(conn, 'ix_chats_artisan_id_last_message_at', 'chats', ['artisan_id', 'last_message_at'])
+    # Superseded by the wider indexes above
+    _drop_index(conn, 'messages', 'ix_messages_chat_id_timestamp')
+    _drop_index(conn, 'chats', 'ix_chats_artisan_id')
+
+
+def add_chat_read_cursors(conn):
+    """Add per-participant read cursors and unread counters to chats
+
+    Existing conversations start out read by both sides.
+    """
+    for column in ('last_message_id INTEGER',
+                   'user_last_read_id INTEGER NOT NULL DEFAULT 0',
+                   'artisan_last_read_id INTEGER NOT NULL DEFAULT 0',
+                   'user_unread_count INTEGER NOT NULL DEFAULT 0',
+                   'artisan_unread_count INTEGER NOT NULL DEFAULT 0'):
+        if not _has_column(conn, 'chats', column.split()[0]):
+            conn.execute(text(f"ALTER TABLE chats ADD COLUMN {column}"))
+    conn.execute(text("""
+        UPDATE chats SET last_message_id = (
+            SELECT MAX(id) FROM messages WHERE messages.chat_id = chats.id)
+    """))
+    conn.execute(text("""
+        UPDATE chats SET
+            user_last_read_id = COALESCE(last_message_id, 0),
+            artisan_last_read_id = COALESCE(last_message_id, 0),
+            user_unread_count = 0,
+            artisan_unread_count = 0
+    """))
+    _create_index(conn, 'ix_chats_user_id_user_unread_count', 'chats', ['user_id', 'user_unread_count'])
+    _create_index(conn, 'ix_chats_artisan_id_artisan_unread_count', 'chats',
+                  ['artisan_id', 'artisan_unread_count'])
+
+
+def _classify_categories(conn):
+    for (category,) in conn.execute(text("SELECT DISTINCT category FROM products")).all():
+        conn.execute(text("UPDATE products SET category_slug = :slug WHERE category = :value"),
+                     {'slug': taxonomy.category_slug(category), 'value': category})
+    # NULL never matches "= :value" above
+    conn.execute(text("UPDATE products SET category_slug = :slug WHERE category IS NULL"),
+                 {'slug': taxonomy.OTHER})
+
+
+def add_browse_facets(conn):
+    """Normalize crafts, locations and categories, index them and count facets
+
+    Slugs are computed once per distinct free-text value rather than per row.
+    """
+    for table, column in (('artisans', 'craft_slug VARCHAR(30)'), ('artisans', 'city_slug VARCHAR(30)'),
+                          ('artisans', 'latitude FLOAT'), ('artisans', 'longitude FLOAT'),
+                          ('products', 'category_slug VARCHAR(30)')):
+        if not _has_column(conn, table, column.split()[0]):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column}"))
+
+    for (craft_type,) in conn.execute(text("SELECT DISTINCT craft_type FROM artisans")).all():
+        conn.execute(text("UPDATE artisans SET craft_slug = :slug WHERE craft_type = :value"),
+                     {'slug': taxonomy.craft_slug(craft_type), 'value': craft_type})
+    for (location,) in conn.execute(text("SELECT DISTINCT location FROM artisans")).all():
+        slug = taxonomy.city_slug(location)
+        latitude, longitude = taxonomy.city_coordinates(slug)
+        conn.execute(text("""
+            UPDATE artisans SET city_slug = :slug, latitude = :latitude, longitude = :longitude
+            WHERE location = :value
+        """), {'slug': slug, 'latitude': latitude, 'longitude': longitude, 'value': location})
+    _classify_categories(conn)
+
+    _create_index(conn, 'ix_artisans_craft_slug_rating', 'artisans', ['craft_slug', 'rating'])
+    _create_index(conn, 'ix_artisans_city_slug', 'artisans', ['city_slug'])
+    _create_index(conn, 'ix_artisans_latitude_longitude', 'artisans', ['latitude', 'longitude'])
+    _create_index(conn, 'ix_products_category_slug_price', 'products', ['category_slug', 'price'])
+    _create_index(conn, 'ix_products_price', 'products', ['price'])
+    # deleted_at only arrives in migration 7
+    rebuild_facet_counts(conn, exclude_deleted=False)
+
+
+# (table, column, referenced table), in the order orphans are removed
+CASCADE_FOREIGN_KEYS = [
+    ('products', 'artisan_id', 'artisans'),
+    ('wishlists', 'user_id', 'users'),
+    ('wishlists', 'product_id', 'products'),
+    ('ratings', 'user_id', 'users'),
+    ('ratings', 'artisan_id', 'artisans'),
+    ('chats', 'user_id', 'users'),
+    ('chats', 'artisan_id', 'artisans'),
+    ('messages', 'chat_id', 'chats'),
+    ('product_trends', 'product_id', 'products'),
+    ('product_recommendations', 'product_id', 'products'),
+    ('product_recommendations', 'recommended_id', 'products'),
+]
+
+
+def _rebuild_sqlite_table(conn, table, columns):
+    """Recreate a SQLite table with ON DELETE CASCADE on the given foreign keys
+
+    SQLite cannot alter a constraint, so the table is copied into one built
+    from its own CREATE statement, and its indexes and triggers (the search
+    index's among them) are created again. Runs with foreign keys off.
+    """
+    # exec_driver_sql: stored SQL may contain colons that are not parameters
+    create_sql = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).scalar()
+    for column in columns:
+        create_sql = re.sub(rf'(FOREIGN KEY\s*\(\s*"?{column}"?\s*\)\s*REFERENCES\s*"?\w+"?\s*\(\s*"?\w+"?\s*\))',
+                            r'\1 ON DELETE CASCADE', create_sql)
+    create_sql = re.sub(rf'^CREATE TABLE "?{table}"?', f'CREATE TABLE {table}_rebuild', create_sql)
+    dependents = [sql for (sql,) in conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+        (table,))]
+
+    conn.exec_driver_sql(create_sql)
+    conn.exec_driver_sql(f"INSERT INTO {table}_rebuild SELECT * FROM {table}")
+    conn.exec_driver_sql(f"DROP TABLE {table}")
+    conn.exec_driver_sql(f"ALTER TABLE {table}_rebuild RENAME TO {table}")
+    for sql in dependents:
+        conn.exec_driver_sql(sql)
+
+
+def add_soft_delete_and_cascades(conn):
+    """Add deleted_at to artisans and products and cascade deletes in the database
+
+    Rows whose parent is already gone would fail the new constraints and are
+    removed first.
+    """
+    for table in ('artisans', 'products'):
+        if not _has_column(conn, table, 'deleted_at'):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN deleted_at DATETIME"))
+        _create_index(conn, f'ix_{table}_deleted_at', table, ['deleted_at'])
+
+    for table, column, parent in CASCADE_FOREIGN_KEYS:
+        conn.execute(text(f"DELETE FROM {table} WHERE {column} NOT IN (SELECT id FROM {parent})"))
+
+    missing = {}
+    for table, column, parent in CASCADE_FOREIGN_KEYS:
+        for key in inspect(conn).get_foreign_keys(table):
+            if (key['constrained_columns'] == [column]
+                    and (key.get('options') or {}).get('ondelete', '').upper() != 'CASCADE'):
+                missing.setdefault(table, []).append((column, parent, key['name']))
+
+    for table, keys in missing.items():
+        if conn.dialect.name == 'sqlite':
+            _rebuild_sqlite_table(conn, table, [column for column, _, _ in keys])
+            continue
+        drop = 'DROP FOREIGN KEY' if conn.dialect.name == 'mysql' else 'DROP CONSTRAINT'
+        for column, parent, name in keys:
+            name = name or f'fk_{table}_{column}'
+            conn.execute(text(f"ALTER TABLE {table} {drop} {name}"))
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+                f"REFERENCES {parent} (id) ON DELETE CASCADE"
+            ))
+    _create_index(conn, 'ix_product_recommendations_recommended_id', 'product_recommendations',
+                  ['recommended_id'])
+    rebuild_facet_counts(conn)
+
+
+def add_pottery_category(conn):
+    """Classify products again now that pottery is a category of its own"""
+    _classify_categories(conn)
+    rebuild_facet_counts(conn)
+
+
+MIGRATIONS = [
+    (1, 'Add artisans.rating_sum', add_artisan_rating_sum),
+    (2, 'Add lookup indexes and unique wishlist/chat pairs', add_lookup_indexes),
+    (3, 'Add full-text search index', add_search_index),
+    (4, 'Add chat last-message columns and history cursor index', add_chat_history_paging),
+    (5, 'Add chat read cursors and unread counters', add_chat_read_cursors),
+    (6, 'Add normalized browse facets and their counts', add_browse_facets),
+    (7, 'Add soft delete columns and ON DELETE CASCADE foreign keys', add_soft_delete_and_cascades),
+    (8, 'Add the pottery product category', add_pottery_category),
+]
+
+
+def current_version(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+    ))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def pending_migrations(conn):
+    """Numbers of the migrations not yet applied, without writing anything"""
+    version = 0
+    if inspect(conn).has_table('schema_version'):
+        version = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    return [number for number, _, _ in MIGRATIONS if number > version]
+
+
+def upgrade(echo=print):
+    """Create missing tables and apply every pending migration in order"""
+    db.create_all()
+    with db.engine.connect() as conn:
+        sqlite = conn.dialect.name == 'sqlite'
+        if sqlite:
+            # Tables are rebuilt in place, which foreign keys would block; they
+            # are checked as a whole before the commit instead. The pragma is
+            # ignored inside a transaction.
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.commit()
+        try:
+            with conn.begin():
+                version = current_version(conn)
+                for number, description, migrate in MIGRATIONS:
+                    if number <= version:
+                        continue
+                    echo(f'Applying migration {number}: {description}')
+                    migrate(conn)
+                    conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': number})
+                if sqlite:
+                    violations = conn.exec_driver_sql("PRAGMA foreign_key_check").all()
+                    if violations:
+                        raise RuntimeError(f'Foreign key violations after migrating: {violations[:10]}')
+        finally:
+            if sqlite:
+                conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+                conn.commit()
+    return MIGRATIONS[-1][0]
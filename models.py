@@ -1,9 +1,14 @@
 from datetime import datetime
 import pytz
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Float, case, cast, event, func, inspect, select
+from sqlalchemy.orm import with_loader_criteria
+
+from database import RoutingSession
+import taxonomy
 
 # Create db instance without app binding
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Set timezone to Asia/Kolkata
 IST = pytz.timezone('Asia/Kolkata')
@@ -11,6 +16,19 @@ IST = pytz.timezone('Asia/Kolkata')
 def get_ist_time():
     return datetime.now(IST)
 
+MESSAGE_PREVIEW_LENGTH = 100
+
+
+class SoftDeleteMixin:
+    """Rows with deleted_at set are hidden from every ORM query
+
+    Pass execution_options(include_deleted=True) to see them. Core queries on
+    the table are not filtered. The rows are hard-deleted later by
+    deletes.purge().
+    """
+    deleted_at = db.Column(db.DateTime, index=True)
+
+
 class User(db.Model):
     __tablename__ = 'users'
     
@@ -21,15 +39,18 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=get_ist_time)
     
     # Relationships
-    wishlists = db.relationship('Wishlist', backref='user', lazy=True, cascade='all, delete-orphan')
-    chats = db.relationship('Chat', backref='user', lazy=True, cascade='all, delete-orphan')
-    ratings = db.relationship('Rating', backref='user', lazy=True, cascade='all, delete-orphan')
+    wishlists = db.relationship('Wishlist', backref='user', lazy=True, cascade='all, delete-orphan',
+                                passive_deletes=True)
+    chats = db.relationship('Chat', backref='user', lazy=True, cascade='all, delete-orphan',
+                            passive_deletes=True)
+    ratings = db.relationship('Rating', backref='user', lazy=True, cascade='all, delete-orphan',
+                              passive_deletes=True)
     
     def __repr__(self):
         return f'<User {self.name}>'
 
 
-class Artisan(db.Model):
+class Artisan(SoftDeleteMixin, db.Model):
     __tablename__ = 'artisans'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -42,29 +63,39 @@ class Artisan(db.Model):
     contact = db.Column(db.String(50))
     image_url = db.Column(db.String(255))
     rating = db.Column(db.Float, default=0.0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     total_ratings = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=get_ist_time)
     
+    # Normalized from craft_type and location on every ORM write (see
+    # taxonomy.py); coordinates are the city's
+    craft_slug = db.Column(db.String(30))
+    city_slug = db.Column(db.String(30))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    
+    __table_args__ = (
+        # Keyset pagination index for the artisan directory
+        db.Index('ix_artisans_rating_id', 'rating', 'id'),
+        # Faceted browse: craft filter by rating, city filter, bounding boxes
+        db.Index('ix_artisans_craft_slug_rating', 'craft_slug', 'rating'),
+        db.Index('ix_artisans_city_slug', 'city_slug'),
+        db.Index('ix_artisans_latitude_longitude', 'latitude', 'longitude'),
+    )
+    
     # Relationships
-    products = db.relationship('Product', backref='artisan', lazy=True, cascade='all, delete-orphan')
-    chats = db.relationship('Chat', backref='artisan', lazy=True, cascade='all, delete-orphan')
-    ratings = db.relationship('Rating', backref='artisan', lazy=True, cascade='all, delete-orphan')
-    
-    def update_rating(self):
-        """Calculate and update average rating"""
-        if self.ratings:
-            total = sum(r.rating for r in self.ratings)
-            self.rating = round(total / len(self.ratings), 1)
-            self.total_ratings = len(self.ratings)
-        else:
-            self.rating = 0.0
-            self.total_ratings = 0
+    products = db.relationship('Product', backref='artisan', lazy=True, cascade='all, delete-orphan',
+                               passive_deletes=True)
+    chats = db.relationship('Chat', backref='artisan', lazy=True, cascade='all, delete-orphan',
+                            passive_deletes=True)
+    ratings = db.relationship('Rating', backref='artisan', lazy=True, cascade='all, delete-orphan',
+                              passive_deletes=True)
     
     def __repr__(self):
         return f'<Artisan {self.name}>'
 
 
-class Product(db.Model):
+class Product(SoftDeleteMixin, db.Model):
     __tablename__ = 'products'
     
     id = db.Column(db.Integer, primary_key=True)
@@ -74,12 +105,19 @@ class Product(db.Model):
     category = db.Column(db.String(100))
     image_url = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=get_ist_time)
+    category_slug = db.Column(db.String(30))  # normalized from category
     
     # Foreign Keys
-    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id'), nullable=False)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_products_category_slug_price', 'category_slug', 'price'),
+        db.Index('ix_products_price', 'price'),
+    )
     
     # Relationships
-    wishlists = db.relationship('Wishlist', backref='product', lazy=True, cascade='all, delete-orphan')
+    wishlists = db.relationship('Wishlist', backref='product', lazy=True, cascade='all, delete-orphan',
+                                passive_deletes=True)
     
     def __repr__(self):
         return f'<Product {self.name}>'
@@ -89,10 +127,13 @@ class Wishlist(db.Model):
     __tablename__ = 'wishlists'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), nullable=False, index=True)
     added_at = db.Column(db.DateTime, default=get_ist_time)
     
+    # One wishlist entry per user per product
+    __table_args__ = (db.Index('unique_user_product_wishlist', 'user_id', 'product_id', unique=True),)
+    
     def __repr__(self):
         return f'<Wishlist User:{self.user_id} Product:{self.product_id}>'
 
@@ -101,8 +142,8 @@ class Rating(db.Model):
     __tablename__ = 'ratings'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id', ondelete='CASCADE'), nullable=False, index=True)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     created_at = db.Column(db.DateTime, default=get_ist_time)
     updated_at = db.Column(db.DateTime, default=get_ist_time, onupdate=get_ist_time)
@@ -118,12 +159,37 @@ class Chat(db.Model):
     __tablename__ = 'chats'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    artisan_id = db.Column(db.Integer, db.ForeignKey('artisans.id', ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=get_ist_time)
     
+    # Denormalized from the newest message so the chat list never reads messages;
+    # last_message_at starts at the creation time so new chats sort first
+    last_message_at = db.Column(db.DateTime, default=get_ist_time)
+    last_message_preview = db.Column(db.String(MESSAGE_PREVIEW_LENGTH))
+    last_message_id = db.Column(db.Integer)
+    
+    # Per-participant read cursors (id of the last message seen) and the
+    # number of messages from the other side since, maintained on insert
+    user_last_read_id = db.Column(db.Integer, nullable=False, default=0)
+    artisan_last_read_id = db.Column(db.Integer, nullable=False, default=0)
+    user_unread_count = db.Column(db.Integer, nullable=False, default=0)
+    artisan_unread_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # One conversation per user per artisan
+        db.Index('unique_user_artisan_chat', 'user_id', 'artisan_id', unique=True),
+        # Chat lists sorted by latest activity
+        db.Index('ix_chats_user_id_last_message_at', 'user_id', 'last_message_at'),
+        db.Index('ix_chats_artisan_id_last_message_at', 'artisan_id', 'last_message_at'),
+        # Unread badges: a range scan over one participant's unread chats
+        db.Index('ix_chats_user_id_user_unread_count', 'user_id', 'user_unread_count'),
+        db.Index('ix_chats_artisan_id_artisan_unread_count', 'artisan_id', 'artisan_unread_count'),
+    )
+    
     # Relationships
-    messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan')
+    messages = db.relationship('Message', backref='chat', lazy=True, cascade='all, delete-orphan',
+                               passive_deletes=True)
     
     def __repr__(self):
         return f'<Chat User:{self.user_id} Artisan:{self.artisan_id}>'
@@ -133,11 +199,320 @@ class Message(db.Model):
     __tablename__ = 'messages'
     
     id = db.Column(db.Integer, primary_key=True)
-    chat_id = db.Column(db.Integer, db.ForeignKey('chats.id'), nullable=False)
+    chat_id = db.Column(db.Integer, db.ForeignKey('chats.id', ondelete='CASCADE'), nullable=False)
     sender_id = db.Column(db.Integer, nullable=False)
     sender_type = db.Column(db.String(20), nullable=False)  # 'user' or 'artisan'
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=get_ist_time)
     
+    # History pages are read newest first by (timestamp, id) cursor
+    __table_args__ = (db.Index('ix_messages_chat_id_timestamp_id', 'chat_id', 'timestamp', 'id'),)
+    
     def __repr__(self):
-        return f'<Message {self.sender_type}:{self.sender_id}>'
\ No newline at end of file
+        return f'<Message {self.sender_type}:{self.sender_id}>'
+
+
+class ProductTrend(db.Model):
+    """Precomputed trending score per product, rebuilt by feeds.refresh()"""
+    __tablename__ = 'product_trends'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (db.Index('ix_product_trends_score', 'score'),)
+
+
+class ProductRecommendation(db.Model):
+    """Products often wishlisted together, rebuilt by feeds.refresh()"""
+    __tablename__ = 'product_recommendations'
+    
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    recommended_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+    
+    # Lookups read one product's recommendations best first; the second index
+    # serves the cascade when a recommended product is deleted
+    __table_args__ = (db.Index('ix_product_recommendations_product_id_score', 'product_id', 'score'),
+                      db.Index('ix_product_recommendations_recommended_id', 'recommended_id'))
+
+
+class StatRollup(db.Model):
+    """Site-wide admin statistics, rebuilt by admin.refresh_stats()
+
+    metric is e.g. 'users.signups' with a day as bucket, 'ratings.stars'
+    with the number of stars, or 'totals' with a table name.
+    """
+    __tablename__ = 'stat_rollups'
+    
+    metric = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+
+class FacetCount(db.Model):
+    """Number of artisans or products per facet value, kept up to date on write
+
+    facet is 'artisans.craft', 'artisans.city', 'products.category' or
+    'products.price'.
+    """
+    __tablename__ = 'facet_counts'
+    
+    facet = db.Column(db.String(30), primary_key=True)
+    value = db.Column(db.String(30), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Rating counters
+# Artisan.rating_sum/total_ratings are kept up to date by applying the delta
+# of every Rating insert, update and delete in the same flush, so a vote never
+# has to load the artisan's other ratings.
+def average_rating(rating_sum, total_ratings):
+    """SQL expression for the rounded average of a rating sum and count"""
+    return case(
+        (total_ratings > 0, func.round(cast(rating_sum, Float) / total_ratings, 1)),
+        else_=0.0,
+    )
+
+def apply_rating_delta(connection, artisan_id, sum_delta, count_delta):
+    """Add a rating delta to an artisan's counters in a single UPDATE"""
+    if not sum_delta and not count_delta:
+        return
+    artisans = Artisan.__table__
+    new_sum = artisans.c.rating_sum + sum_delta
+    new_count = func.coalesce(artisans.c.total_ratings, 0) + count_delta
+    # rating is assigned first so backends that evaluate SET clauses left to
+    # right (MySQL) still see the old counters
+    connection.execute(
+        artisans.update()
+        .where(artisans.c.id == artisan_id)
+        .ordered_values(
+            (artisans.c.rating, average_rating(new_sum, new_count)),
+            (artisans.c.rating_sum, new_sum),
+            (artisans.c.total_ratings, new_count),
+        )
+    )
+
+def reconcile_artisan_ratings(fix=True):
+    """Recompute every artisan's rating counters with one grouped aggregate
+
+    Returns a list of (artisan_id, stored, actual) tuples for artisans whose
+    counters were out of sync, where stored/actual are (sum, count) pairs.
+    Mismatches are repaired when fix is True.
+    """
+    totals = {
+        artisan_id: (rating_sum, count)
+        for artisan_id, rating_sum, count in db.session.query(
+            Rating.artisan_id, func.sum(Rating.rating), func.count(Rating.id)
+        ).group_by(Rating.artisan_id)
+    }
+    stored = db.session.query(Artisan.id, Artisan.rating_sum, Artisan.total_ratings)
+
+    mismatches = []
+    for artisan_id, rating_sum, count in stored:
+        actual = totals.get(artisan_id, (0, 0))
+        if (rating_sum or 0, count or 0) != actual:
+            mismatches.append((artisan_id, (rating_sum, count), actual))
+
+    if fix and mismatches:
+        artisans = Artisan.__table__
+        for artisan_id, _, (rating_sum, count) in mismatches:
+            db.session.execute(
+                artisans.update()
+                .where(artisans.c.id == artisan_id)
+                .values(
+                    rating_sum=rating_sum,
+                    total_ratings=count,
+                    rating=round(rating_sum / count, 1) if count else 0.0,
+                )
+            )
+        db.session.commit()
+    return mismatches
+
+@event.listens_for(Rating, 'after_insert')
+def _rating_inserted(mapper, connection, target):
+    apply_rating_delta(connection, target.artisan_id, target.rating, 1)
+
+@event.listens_for(Rating, 'after_update')
+def _rating_updated(mapper, connection, target):
+    history = inspect(target).attrs.rating.history
+    if history.deleted:
+        apply_rating_delta(connection, target.artisan_id, target.rating - history.deleted[0], 0)
+
+@event.listens_for(Rating, 'after_delete')
+def _rating_deleted(mapper, connection, target):
+    apply_rating_delta(connection, target.artisan_id, -target.rating, -1)
+
+
+# Unread counters
+# Sending a message moves the sender's read cursor to it and adds one to the
+# other participant's unread count, in the same UPDATE that records it as the
+# chat's newest message.
+def other_participant(participant_type):
+    return 'artisan' if participant_type == 'user' else 'user'
+
+def mark_chat_read(chat_id, participant_type):
+    """Move a participant's read cursor to the newest message
+
+    Returns whether anything changed, i.e. the chat had unread messages.
+    """
+    chats = Chat.__table__
+    unread = chats.c[f'{participant_type}_unread_count']
+    result = db.session.execute(
+        chats.update()
+        .where(chats.c.id == chat_id, unread > 0)
+        .values({
+            chats.c[f'{participant_type}_last_read_id']: func.coalesce(chats.c.last_message_id, 0),
+            unread: 0,
+        })
+    )
+    return result.rowcount > 0
+
+@event.listens_for(Message, 'after_insert')
+def _message_inserted(mapper, connection, target):
+    """Record the newest message and unread counts on its chat in the same flush"""
+    chats = Chat.__table__
+    sender = target.sender_type
+    recipient = other_participant(sender)
+    connection.execute(
+        chats.update()
+        .where(chats.c.id == target.chat_id)
+        .values({
+            chats.c.last_message_at: target.timestamp,
+            chats.c.last_message_preview: target.content[:MESSAGE_PREVIEW_LENGTH],
+            chats.c.last_message_id: target.id,
+            chats.c[f'{sender}_last_read_id']: target.id,
+            chats.c[f'{sender}_unread_count']: 0,
+            chats.c[f'{recipient}_unread_count']: chats.c[f'{recipient}_unread_count'] + 1,
+        })
+    )
+
+
+# Facet counts
+# Artisan and product writes through the ORM normalize the free-text columns
+# and add their +1/-1 to facet_counts in the same flush, like the rating
+# counters. Bulk Core inserts call apply_facet_deltas with their rows.
+def artisan_facets(craft_slug, city_slug):
+    return {'artisans.craft': craft_slug, 'artisans.city': city_slug}
+
+def product_facets(category_slug, price):
+    return {'products.category': category_slug,
+            'products.price': taxonomy.price_band(price) if price is not None else None}
+
+def apply_facet_deltas(connection, deltas):
+    """Add {(facet, value): delta} to facet_counts"""
+    facets = FacetCount.__table__
+    for (facet, value), delta in deltas.items():
+        if value is None or not delta:
+            continue
+        updated = connection.execute(
+            facets.update()
+            .where(facets.c.facet == facet, facets.c.value == value)
+            .values(count=facets.c.count + delta)
+        ).rowcount
+        if not updated:
+            connection.execute(facets.insert().values(facet=facet, value=value, count=delta))
+
+def _facet_changes(old, new):
+    deltas = {}
+    for facet in set(old) | set(new):
+        if old.get(facet) != new.get(facet):
+            deltas[facet, old.get(facet)] = deltas.get((facet, old.get(facet)), 0) - 1
+            deltas[facet, new.get(facet)] = deltas.get((facet, new.get(facet)), 0) + 1
+    return deltas
+
+def _previous(target, attribute):
+    history = inspect(target).attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(target, attribute)
+
+def price_band_expression(price):
+    """SQL expression for taxonomy.price_band() of a price column"""
+    return case(
+        *[(price < upper, taxonomy.price_band(upper - 1)) for upper in taxonomy.PRICE_BANDS],
+        else_=taxonomy.price_band(taxonomy.PRICE_BANDS[-1]),
+    )
+
+def rebuild_facet_counts(connection, exclude_deleted=True):
+    """Recount every facet with grouped aggregates; returns the number of values
+
+    Runs on the given connection so migrations can use it; the caller commits.
+    Migrations from before deleted_at existed pass exclude_deleted=False.
+    """
+    artisans, products = Artisan.__table__, Product.__table__
+    band = price_band_expression(products.c.price)
+    rows = []
+    for facet, table, column in (('artisans.craft', artisans, artisans.c.craft_slug),
+                                 ('artisans.city', artisans, artisans.c.city_slug),
+                                 ('products.category', products, products.c.category_slug),
+                                 ('products.price', products, band)):
+        query = select(column, func.count()).select_from(table).group_by(column)
+        if exclude_deleted:
+            query = query.where(table.c.deleted_at.is_(None))
+        counts = connection.execute(query)
+        rows.extend({'facet': facet, 'value': value, 'count': count}
+                    for value, count in counts if value is not None)
+
+    connection.execute(FacetCount.__table__.delete())
+    if rows:
+        connection.execute(FacetCount.__table__.insert(), rows)
+    return len(rows)
+
+@event.listens_for(Artisan, 'before_insert')
+@event.listens_for(Artisan, 'before_update')
+def _normalize_artisan(mapper, connection, target):
+    target.craft_slug = taxonomy.craft_slug(target.craft_type)
+    target.city_slug = taxonomy.city_slug(target.location)
+    target.latitude, target.longitude = taxonomy.city_coordinates(target.city_slug)
+
+@event.listens_for(Product, 'before_insert')
+@event.listens_for(Product, 'before_update')
+def _normalize_product(mapper, connection, target):
+    target.category_slug = taxonomy.category_slug(target.category)
+
+# Soft-deleted rows no longer count towards any facet
+def _artisan_facets(target, previous=False):
+    value = _previous if previous else getattr
+    if value(target, 'deleted_at') is not None:
+        return {}
+    return artisan_facets(value(target, 'craft_slug'), value(target, 'city_slug'))
+
+def _product_facets(target, previous=False):
+    value = _previous if previous else getattr
+    if value(target, 'deleted_at') is not None:
+        return {}
+    return product_facets(value(target, 'category_slug'), value(target, 'price'))
+
+@event.listens_for(Artisan, 'after_insert')
+def _artisan_inserted(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes({}, _artisan_facets(target)))
+
+@event.listens_for(Artisan, 'after_update')
+def _artisan_updated(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes(_artisan_facets(target, previous=True), _artisan_facets(target)))
+
+@event.listens_for(Artisan, 'after_delete')
+def _artisan_deleted(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes(_artisan_facets(target), {}))
+
+@event.listens_for(Product, 'after_insert')
+def _product_inserted(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes({}, _product_facets(target)))
+
+@event.listens_for(Product, 'after_update')
+def _product_updated(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes(_product_facets(target, previous=True), _product_facets(target)))
+
+@event.listens_for(Product, 'after_delete')
+def _product_deleted(mapper, connection, target):
+    apply_facet_deltas(connection, _facet_changes(_product_facets(target), {}))
+
+
+# Soft delete scope
+@event.listens_for(db.session, 'do_orm_execute')
+def _exclude_deleted(execute_state):
+    if (execute_state.is_select and not execute_state.is_column_load
+            and not execute_state.is_relationship_load
+            and not execute_state.execution_options.get('include_deleted', False)):
+        execute_state.statement = execute_state.statement.options(with_loader_criteria(
+            SoftDeleteMixin, lambda cls: cls.deleted_at.is_(None), include_aliases=True))
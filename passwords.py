@@ -0,0 +1,103 @@
+"""Password hashing off the request thread.
+
+Hashing is deliberately slow, so it runs in a small process pool rather than
+on the worker handling the request. At most PASSWORD_HASH_MAX_PENDING hashes
+may be queued or running; a request that can't get a slot within
+PASSWORD_HASH_WAIT seconds fails with HashingBusy (503) instead of piling up.
+The pool's processes are started from a fresh interpreter rather than forked,
+since the web and job threads of the process that creates it may hold locks.
+
+Config:
+    PASSWORD_HASH_METHOD       werkzeug method string, e.g. 'scrypt:32768:8:1'
+                               or 'pbkdf2:sha256:1000000'. Stored hashes made
+                               with other parameters are upgraded on login.
+    PASSWORD_HASH_WORKERS      pool processes; 0 hashes inline
+    PASSWORD_HASH_MAX_PENDING  hashes allowed in flight before back-pressure
+    PASSWORD_HASH_WAIT         seconds to wait for a slot
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(Exception):
+    """Too many password hashes are already in flight"""
+
+
+class PasswordHasher:
+    def __init__(self, method=DEFAULT_METHOD, workers=2, max_pending=16, wait=5):
+        self.method = method
+        self.workers = workers
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._prefix = None
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(start_method))
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.wait):
+            raise HashingBusy()
+        try:
+            if not self.workers:
+                return func(*args)
+            return self._get_pool().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        """Whether a stored hash was made with different parameters"""
+        if self._prefix is None:
+            # werkzeug fills in defaults ('pbkdf2' -> 'pbkdf2:sha256:<n>'),
+            # so compare against the method it actually writes; that takes a
+            # full hash, made in the pool like any other
+            self._prefix = self.hash('').split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._prefix
+
+
+def init_app(app):
+    app.extensions['passwords'] = PasswordHasher(
+        app.config['PASSWORD_HASH_METHOD'],
+        app.config['PASSWORD_HASH_WORKERS'],
+        app.config['PASSWORD_HASH_MAX_PENDING'],
+        app.config['PASSWORD_HASH_WAIT'],
+    )
+
+    @app.errorhandler(HashingBusy)
+    def hashing_busy(error):
+        retry_after = str(app.config['PASSWORD_HASH_WAIT'])
+        return 'The server is busy, please try again in a few seconds.', 503, {'Retry-After': retry_after}
+
+
+def _hasher():
+    return current_app.extensions['passwords']
+
+
+def hash_password(password):
+    return _hasher().hash(password)
+
+
+def verify_password(stored_hash, password):
+    return _hasher().verify(stored_hash, password)
+
+
+def needs_rehash(stored_hash):
+    return _hasher().needs_rehash(stored_hash)
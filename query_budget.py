@@ -0,0 +1,79 @@
+"""Per-request SQL statement counting with a configurable budget.
+
+Every statement executed while handling a request is counted. When the
+budget is enabled and a route goes over it, the overrun is logged, or
+raised as QueryBudgetExceeded when SQL_QUERY_BUDGET_RAISE is set (the
+default under app.testing) so N+1 regressions fail the tests. The error is
+raised in place of the first statement over the budget, so the view never
+gets to commit and its transaction is rolled back.
+
+This module holds the app's only before_cursor_execute listener; other
+instrumentation (metrics.py) hooks into it with on_statement() rather than
+adding its own.
+
+Routes whose statement count grows with the data they handle, such as
+batched imports, are exempted in SQL_QUERY_BUDGETS (see config.py).
+
+Config:
+    SQL_QUERY_BUDGET          default budget per request; None disables it
+                              (defaults to DEFAULT_BUDGET in debug/testing)
+    SQL_QUERY_BUDGETS         {endpoint: budget} overrides
+    SQL_QUERY_BUDGET_RAISE    raise instead of logging (defaults to app.testing)
+"""
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_BUDGET = 10
+
+
+_statement_hooks = []
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def on_statement(func):
+    """Call func(conn, statement) before every SQL statement is executed"""
+    _statement_hooks.append(func)
+    return func
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for hook in _statement_hooks:
+        hook(conn, statement)
+    if has_app_context() and 'sql_query_count' in g:
+        g.sql_query_count += 1
+        budget = g.sql_query_budget
+        if g.sql_query_budget_raise and budget is not None and g.sql_query_count > budget:
+            raise QueryBudgetExceeded(f'{request.endpoint} went over its budget of {budget} SQL statements '
+                                      f'at: {statement}')
+
+
+def get_query_count():
+    """Number of SQL statements run so far in the current request"""
+    return g.get('sql_query_count', 0)
+
+
+def budget_for(app, endpoint):
+    default = DEFAULT_BUDGET if app.debug or app.testing else None
+    budget = app.config.get('SQL_QUERY_BUDGET', default)
+    return app.config['SQL_QUERY_BUDGETS'].get(endpoint, budget)
+
+
+def init_app(app):
+    @app.before_request
+    def start_query_count():
+        g.sql_query_count = 0
+        g.sql_query_budget = budget_for(app, request.endpoint)
+        g.sql_query_budget_raise = app.config.get('SQL_QUERY_BUDGET_RAISE', app.testing)
+
+    @app.after_request
+    def check_query_budget(response):
+        # Overruns have already been raised when SQL_QUERY_BUDGET_RAISE is set
+        budget, count = g.sql_query_budget, get_query_count()
+        if budget is not None and count > budget:
+            app.logger.warning('%s ran %d SQL statements (budget %d)', request.endpoint, count, budget)
+        return response
@@ -0,0 +1,41 @@
+"""Fixed-window attempt limits, e.g. login attempts per IP and per email.
+
+Counters live in process memory, so with several worker processes each one
+enforces the limit separately.
+"""
+import threading
+import time
+
+# Expired windows are swept once this many keys are tracked
+SWEEP_THRESHOLD = 10000
+
+
+class RateLimiter:
+    def __init__(self, limit, window):
+        """Allow `limit` attempts per key in each `window` seconds"""
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._windows = {}  # key -> (window start, attempts)
+
+    def hit(self, key):
+        """Record an attempt; returns 0 if allowed, else seconds until the window resets"""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._windows) >= SWEEP_THRESHOLD:
+                self._sweep(now)
+            start, attempts = self._windows.get(key, (now, 0))
+            if now - start >= self.window:
+                start, attempts = now, 0
+            if attempts >= self.limit:
+                return max(1, int(start + self.window - now + 0.5))
+            self._windows[key] = (start, attempts + 1)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._windows.pop(key, None)
+
+    def _sweep(self, now):
+        self._windows = {key: value for key, value in self._windows.items()
+                         if now - value[0] < self.window}
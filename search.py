@@ -0,0 +1,119 @@
+"""Full-text search over products and artisans.
+
+On SQLite the searchable columns are indexed in external-content FTS5 tables
+(products_fts, artisans_fts) kept in sync by triggers on the base tables, so
+raw SQL and bulk inserts stay indexed too. Other databases fall back to a
+LIKE scan.
+"""
+import re
+
+from sqlalchemy import column, func, or_, table, text
+
+from models import db, Artisan, Product
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+FTS_TABLES = {
+    'products_fts': ('products', ['name', 'description', 'category']),
+    'artisans_fts': ('artisans', ['name', 'craft_type', 'location', 'bio']),
+}
+
+products_fts = table('products_fts', column('rowid'), column('rank'))
+artisans_fts = table('artisans_fts', column('rowid'), column('rank'))
+
+
+def fts_enabled(bind=None):
+    return (bind or db.engine).dialect.name == 'sqlite'
+
+
+def _index_ddl(fts_name, source, columns):
+    cols = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    insert_new = f"INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_values});"
+    delete_old = (f"INSERT INTO {fts_name}({fts_name}, rowid, {cols}) "
+                  f"VALUES ('delete', old.id, {old_values});")
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts_name} USING fts5(
+                {cols}, content='{source}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {source} BEGIN
+                {insert_new}
+            END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {source} BEGIN
+                {delete_old}
+            END""",
+        # Only searchable columns fire the update trigger, so rating counter
+        # updates on artisans don't touch the index
+        f"""CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE OF {cols} ON {source} BEGIN
+                {delete_old}
+                {insert_new}
+            END""",
+    ]
+
+
+def create_index(conn):
+    """Create the FTS tables and their sync triggers if they don't exist"""
+    if not fts_enabled(conn):
+        return
+    for fts_name, (source, columns) in FTS_TABLES.items():
+        for statement in _index_ddl(fts_name, source, columns):
+            conn.execute(text(statement))
+
+
+def rebuild_index(conn):
+    """Re-index every existing product and artisan"""
+    if not fts_enabled(conn):
+        return
+    for fts_name in FTS_TABLES:
+        conn.execute(text(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')"))
+
+
+def to_match_query(query):
+    """Turn free text into an FTS5 query where every word is a prefix match"""
+    return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+
+def _like_filter(columns, query):
+    """Fallback for databases without FTS5: every word in any column"""
+    return [or_(*[c.ilike(f'%{token}%') for c in columns]) for token in TOKEN_RE.findall(query)]
+
+
+def search_products(query, category=None, min_price=None, max_price=None, limit=20):
+    """Products matching the query, best match first"""
+    match = to_match_query(query)
+    if not match:
+        return []
+    products = Product.query
+    if fts_enabled():
+        products = (products
+                    .join(products_fts, products_fts.c.rowid == Product.id)
+                    .filter(text('products_fts MATCH :match').bindparams(match=match))
+                    .order_by(products_fts.c.rank))
+    else:
+        columns = [Product.name, Product.description, Product.category]
+        products = products.filter(*_like_filter(columns, query)).order_by(Product.id.desc())
+    if category:
+        products = products.filter(func.lower(Product.category) == category.lower())
+    if min_price is not None:
+        products = products.filter(Product.price >= min_price)
+    if max_price is not None:
+        products = products.filter(Product.price <= max_price)
+    return products.limit(limit).all()
+
+
+def search_artisans(query, limit=20):
+    """Artisans matching the query, best match first"""
+    match = to_match_query(query)
+    if not match:
+        return []
+    artisans = Artisan.query
+    if fts_enabled():
+        artisans = (artisans
+                    .join(artisans_fts, artisans_fts.c.rowid == Artisan.id)
+                    .filter(text('artisans_fts MATCH :match').bindparams(match=match))
+                    .order_by(artisans_fts.c.rank))
+    else:
+        columns = [Artisan.name, Artisan.craft_type, Artisan.location, Artisan.bio]
+        artisans = artisans.filter(*_like_filter(columns, query)).order_by(Artisan.rating.desc())
+    return artisans.limit(limit).all()
@@ -0,0 +1,269 @@
+"""Synthetic data generator for load testing.
+
+Bulk-loads users, artisans, products, ratings, wishlists, chats and messages
+with Core executemany inserts in batches, appending to whatever is already in
+the database. Denormalized columns (artisan rating counters, chat last
+message and unread counters, browse slugs) are filled in directly, and facet
+counts are rebuilt at the end since bulk inserts skip the ORM events.
+
+Every seeded account uses the password SEED_PASSWORD so the benchmark can
+log in. Runs are reproducible for a given random seed.
+"""
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from models import (db, IST, MESSAGE_PREVIEW_LENGTH, User, Artisan, Product, Wishlist, Rating, Chat, Message,
+                    rebuild_facet_counts)
+import taxonomy
+
+SEED_PASSWORD = 'seed-password'
+SEED_EMAIL_DOMAIN = 'seed.kalamitra.test'
+
+# Row counts at scale 1.0
+FULL_SCALE = {
+    'users': 100_000,
+    'artisans': 20_000,
+    'products': 500_000,
+    'ratings': 2_000_000,
+    'wishlists': 1_000_000,
+    'chats': 200_000,
+    'messages': 2_000_000,
+}
+
+CRAFTS = ['Pottery', 'Weaving', 'Woodwork', 'Embroidery', 'Metalwork', 'Painting',
+          'Jewellery', 'Block Printing', 'Basketry', 'Leatherwork']
+LOCATIONS = ['Jaipur', 'Varanasi', 'Kutch', 'Mysuru', 'Kolkata', 'Srinagar',
+             'Madhubani', 'Channapatna', 'Bhuj', 'Pune', 'Lucknow', 'Guwahati']
+CATEGORIES = ['Home Decor', 'Textiles', 'Jewellery', 'Kitchenware', 'Art', 'Accessories', 'Toys']
+ADJECTIVES = ['Handmade', 'Hand-painted', 'Carved', 'Woven', 'Embroidered', 'Rustic', 'Vintage', 'Glazed']
+NOUNS = ['Bowl', 'Vase', 'Scarf', 'Shawl', 'Lamp', 'Tray', 'Necklace', 'Wall Hanging',
+         'Cushion Cover', 'Planter', 'Coaster Set', 'Bangle', 'Basket', 'Mirror Frame']
+FIRST_NAMES = ['Aarav', 'Priya', 'Rohan', 'Ananya', 'Vikram', 'Meera', 'Arjun', 'Kavya',
+               'Ishaan', 'Diya', 'Kabir', 'Nisha', 'Rahul', 'Sneha', 'Aditya', 'Pooja']
+LAST_NAMES = ['Sharma', 'Patel', 'Iyer', 'Das', 'Khan', 'Reddy', 'Singh', 'Mehta',
+              'Nair', 'Gupta', 'Bose', 'Joshi']
+PHRASES = ['Is this still available?', 'Can you ship to Bengaluru?', 'Thank you!',
+           'What is the delivery time?', 'Do you take custom orders?', 'Yes, it is available.',
+           'I can ship it next week.', 'Could you share more photos?', 'The price is negotiable.']
+
+
+def scaled_counts(scale=1.0, **overrides):
+    """FULL_SCALE row counts multiplied by scale, with explicit overrides"""
+    counts = {name: max(1, int(count * scale)) for name, count in FULL_SCALE.items()}
+    counts.update({name: value for name, value in overrides.items() if value is not None})
+    return counts
+
+
+def _next_id(model):
+    return (db.session.scalar(select(func.max(model.id))) or 0) + 1
+
+
+def _now():
+    # Naive IST, the same wall-clock values the app stores
+    return datetime.now(IST).replace(tzinfo=None)
+
+
+def _spread(total, buckets, rng):
+    """Split total into buckets parts with a long tail, like real popularity"""
+    weights = [rng.paretovariate(1.5) for _ in range(buckets)]
+    scale = total / sum(weights)
+    parts = [int(w * scale) for w in weights]
+    for i in rng.sample(range(buckets), min(buckets, total - sum(parts))):
+        parts[i] += 1
+    return parts
+
+
+class Seeder:
+    def __init__(self, counts, batch_size=5000, random_seed=42, echo=print):
+        self.counts = counts
+        self.batch_size = batch_size
+        self.rng = random.Random(random_seed)
+        self.echo = echo
+        self.password_hash = generate_password_hash(SEED_PASSWORD)
+        self.now = _now()
+
+    def _insert(self, model, rows, after_batch=None):
+        """Insert an iterable of row dicts in committed batches; returns the count
+
+        after_batch is called once each batch is committed, for child rows
+        that must follow their parents.
+        """
+        table = model.__table__
+        batch, total = [], 0
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                total += self._write(table, batch, after_batch)
+                batch = []
+        if batch:
+            total += self._write(table, batch, after_batch)
+        self.echo(f'{table.name}: {total} rows')
+        return total
+
+    def _write(self, table, batch, after_batch):
+        db.session.execute(insert(table), batch)
+        db.session.commit()
+        if after_batch:
+            after_batch()
+        return len(batch)
+
+    def _past(self, max_days=365):
+        return self.now - timedelta(seconds=self.rng.randrange(max_days * 86400))
+
+    def _name(self):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}'
+
+    def run(self):
+        rng, counts = self.rng, self.counts
+        first_user = _next_id(User)
+        first_artisan = _next_id(Artisan)
+        first_product = _next_id(Product)
+        first_chat = _next_id(Chat)
+        user_ids = range(first_user, first_user + counts['users'])
+        artisan_ids = range(first_artisan, first_artisan + counts['artisans'])
+        product_ids = range(first_product, first_product + counts['products'])
+
+        self._insert(User, (
+            {'id': user_id, 'name': self._name(), 'email': f'user{user_id}@{SEED_EMAIL_DOMAIN}',
+             'password': self.password_hash, 'created_at': self._past()}
+            for user_id in user_ids
+        ))
+
+        # Ratings are generated per artisan so the counters can be written
+        # with the artisan row
+        ratings_per_artisan = _spread(counts['ratings'], len(artisan_ids), rng)
+        ratings_per_artisan = [min(n, len(user_ids)) for n in ratings_per_artisan]
+        artisan_ratings = {}
+
+        def artisan_rows():
+            for artisan_id, rating_count in zip(artisan_ids, ratings_per_artisan):
+                stars = [rng.choices((1, 2, 3, 4, 5), (1, 1, 3, 6, 6))[0] for _ in range(rating_count)]
+                artisan_ratings[artisan_id] = stars
+                craft, location = rng.choice(CRAFTS), rng.choice(LOCATIONS)
+                city = taxonomy.city_slug(location)
+                latitude, longitude = taxonomy.city_coordinates(city)
+                yield {
+                    'id': artisan_id, 'name': self._name(),
+                    'email': f'artisan{artisan_id}@{SEED_EMAIL_DOMAIN}',
+                    'password': self.password_hash, 'craft_type': craft, 'location': location,
+                    'craft_slug': taxonomy.craft_slug(craft), 'city_slug': city,
+                    'latitude': latitude, 'longitude': longitude,
+                    'bio': f'{rng.choice(CRAFTS)} artisan from {rng.choice(LOCATIONS)}.',
+                    'contact': f'+91 9{rng.randrange(10**9):09d}',
+                    'rating': round(sum(stars) / len(stars), 1) if stars else 0.0,
+                    'rating_sum': sum(stars), 'total_ratings': len(stars),
+                    'created_at': self._past(),
+                }
+
+        self._insert(Artisan, artisan_rows())
+
+        def rating_rows():
+            for artisan_id in artisan_ids:
+                stars = artisan_ratings.pop(artisan_id)
+                raters = rng.sample(user_ids, len(stars))
+                for user_id, value in zip(raters, stars):
+                    created_at = self._past()
+                    yield {'user_id': user_id, 'artisan_id': artisan_id, 'rating': value,
+                           'created_at': created_at, 'updated_at': created_at}
+
+        self._insert(Rating, rating_rows())
+
+        products_per_artisan = _spread(len(product_ids), len(artisan_ids), rng)
+
+        def product_rows():
+            product_id = first_product
+            for artisan_id, product_count in zip(artisan_ids, products_per_artisan):
+                for _ in range(product_count):
+                    noun, category = rng.choice(NOUNS), rng.choice(CATEGORIES)
+                    yield {
+                        'id': product_id, 'artisan_id': artisan_id,
+                        'name': f'{rng.choice(ADJECTIVES)} {noun}',
+                        'description': f'{rng.choice(ADJECTIVES)} {noun.lower()} made by hand.',
+                        'price': round(rng.uniform(99, 9999), 2),
+                        'category': category, 'category_slug': taxonomy.category_slug(category),
+                        'created_at': self._past(),
+                    }
+                    product_id += 1
+
+        self._insert(Product, product_rows())
+        rebuild_facet_counts(db.session.connection())
+        db.session.commit()
+
+        wishlists_per_user = _spread(counts['wishlists'], len(user_ids), rng)
+
+        def wishlist_rows():
+            for user_id, wishlist_count in zip(user_ids, wishlists_per_user):
+                for product_id in rng.sample(product_ids, min(wishlist_count, len(product_ids))):
+                    yield {'user_id': user_id, 'product_id': product_id, 'added_at': self._past()}
+
+        self._insert(Wishlist, wishlist_rows())
+
+        # Chats and their messages: each chat's messages follow its creation
+        # time, and the last one is copied onto the chat row. Message ids are
+        # assigned here so read cursors can point at them; each side has read
+        # up to its own last message, or everything half the time
+        chats_per_user = _spread(counts['chats'], len(user_ids), rng)
+        chat_count = sum(min(n, len(artisan_ids)) for n in chats_per_user)
+        messages_per_chat = _spread(counts['messages'], chat_count, rng)
+        chat_messages = []
+        message_ids = itertools.count(_next_id(Message))
+
+        def chat_rows():
+            chat_id = first_chat
+            for user_id, user_chats in zip(user_ids, chats_per_user):
+                for artisan_id in rng.sample(artisan_ids, min(user_chats, len(artisan_ids))):
+                    created_at = self._past(90)
+                    last_at, preview, message_id = created_at, None, None
+                    last_read = {'user': 0, 'artisan': 0}
+                    unread = {'user': 0, 'artisan': 0}
+                    for _ in range(messages_per_chat[chat_id - first_chat]):
+                        last_at = min(last_at + timedelta(seconds=rng.randrange(60, 86400)), self.now)
+                        from_user = rng.random() < 0.5
+                        sender, recipient = ('user', 'artisan') if from_user else ('artisan', 'user')
+                        preview = rng.choice(PHRASES)
+                        message_id = next(message_ids)
+                        last_read[sender], unread[sender] = message_id, 0
+                        unread[recipient] += 1
+                        chat_messages.append({
+                            'id': message_id, 'chat_id': chat_id,
+                            'sender_id': user_id if from_user else artisan_id,
+                            'sender_type': sender, 'content': preview, 'timestamp': last_at,
+                        })
+                    row = {
+                        'id': chat_id, 'user_id': user_id, 'artisan_id': artisan_id,
+                        'created_at': created_at, 'last_message_at': last_at,
+                        'last_message_preview': preview and preview[:MESSAGE_PREVIEW_LENGTH],
+                        'last_message_id': message_id,
+                    }
+                    for side in ('user', 'artisan'):
+                        if message_id and rng.random() < 0.5:
+                            last_read[side], unread[side] = message_id, 0
+                        row[f'{side}_last_read_id'] = last_read[side]
+                        row[f'{side}_unread_count'] = unread[side]
+                    yield row
+                    chat_id += 1
+
+        messages_written = 0
+
+        def write_messages():
+            # Runs after each chat batch, so messages never precede their chat
+            nonlocal messages_written
+            for start in range(0, len(chat_messages), self.batch_size):
+                db.session.execute(insert(Message.__table__), chat_messages[start:start + self.batch_size])
+            db.session.commit()
+            messages_written += len(chat_messages)
+            chat_messages.clear()
+
+        self._insert(Chat, chat_rows(), after_batch=write_messages)
+        self.echo(f'messages: {messages_written} rows')
+
+
+def seed(scale=1.0, batch_size=5000, random_seed=42, echo=print, **overrides):
+    """Generate synthetic data; returns the row counts that were requested"""
+    counts = scaled_counts(scale, **overrides)
+    Seeder(counts, batch_size, random_seed, echo).run()
+    return counts
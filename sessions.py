@@ -0,0 +1,209 @@
+"""Server-side sessions behind a small opaque cookie.
+
+The cookie holds only a random session id; the session data stays on the
+server in one of two stores:
+
+    MemorySessionStore  in-process dict (default); sessions are lost on
+                        restart and not shared between worker processes
+    SQLiteSessionStore  table in a local SQLite file shared by every worker
+                        on the host
+
+Select with SESSION_STORE_URL: unset for memory, or sqlite:///path/to/sessions.db.
+Signed-in sessions expire after PERMANENT_SESSION_LIFETIME of inactivity,
+anonymous ones (e.g. holding the flash message of a failed login) after
+SESSION_ANONYMOUS_LIFETIME seconds, so sessions anyone can create don't pile
+up. Call session.regenerate() after login so a session id seen before
+authentication can't be reused.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+serializer = TaggedJSONSerializer()
+
+# Seconds between sweeps of expired sessions, run by the next write
+SWEEP_INTERVAL = 60
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.modified = False
+        self.accessed = False
+        self.previous_sid = None
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Move the session to a fresh id, dropping the old one"""
+        if self.sid and self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class MemorySessionStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # sid -> (expires_at, payload)
+        self._last_sweep = time.time()
+
+    def get(self, sid):
+        entry = self._sessions.get(sid)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry
+
+    def set(self, sid, payload, expires_at):
+        with self._lock:
+            self._sessions[sid] = (expires_at, payload)
+            now = time.time()
+            if now - self._last_sweep >= SWEEP_INTERVAL:
+                self._last_sweep = now
+                self._sessions = {k: v for k, v in self._sessions.items() if v[0] >= now}
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._last_sweep = time.time()
+
+    def _connect(self):
+        # Per thread and process, opened on first use like the cache's
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, sid):
+        row = self._connect().execute(
+            "SELECT expires_at, payload FROM sessions WHERE sid = ? AND expires_at >= ?",
+            (sid, time.time()),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def set(self, sid, payload, expires_at):
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO sessions (sid, payload, expires_at) VALUES (?, ?, ?)",
+                     (sid, payload, expires_at))
+        now = time.time()
+        if now - self._last_sweep >= SWEEP_INTERVAL:
+            self._last_sweep = now
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+
+    def delete(self, sid):
+        self._connect().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+
+def create_store(url=None):
+    if url and url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):])
+    return MemorySessionStore()
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSideSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        entry = self.store.get(sid) if sid else None
+        if entry is None:
+            return self.session_class()
+        expires_at, payload = entry
+        return self.session_class(serializer.loads(payload), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+
+        if not session:
+            if session.sid or session.previous_sid:
+                if session.sid:
+                    self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+                response.vary.add('Cookie')
+            return
+
+        if 'user_id' in session:
+            lifetime = app.permanent_session_lifetime.total_seconds()
+        else:
+            lifetime = app.config['SESSION_ANONYMOUS_LIFETIME']
+        now = time.time()
+        # Unchanged sessions are only rewritten once half their lifetime has
+        # passed, which keeps reads from turning into writes
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (session.modified or stale):
+            return
+
+        new_sid = session.sid is None
+        if new_sid:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.set(session.sid, serializer.dumps(dict(session)), now + lifetime)
+
+        if new_sid or session.permanent:
+            response.set_cookie(
+                name,
+                session.sid,
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+            response.vary.add('Cookie')
+
+
+def init_app(app):
+    app.session_interface = ServerSideSessionInterface(create_store(app.config['SESSION_STORE_URL']))
@@ -0,0 +1,147 @@
+"""Normalized crafts, product categories, cities and price bands.
+
+Artisans and products describe themselves in free text ("Pottery and clay
+art", "Varanasi ,Uttar Pradesh", "Home decor"). The functions here map that
+text onto a fixed vocabulary of slugs that can be indexed, filtered on and
+counted. A text matches the first entry with a keyword that starts one of
+its words; crafts and categories that match nothing fall back to 'other',
+unknown places to None.
+"""
+import re
+
+WORD_RE = re.compile(r'[^\W\d_]+', re.UNICODE)
+
+OTHER = 'other'
+
+# slug: (label, keywords)
+CRAFTS = {
+    'pottery': ('Pottery', ('pottery', 'potter', 'clay', 'ceramic', 'terracotta')),
+    'weaving': ('Weaving', ('weav', 'handloom', 'loom', 'textile', 'ikat')),
+    'woodwork': ('Woodwork', ('wood', 'carving', 'lacquer')),
+    'embroidery': ('Embroidery', ('embroider', 'chikan', 'phulkari', 'zari', 'kantha')),
+    'metalwork': ('Metalwork', ('metal', 'brass', 'copper', 'bidri', 'dhokra')),
+    'block-printing': ('Block Printing', ('block', 'ajrakh', 'bagru', 'kalamkari')),
+    'painting': ('Painting', ('paint', 'madhubani', 'warli', 'pattachitra', 'miniature')),
+    'jewellery': ('Jewellery', ('jewel', 'bead', 'kundan')),
+    'basketry': ('Basketry', ('basket', 'cane', 'bamboo')),
+    'leatherwork': ('Leatherwork', ('leather', 'mojari', 'jutti')),
+    OTHER: ('Other', ()),
+}
+
+CATEGORIES = {
+    'pottery': ('Pottery & Ceramics', ('pottery', 'ceramic', 'terracotta', 'clay')),
+    'home-decor': ('Home Decor', ('home', 'decor', 'lamp', 'vase', 'wall')),
+    'textiles': ('Textiles', ('textile', 'fabric', 'saree', 'sari', 'shawl', 'scarf', 'stole', 'cushion')),
+    'jewellery': ('Jewellery', ('jewel', 'necklace', 'bangle', 'earring')),
+    'kitchenware': ('Kitchenware', ('kitchen', 'cookware', 'tableware', 'crockery')),
+    'art': ('Art', ('art', 'painting', 'sculpture')),
+    'accessories': ('Accessories', ('accessor', 'bag', 'wallet', 'footwear')),
+    'toys': ('Toys', ('toy', 'doll', 'game')),
+    OTHER: ('Other', ()),
+}
+
+# slug: (name, state, latitude, longitude, other spellings)
+CITIES = {
+    'agra': ('Agra', 'Uttar Pradesh', 27.1767, 78.0081, ()),
+    'ahmedabad': ('Ahmedabad', 'Gujarat', 23.0225, 72.5714, ()),
+    'amritsar': ('Amritsar', 'Punjab', 31.6340, 74.8723, ()),
+    'bengaluru': ('Bengaluru', 'Karnataka', 12.9716, 77.5946, ('bangalore',)),
+    'bhopal': ('Bhopal', 'Madhya Pradesh', 23.2599, 77.4126, ()),
+    'bhubaneswar': ('Bhubaneswar', 'Odisha', 20.2961, 85.8245, ()),
+    'bhuj': ('Bhuj', 'Gujarat', 23.2420, 69.6669, ()),
+    'chandigarh': ('Chandigarh', 'Chandigarh', 30.7333, 76.7794, ()),
+    'channapatna': ('Channapatna', 'Karnataka', 12.6518, 77.2089, ()),
+    'chennai': ('Chennai', 'Tamil Nadu', 13.0827, 80.2707, ('madras',)),
+    'delhi': ('Delhi', 'Delhi', 28.6139, 77.2090, ('new delhi',)),
+    'guwahati': ('Guwahati', 'Assam', 26.1445, 91.7362, ()),
+    'hyderabad': ('Hyderabad', 'Telangana', 17.3850, 78.4867, ()),
+    'jaipur': ('Jaipur', 'Rajasthan', 26.9124, 75.7873, ()),
+    'jodhpur': ('Jodhpur', 'Rajasthan', 26.2389, 73.0243, ()),
+    'kanchipuram': ('Kanchipuram', 'Tamil Nadu', 12.8342, 79.7036, ('kanchi',)),
+    'kochi': ('Kochi', 'Kerala', 9.9312, 76.2673, ('cochin',)),
+    'kolkata': ('Kolkata', 'West Bengal', 22.5726, 88.3639, ('calcutta',)),
+    'kutch': ('Kutch', 'Gujarat', 23.7337, 69.8597, ('kachchh',)),
+    'lucknow': ('Lucknow', 'Uttar Pradesh', 26.8467, 80.9462, ()),
+    'madhubani': ('Madhubani', 'Bihar', 26.3483, 86.0712, ()),
+    'moradabad': ('Moradabad', 'Uttar Pradesh', 28.8386, 78.7733, ()),
+    'mumbai': ('Mumbai', 'Maharashtra', 19.0760, 72.8777, ('bombay',)),
+    'mysuru': ('Mysuru', 'Karnataka', 12.2958, 76.6394, ('mysore',)),
+    'patna': ('Patna', 'Bihar', 25.5941, 85.1376, ()),
+    'pune': ('Pune', 'Maharashtra', 18.5204, 73.8567, ('poona',)),
+    'shimla': ('Shimla', 'Himachal Pradesh', 31.1048, 77.1734, ()),
+    'srinagar': ('Srinagar', 'Jammu and Kashmir', 34.0837, 74.7973, ()),
+    'surat': ('Surat', 'Gujarat', 21.1702, 72.8311, ()),
+    'thanjavur': ('Thanjavur', 'Tamil Nadu', 10.7870, 79.1378, ('tanjore',)),
+    'udaipur': ('Udaipur', 'Rajasthan', 24.5854, 73.7125, ()),
+    'varanasi': ('Varanasi', 'Uttar Pradesh', 25.3176, 82.9739, ('banaras', 'benares', 'kashi')),
+}
+
+# Upper bounds of the price bands, in rupees; the last band is open-ended
+PRICE_BANDS = (500, 1000, 2000, 5000)
+
+
+def _words(text):
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+def _classify(vocabulary, text):
+    words = _words(text)
+    for slug, (_, keywords) in vocabulary.items():
+        if any(word.startswith(keyword) for keyword in keywords for word in words):
+            return slug
+    return OTHER
+
+
+def craft_slug(text):
+    return _classify(CRAFTS, text)
+
+
+def category_slug(text):
+    return _classify(CATEGORIES, text)
+
+
+def city_slug(text):
+    """The known city named in a free-text location, or None"""
+    phrase = ' '.join(_words(text))
+    if not phrase:
+        return None
+    padded = f' {phrase} '
+    for slug, (name, _, _, _, aliases) in CITIES.items():
+        if any(f' {spelling} ' in padded for spelling in (name.lower(),) + aliases):
+            return slug
+    return None
+
+
+def city_coordinates(slug):
+    """(latitude, longitude) of a city slug, or (None, None)"""
+    city = CITIES.get(slug)
+    return (city[2], city[3]) if city else (None, None)
+
+
+def price_band(price):
+    """Slug of the band a price falls in, e.g. '500-1000' or '5000-plus'"""
+    lower = 0
+    for upper in PRICE_BANDS:
+        if price < upper:
+            return f'{lower}-{upper}'
+        lower = upper
+    return f'{lower}-plus'
+
+
+def price_band_range(slug):
+    """(min, max) prices of a band slug, max None for the open band"""
+    lower, upper = slug.split('-')
+    return float(lower), None if upper == 'plus' else float(upper)
+
+
+def label(facet, slug):
+    if facet == 'craft':
+        return CRAFTS.get(slug, (slug,))[0]
+    if facet == 'category':
+        return CATEGORIES.get(slug, (slug,))[0]
+    if facet == 'city':
+        return CITIES.get(slug, (slug,))[0]
+    if facet == 'price':
+        lower, upper = price_band_range(slug)
+        return f'₹{lower:,.0f}+' if upper is None else f'₹{lower:,.0f} – ₹{upper:,.0f}'
+    return slug
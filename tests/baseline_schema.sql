@@ -0,0 +1,79 @@
+-- The schema as the first release's db.create_all() built it, before any
+-- migration; tests/test_migrations.py upgrades a database made from it.
+CREATE TABLE users (
+	id INTEGER NOT NULL,
+	name VARCHAR(100) NOT NULL,
+	email VARCHAR(120) NOT NULL,
+	password VARCHAR(255) NOT NULL,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	UNIQUE (email)
+);
+CREATE TABLE artisans (
+	id INTEGER NOT NULL,
+	name VARCHAR(100) NOT NULL,
+	email VARCHAR(120) NOT NULL,
+	password VARCHAR(255) NOT NULL,
+	craft_type VARCHAR(100) NOT NULL,
+	location VARCHAR(150),
+	bio TEXT,
+	contact VARCHAR(50),
+	image_url VARCHAR(255),
+	rating FLOAT,
+	total_ratings INTEGER,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	UNIQUE (email)
+);
+CREATE TABLE products (
+	id INTEGER NOT NULL,
+	name VARCHAR(150) NOT NULL,
+	description TEXT,
+	price FLOAT NOT NULL,
+	category VARCHAR(100),
+	image_url VARCHAR(255),
+	created_at DATETIME,
+	artisan_id INTEGER NOT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY(artisan_id) REFERENCES artisans (id)
+);
+CREATE TABLE ratings (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	artisan_id INTEGER NOT NULL,
+	rating INTEGER NOT NULL,
+	created_at DATETIME,
+	updated_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_user_artisan_rating UNIQUE (user_id, artisan_id),
+	FOREIGN KEY(user_id) REFERENCES users (id),
+	FOREIGN KEY(artisan_id) REFERENCES artisans (id)
+);
+CREATE TABLE chats (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	artisan_id INTEGER NOT NULL,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(user_id) REFERENCES users (id),
+	FOREIGN KEY(artisan_id) REFERENCES artisans (id)
+);
+CREATE TABLE wishlists (
+	id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	product_id INTEGER NOT NULL,
+	added_at DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(user_id) REFERENCES users (id),
+	FOREIGN KEY(product_id) REFERENCES products (id)
+);
+CREATE TABLE messages (
+	id INTEGER NOT NULL,
+	chat_id INTEGER NOT NULL,
+	sender_id INTEGER NOT NULL,
+	sender_type VARCHAR(20) NOT NULL,
+	content TEXT NOT NULL,
+	timestamp DATETIME,
+	PRIMARY KEY (id),
+	FOREIGN KEY(chat_id) REFERENCES chats (id)
+);
@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import text
+
+from conftest import make_artisan
+from models import db, Product, rebuild_facet_counts
+import migrations
+import taxonomy
+
+
+@pytest.mark.parametrize('category', ['Pottery', 'Ceramic tableware', 'Terracotta vase', 'Clay lamps'])
+def test_pottery_category(category):
+    assert taxonomy.category_slug(category) == 'pottery'
+
+
+def test_pottery_facet(app, client):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        db.session.add_all([
+            Product(name='Jug', price=800, category='Terracotta', artisan_id=artisan_id),
+            Product(name='Bowl', price=400, category='Ceramics', artisan_id=artisan_id),
+            Product(name='Shawl', price=2500, category='Textiles', artisan_id=artisan_id),
+        ])
+        db.session.commit()
+
+    body = client.get('/api/browse/products').json
+    assert {'value': 'pottery', 'label': 'Pottery & Ceramics', 'count': 2} in body['facets']['category']
+    body = client.get('/api/browse/products?category=pottery').json
+    assert sorted(product['name'] for product in body['results']) == ['Bowl', 'Jug']
+
+
+def test_upgrade_reclassifies_pottery(app):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        db.session.add(Product(name='Jug', price=800, category='Terracotta', artisan_id=artisan_id))
+        db.session.commit()
+        # As classified before pottery was a category
+        with db.engine.begin() as conn:
+            conn.execute(text("UPDATE products SET category_slug = 'other'"))
+            conn.execute(text("DELETE FROM schema_version WHERE version = 8"))
+            rebuild_facet_counts(conn)
+        migrations.upgrade(echo=lambda message: None)
+        assert Product.query.one().category_slug == 'pottery'
+        counts = dict(db.session.execute(text(
+            "SELECT value, count FROM facet_counts WHERE facet = 'products.category'")).all())
+        assert counts == {'pottery': 1}
@@ -0,0 +1,61 @@
+import io
+import zipfile
+
+import pytest
+
+import catalog
+from conftest import login, make_artisan
+from models import Product
+
+
+@pytest.mark.parametrize('price', ['inf', '-inf', 'nan', '1e400'])
+def test_non_finite_price_rejected(price):
+    with pytest.raises(ValueError, match='finite'):
+        catalog.validate_row({'name': 'Vase', 'price': price})
+
+
+def test_missing_description_renders(app, client):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        result = catalog.import_products(artisan_id, io.BytesIO(b'name,price\nVase,10\n'), 'csv')
+        assert result.inserted == 1
+        assert Product.query.one().description == ''
+    login(client, artisan_id, 'artisan')
+    assert client.get('/artisan/dashboard').status_code == 200
+    assert client.get(f'/artisan/{artisan_id}').status_code == 200
+
+
+def test_oversized_image_rejected_before_reading(app):
+    artisan_id = make_artisan(app)
+    images = io.BytesIO()
+    with zipfile.ZipFile(images, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('big.png', bytes(2 * 1024 * 1024))  # compresses to a few KB
+    stored = []
+    with app.app_context():
+        result = catalog.import_products(
+            artisan_id, io.BytesIO(b'name,price,image\nVase,10,big.png\n'), 'csv', images,
+            store_image=lambda data, extension: stored.append(data) or '/static/uploads/x.png',
+            image_extensions={'png'}, max_image_size=1024 * 1024)
+    assert result.inserted == 0
+    assert 'larger than' in result.errors[0][1]
+    assert stored == []
+
+
+@pytest.mark.parametrize('image_url, accepted', [
+    ('/static/uploads/images/ab/' + 'ab' * 32 + '/original.png', True),
+    ('/static/uploads/../../app.py', False),
+    ('/static/uploads/images/ab/' + 'ab' * 32 + '/../../../../../app.py', False),
+    ('/static/uploads/images/../images/ab/' + 'ab' * 32 + '/original.png', False),
+    ('/static/uploads/products/vase.png', False),
+    ('https://example.test/vase.png', False),
+])
+def test_image_url_must_be_content_addressed_upload(app, image_url, accepted):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        result = catalog.import_products(
+            artisan_id, io.BytesIO(f'name,price,image_url\nVase,10,{image_url}\n'.encode()), 'csv')
+        assert result.inserted == int(accepted)
+        if accepted:
+            assert Product.query.one().image_url == image_url
+        else:
+            assert 'uploaded image' in result.errors[0][1]
@@ -0,0 +1,135 @@
+import time
+
+from conftest import login
+from models import db, Artisan, Chat, Message, User
+
+
+def make_chat(app):
+    with app.app_context():
+        user = User(name='Buyer', email='buyer@example.test', password='x')
+        artisan = Artisan(name='Potter', email='potter@example.test', password='x', craft_type='Pottery',
+                          location='Jaipur', contact='0000000000')
+        db.session.add_all([user, artisan])
+        db.session.flush()
+        chat = Chat(user_id=user.id, artisan_id=artisan.id)
+        db.session.add(chat)
+        db.session.commit()
+        return user.id, artisan.id, chat.id
+
+
+def test_stream_closes_after_max_age(app, client):
+    app.config.update(CHAT_STREAM_MAX_AGE=0.3, CHAT_STREAM_HEARTBEAT=0.1)
+    user_id, _, chat_id = make_chat(app)
+    with app.app_context():
+        db.session.add(Message(chat_id=chat_id, sender_id=user_id, sender_type='user', content='hello'))
+        db.session.commit()
+    login(client, user_id, 'user')
+    streams = app.extensions['chat_streams']
+
+    start = time.monotonic()
+    response = client.get(f'/chat/{chat_id}/stream')
+    assert streams.count == 1
+    body = response.get_data(as_text=True)  # returns once the stream ends
+    response.close()
+    assert time.monotonic() - start < 2
+    assert '"content": "hello"' in body and ': keepalive' in body
+    assert streams.count == 0
+
+
+def test_stream_requires_participant(app, client):
+    _, _, chat_id = make_chat(app)
+    assert client.get(f'/chat/{chat_id}/stream').status_code == 401
+    with app.app_context():
+        other = User(name='Other', email='other@example.test', password='x')
+        db.session.add(other)
+        db.session.commit()
+        other_id = other.id
+    login(client, other_id, 'user')
+    assert client.get(f'/chat/{chat_id}/stream').status_code == 403
+    assert app.extensions['chat_streams'].count == 0
+
+
+def test_streams_over_limit_get_503(app, client):
+    app.config.update(CHAT_STREAM_LIMIT=1, CHAT_STREAM_HEARTBEAT=0.05)
+    user_id, _, chat_id = make_chat(app)
+    login(client, user_id, 'user')
+
+    first = client.get(f'/chat/{chat_id}/stream')
+    assert first.status_code == 200
+    second = client.get(f'/chat/{chat_id}/stream')
+    assert second.status_code == 503
+    assert second.headers['Retry-After'] == str(app.config['CHAT_POLL_INTERVAL'])
+    first.close()
+    third = client.get(f'/chat/{chat_id}/stream')
+    assert third.status_code == 200
+    third.close()
+    assert app.extensions['chat_streams'].count == 0
+
+
+def send(client, chat_id, content):
+    return client.post(f'/chat/{chat_id}/send', data={'message': content}, headers={'Accept': 'application/json'})
+
+
+def summary(client, **headers):
+    return client.get('/notifications/summary', headers=headers)
+
+
+def chat_row(app, chat_id):
+    with app.app_context():
+        return db.session.get(Chat, chat_id)
+
+
+def test_unread_counts(app):
+    user_id, artisan_id, chat_id = make_chat(app)
+    user, artisan = app.test_client(), app.test_client()
+    login(user, user_id, 'user')
+    login(artisan, artisan_id, 'artisan')
+
+    assert send(user, chat_id, 'Is the vase glazed?').status_code == 201
+    assert send(user, chat_id, 'And food safe?').status_code == 201
+    assert artisan.get('/notifications/summary').json == {'unread': 2, 'chats': {str(chat_id): 2}}
+    assert user.get('/notifications/summary').json == {'unread': 0, 'chats': {}}
+    chat = chat_row(app, chat_id)
+    assert (chat.last_message_preview, chat.user_last_read_id) == ('And food safe?', chat.last_message_id)
+
+    # Replying moves the sender's cursor too
+    reply = send(artisan, chat_id, 'Yes, both.').json['message']
+    chat = chat_row(app, chat_id)
+    assert (chat.artisan_unread_count, chat.user_unread_count) == (0, 1)
+    assert chat.last_message_id == chat.artisan_last_read_id == reply['id']
+
+    assert user.post(f'/chat/{chat_id}/read').status_code == 204
+    assert user.get('/notifications/summary').json['unread'] == 0
+    assert chat_row(app, chat_id).user_last_read_id == reply['id']
+
+
+def test_opening_chat_marks_it_read(app):
+    user_id, artisan_id, chat_id = make_chat(app)
+    user, artisan = app.test_client(), app.test_client()
+    login(user, user_id, 'user')
+    login(artisan, artisan_id, 'artisan')
+    send(user, chat_id, 'Hello')
+    assert artisan.get(f'/chat/{chat_id}').status_code == 200
+    assert artisan.get('/notifications/summary').json['unread'] == 0
+
+
+def test_summary_revalidates_with_etag(app):
+    user_id, artisan_id, chat_id = make_chat(app)
+    user, artisan = app.test_client(), app.test_client()
+    login(user, user_id, 'user')
+    login(artisan, artisan_id, 'artisan')
+    send(user, chat_id, 'Hello')
+
+    first = summary(artisan)
+    assert first.status_code == 200 and first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+    assert summary(artisan, **{'If-None-Match': etag}).status_code == 304
+
+    send(user, chat_id, 'Are you there?')
+    changed = summary(artisan, **{'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.json['unread'] == 2
+    assert changed.headers['ETag'] != etag
+
+
+def test_summary_requires_login(client):
+    assert client.get('/notifications/summary').status_code == 401
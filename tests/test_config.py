@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import make_app
+import config
+
+
+def test_multiprocess_needs_shared_state(app):
+    with pytest.raises(RuntimeError, match='SESSION_STORE_URL, CACHE_URL, CHAT_BROKER_URL'):
+        config.check_multiprocess(app)
+
+
+def test_multiprocess_lists_what_is_missing(tmp_path):
+    app = make_app(tmp_path, {'SESSION_STORE_URL': f'sqlite:///{tmp_path}/sessions.db',
+                              'CACHE_URL': f'sqlite:///{tmp_path}/cache.db'})
+    with pytest.raises(RuntimeError, match=r'Set CHAT_BROKER_URL to .*otherwise live chat messages'):
+        config.check_multiprocess(app)
+
+
+@pytest.fixture
+def default_secrets(monkeypatch):
+    monkeypatch.delenv('SECRET_KEY', raising=False)
+    monkeypatch.delenv('ADMIN_KEY', raising=False)
+
+
+def test_production_refuses_default_secrets(tmp_path, default_secrets):
+    with pytest.raises(RuntimeError, match='Set SECRET_KEY and ADMIN_KEY'):
+        make_app(tmp_path, {'TESTING': False}, migrate=False)
+    with pytest.raises(RuntimeError, match='Set ADMIN_KEY;'):
+        make_app(tmp_path, {'TESTING': False, 'SECRET_KEY': 'x' * 32}, migrate=False)
+
+
+def test_secrets_set_or_debug(tmp_path, default_secrets):
+    make_app(tmp_path, {'TESTING': False, 'SECRET_KEY': 'x' * 32, 'ADMIN_KEY': 'y' * 32}, migrate=False)
+    make_app(tmp_path, {'TESTING': False, 'DEBUG': True}, migrate=False)
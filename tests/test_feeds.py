@@ -0,0 +1,10 @@
+from conftest import make_app
+import jobs
+
+
+def test_feeds_refreshed_once_per_slot_across_workers(tmp_path):
+    app = make_app(tmp_path, {'FEEDS_REFRESH_INTERVAL': 3600})
+    queue = app.extensions['jobs']
+    for _ in range(3):  # each worker schedules the current slot when it starts
+        jobs.work(app, queue, burst=True)
+    assert queue.stats()['by_name']['feeds.refresh'] == {'done': 1, 'queued': 1}  # and the next slot
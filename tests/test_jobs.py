@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from models import db, User
+import jobs
+
+attempts = []
+
+
+@jobs.task('test.flaky')
+def flaky(failures):
+    attempts.append(time.time())
+    if len(attempts) <= failures:
+        raise RuntimeError('not yet')
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    attempts.clear()
+    monkeypatch.setattr(jobs.random, 'uniform', lambda low, high: 1.0)  # no jitter
+    return app.extensions['jobs']
+
+
+def job_row(queue, job_id):
+    return dict(queue._connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+
+
+def make_due(queue, job_id):
+    queue._connect().execute('UPDATE jobs SET run_at = ? WHERE id = ?', (time.time(), job_id))
+
+
+def test_retry_with_backoff(app, queue):
+    job_id = queue.enqueue('test.flaky', failures=2, max_attempts=3)
+    for attempt, backoff in ((1, jobs.BACKOFF_BASE), (2, jobs.BACKOFF_BASE * 2)):
+        before = time.time()
+        assert jobs.run_job(app, queue, queue.claim()) == jobs.QUEUED
+        row = job_row(queue, job_id)
+        assert row['attempts'] == attempt and 'not yet' in row['last_error']
+        assert before + backoff <= row['run_at'] <= time.time() + backoff
+        assert queue.claim() is None  # not due until the backoff passes
+        make_due(queue, job_id)
+    assert jobs.run_job(app, queue, queue.claim()) == jobs.DONE
+    assert job_row(queue, job_id)['status'] == jobs.DONE
+
+
+def test_failed_after_max_attempts(app, queue):
+    job_id = queue.enqueue('test.flaky', failures=5, max_attempts=2)
+    jobs.run_job(app, queue, queue.claim())
+    make_due(queue, job_id)
+    assert jobs.run_job(app, queue, queue.claim()) == jobs.FAILED
+    assert queue.claim() is None
+    assert [job['id'] for job in queue.failed_jobs()] == [job_id]
+    assert queue.retry_failed() == 1
+    assert queue.claim()['attempts'] == 1
+
+
+def test_expired_lease_is_claimed_again(queue):
+    job_id = queue.enqueue('test.flaky', failures=0)
+    assert queue.claim()['id'] == job_id
+    assert queue.claim() is None  # leased to the first worker
+    queue._connect().execute('UPDATE jobs SET locked_until = ? WHERE id = ?', (time.time() - 1, job_id))
+    job = queue.claim()
+    assert (job['id'], job['attempts']) == (job_id, 2)
+
+
+def test_idempotency_key_suppresses_duplicates(app, queue):
+    first = queue.enqueue('test.flaky', idempotency_key='once', failures=0)
+    assert first is not None
+    assert queue.enqueue('test.flaky', idempotency_key='once', failures=0) is None
+    jobs.run_job(app, queue, queue.claim())
+    assert queue.enqueue('test.flaky', idempotency_key='once', failures=0) is None  # kept while retained
+    assert queue.stats()['by_name']['test.flaky'] == {jobs.DONE: 1}
+
+    queue.retention = -1
+    assert queue.purge() == 1
+    assert queue.enqueue('test.flaky', idempotency_key='once', failures=0) is not None
+
+
+def add_user_and_enqueue(email):
+    db.session.add(User(name='Buyer', email=email, password='x'))
+    jobs.enqueue_after_commit('test.flaky', failures=0)
+
+
+def test_enqueue_after_commit(app, queue):
+    with app.app_context():
+        add_user_and_enqueue('rolled-back@example.test')
+        db.session.rollback()
+        assert queue.stats()['counts'][jobs.QUEUED] == 0
+
+        add_user_and_enqueue('committed@example.test')
+        assert queue.stats()['counts'][jobs.QUEUED] == 0  # not before the commit
+        db.session.commit()
+        assert queue.stats()['counts'][jobs.QUEUED] == 1
+
+
+def test_savepoint_rollback_keeps_pending_jobs(app, queue):
+    with app.app_context():
+        add_user_and_enqueue('outer@example.test')
+        with db.session.begin_nested() as savepoint:
+            db.session.add(User(name='Buyer', email='inner@example.test', password='x'))
+            savepoint.rollback()
+        db.session.commit()
+        assert queue.stats()['counts'][jobs.QUEUED] == 1
+
@@ -0,0 +1,22 @@
+from conftest import make_app
+
+LIMITS = {'LOGIN_RATE_LIMIT_IP': (2, 300), 'LOGIN_RATE_LIMIT_EMAIL': None}
+
+
+def attempt(client, address, **headers):
+    return client.post('/login', data={'email': 'nobody@example.test', 'password': 'x'},
+                       environ_base={'REMOTE_ADDR': address}, headers=headers).status_code
+
+
+def test_ip_limit_counts_forwarded_clients(tmp_path):
+    client = make_app(tmp_path, {**LIMITS, 'PROXY_FIX_HOPS': 1}).test_client()
+    assert [attempt(client, '10.0.0.1', **{'X-Forwarded-For': '203.0.113.1'}) for _ in range(3)] == [200, 200, 429]
+    # Another client behind the same proxy has its own allowance
+    assert attempt(client, '10.0.0.1', **{'X-Forwarded-For': '203.0.113.2'}) == 200
+
+
+def test_forwarded_header_ignored_without_proxy(tmp_path):
+    client = make_app(tmp_path, LIMITS).test_client()
+    assert attempt(client, '203.0.113.1', **{'X-Forwarded-For': '198.51.100.1'}) == 200
+    assert attempt(client, '203.0.113.1', **{'X-Forwarded-For': '198.51.100.2'}) == 200
+    assert attempt(client, '203.0.113.1', **{'X-Forwarded-For': '198.51.100.3'}) == 429
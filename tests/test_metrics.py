@@ -0,0 +1,41 @@
+import logging
+
+from sqlalchemy import text
+
+import benchmark
+from app import create_app
+from models import db
+
+
+def test_statement_timing_is_not_repeated_per_app(app, caplog):
+    # Each app used to add its own engine listeners, so every statement was
+    # timed and logged once per app ever created in the process
+    create_app({'TESTING': True, 'JOBS_URL': app.config['JOBS_URL'], 'SLOW_QUERY_THRESHOLD': 0})
+    app.config['SLOW_QUERY_THRESHOLD'] = 0
+    with app.app_context(), caplog.at_level(logging.WARNING):
+        db.session.execute(text('SELECT 1'))
+    assert len([r for r in caplog.records if r.getMessage().startswith('Slow query')]) == 1
+
+
+def test_request_metrics(client):
+    client.get('/healthz')
+    body = client.get('/metrics').text
+    assert 'kalamitra_requests_total{endpoint="healthz",method="GET",status="200"} 1' in body
+    assert 'kalamitra_startup_seconds' in body
+
+
+def test_benchmark_counts_statements_per_request(app):
+    # Read from query_budget's counter; statements outside the request
+    # aren't counted
+    def view():
+        for _ in range(3):
+            db.session.execute(text('SELECT 1'))
+        return 'ok'
+    app.add_url_rule('/three-statements', 'three_statements', view)
+    driver = benchmark.TestClientDriver(app)
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+    status, _, statements = driver.request('GET', '/three-statements')
+    assert (status, statements) == (200, 3)
+    body = app.test_client().get('/metrics').text
+    assert 'kalamitra_sql_statements_per_request_sum{endpoint="three_statements"} 3.000000' in body
@@ -0,0 +1,120 @@
+import sqlite3
+from collections import Counter
+from pathlib import Path
+
+from sqlalchemy import inspect, text
+
+from conftest import make_app
+from models import db, artisan_facets, product_facets
+import migrations
+import taxonomy
+
+BASELINE_SCHEMA = Path(__file__).with_name('baseline_schema.sql')
+
+# Rows as the first release could leave them: stale rating counters,
+# duplicate wishlist entries and chats, and rows whose parent is gone
+BASELINE_ROWS = """
+INSERT INTO users (id, name, email, password) VALUES
+    (1, 'Asha', 'asha@example.test', 'x'), (2, 'Ravi', 'ravi@example.test', 'x');
+INSERT INTO artisans (id, name, email, password, craft_type, location, rating, total_ratings) VALUES
+    (1, 'Potter', 'potter@example.test', 'x', 'Pottery', 'Jaipur', 4.9, 7),
+    (2, 'Weaver', 'weaver@example.test', 'x', 'Handloom Weaving', 'Varanasi', 0, 0);
+INSERT INTO products (id, name, price, category, artisan_id) VALUES
+    (1, 'Vase', 450, 'Pottery', 1), (2, 'Saree', 5200, 'Textiles', 2),
+    (3, 'Bowl', 120, NULL, 1), (4, 'Lost', 10, 'Jewelry', 99);
+INSERT INTO ratings (user_id, artisan_id, rating) VALUES (1, 1, 5), (2, 1, 3), (1, 2, 4);
+INSERT INTO wishlists (user_id, product_id, added_at) VALUES
+    (1, 1, '2024-01-01 10:00:00'), (1, 1, '2024-01-02 10:00:00'), (2, 2, '2024-01-03 10:00:00'), (2, 4, NULL);
+INSERT INTO chats (id, user_id, artisan_id, created_at) VALUES
+    (1, 1, 1, '2024-01-01 09:00:00'), (2, 1, 1, '2024-01-02 09:00:00'), (3, 2, 2, '2024-01-03 09:00:00');
+INSERT INTO messages (id, chat_id, sender_id, sender_type, content, timestamp) VALUES
+    (1, 1, 1, 'user', 'Is the vase glazed?', '2024-01-01 09:05:00'),
+    (2, 2, 1, 'artisan', 'Yes, food safe.', '2024-01-02 09:05:00'),
+    (3, 3, 2, 'user', 'Do you ship?', '2024-01-03 09:05:00'),
+    (4, 99, 2, 'user', 'orphan', '2024-01-04 09:05:00');
+"""
+
+
+def baseline_app(tmp_path):
+    with sqlite3.connect(tmp_path / 'test.db') as conn:
+        conn.executescript(BASELINE_SCHEMA.read_text() + BASELINE_ROWS)
+    return make_app(tmp_path, migrate=False)
+
+
+def snapshot(conn):
+    return {table: sorted(conn.execute(text(f'SELECT * FROM {table}')).all())
+            for table in ('users', 'artisans', 'products', 'ratings', 'wishlists', 'chats', 'messages',
+                          'facet_counts', 'schema_version')}
+
+
+def test_upgrade_from_baseline_is_idempotent(tmp_path):
+    app = baseline_app(tmp_path)
+    runner = app.test_cli_runner()
+
+    first = runner.invoke(args=['db-upgrade'])
+    assert first.exit_code == 0, first.output
+    assert first.output.count('Applying migration') == len(migrations.MIGRATIONS)
+    with app.app_context(), db.engine.connect() as conn:
+        before = snapshot(conn)
+
+    second = runner.invoke(args=['db-upgrade'])
+    assert second.exit_code == 0, second.output
+    assert 'Applying' not in second.output
+    assert f'schema version {migrations.MIGRATIONS[-1][0]}' in second.output
+    with app.app_context(), db.engine.connect() as conn:
+        assert snapshot(conn) == before
+        assert migrations.pending_migrations(conn) == []
+
+
+def test_upgrade_backfills_counters(tmp_path):
+    app = baseline_app(tmp_path)
+    with app.app_context():
+        migrations.upgrade(echo=lambda message: None)
+        with db.engine.connect() as conn:
+            ratings = conn.execute(text('SELECT id, rating_sum, total_ratings FROM artisans ORDER BY id')).all()
+            assert ratings == [(1, 8, 2), (2, 4, 1)]
+
+            # Duplicate chats are merged into the oldest, with their messages
+            chats = conn.execute(text(
+                'SELECT id, last_message_id, last_message_preview, user_unread_count, artisan_unread_count '
+                'FROM chats ORDER BY id')).all()
+            assert chats == [(1, 2, 'Yes, food safe.', 0, 0), (3, 3, 'Do you ship?', 0, 0)]
+            assert conn.execute(text('SELECT chat_id, COUNT(*) FROM messages GROUP BY chat_id')).all() == [(1, 2),
+                                                                                                       (3, 1)]
+            assert conn.execute(text('SELECT user_id, product_id FROM wishlists ORDER BY id')).all() == [(1, 1),
+                                                                                                     (2, 2)]
+            assert conn.execute(text('SELECT id FROM products ORDER BY id')).scalars().all() == [1, 2, 3]
+
+
+def test_upgrade_counts_facets(tmp_path):
+    app = baseline_app(tmp_path)
+    with app.app_context():
+        migrations.upgrade(echo=lambda message: None)
+        with db.engine.connect() as conn:
+            expected = Counter()
+            for craft, location in conn.execute(text('SELECT craft_type, location FROM artisans')):
+                expected.update(artisan_facets(taxonomy.craft_slug(craft), taxonomy.city_slug(location)).items())
+            for category, price in conn.execute(text('SELECT category, price FROM products')):
+                expected.update(product_facets(taxonomy.category_slug(category), price).items())
+            stored = {(facet, value): count
+                      for facet, value, count in conn.execute(text('SELECT facet, value, count FROM facet_counts'))}
+            assert stored == {key: count for key, count in expected.items() if key[1] is not None}
+            assert conn.execute(text("SELECT category_slug FROM products WHERE id = 3")).scalar() == taxonomy.OTHER
+
+
+def test_upgrade_cascades_foreign_keys(tmp_path):
+    app = baseline_app(tmp_path)
+    with app.app_context():
+        migrations.upgrade(echo=lambda message: None)
+        with db.engine.connect() as conn:
+            assert conn.exec_driver_sql('PRAGMA foreign_key_check').all() == []
+            for table, column, parent in migrations.CASCADE_FOREIGN_KEYS:
+                keys = [key for key in inspect(conn).get_foreign_keys(table) if key['constrained_columns'] == [column]]
+                assert [(key['referred_table'], key['options'].get('ondelete')) for key in keys] == [(parent, 'CASCADE')]
+
+            # The rebuilt tables keep their indexes and the search triggers
+            assert conn.execute(text("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'")).scalar() > 0
+            conn.execute(text('DELETE FROM artisans WHERE id = 1'))
+            assert conn.execute(text('SELECT COUNT(*) FROM products WHERE artisan_id = 1')).scalar() == 0
+            assert conn.execute(text('SELECT COUNT(*) FROM chats WHERE artisan_id = 1')).scalar() == 0
+            conn.rollback()
@@ -0,0 +1,27 @@
+from werkzeug.security import generate_password_hash
+
+import passwords
+
+METHOD = 'pbkdf2:sha256:1000'
+
+
+def test_pool_hashes_in_fresh_processes():
+    hasher = passwords.PasswordHasher(METHOD, workers=1)
+    try:
+        stored = hasher.hash('correct horse')
+        assert hasher.verify(stored, 'correct horse')
+        assert not hasher.verify(stored, 'wrong')
+        assert hasher._pool._mp_context.get_start_method() != 'fork'
+    finally:
+        hasher._pool.shutdown()
+
+
+def test_needs_rehash_compares_parameters(monkeypatch):
+    hasher = passwords.PasswordHasher(METHOD, workers=0)
+    calls = []
+    run = hasher._run
+    monkeypatch.setattr(hasher, '_run', lambda func, *args: calls.append(func) or run(func, *args))
+    assert not hasher.needs_rehash(generate_password_hash('x', METHOD))
+    assert hasher.needs_rehash(generate_password_hash('x', 'pbkdf2:sha256:2000'))
+    assert hasher.needs_rehash(generate_password_hash('x', 'scrypt:16384:8:1'))
+    assert calls == [generate_password_hash]  # once, through the pool's slots
@@ -0,0 +1,80 @@
+import io
+import logging
+
+import pytest
+
+from conftest import login, make_artisan
+from models import db, Artisan, Product, User
+from query_budget import QueryBudgetExceeded
+
+
+def add_users(app, count):
+    """A view that inserts users one statement at a time, then commits"""
+    def view():
+        for i in range(count):
+            db.session.add(User(name=f'user {i}', email=f'user{i}@example.test', password='x'))
+            db.session.flush()
+        db.session.commit()
+        return 'ok'
+    app.add_url_rule('/add-users', 'add_users', view)
+
+
+def user_count(app):
+    with app.app_context():
+        return User.query.count()
+
+
+def test_within_budget(app, client):
+    app.config['SQL_QUERY_BUDGET'] = 5
+    add_users(app, 5)
+    assert client.get('/add-users').status_code == 200
+    assert user_count(app) == 5
+
+
+def test_over_budget_raises_before_commit(app, client):
+    app.config['SQL_QUERY_BUDGET'] = 5
+    add_users(app, 6)
+    with pytest.raises(QueryBudgetExceeded, match='add_users went over its budget of 5'):
+        client.get('/add-users')
+    # The sixth INSERT never ran and the transaction was rolled back
+    assert user_count(app) == 0
+
+
+def test_endpoint_override(app, client):
+    app.config['SQL_QUERY_BUDGET'] = 5
+    app.config['SQL_QUERY_BUDGETS'] = {'add_users': None}
+    add_users(app, 6)
+    assert client.get('/add-users').status_code == 200
+
+
+def test_over_budget_is_logged_without_raise(app, client, caplog):
+    app.config.update(SQL_QUERY_BUDGET=5, SQL_QUERY_BUDGET_RAISE=False)
+    add_users(app, 6)
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/add-users').status_code == 200
+    assert 'add_users ran 6 SQL statements (budget 5)' in caplog.text
+    assert user_count(app) == 6
+
+
+def test_catalog_import_is_exempt(app, client):
+    artisan_id = make_artisan(app)
+    app.config['CATALOG_IMPORT_BATCH_SIZE'] = 100
+    login(client, artisan_id, 'artisan')
+    rows = ''.join(f'Pot {i},{i}.50\n' for i in range(1200))
+    response = client.post('/artisan/products/import', headers={'Accept': 'application/json'}, data={
+        'file': (io.BytesIO(('name,price\n' + rows).encode()), 'products.csv'),
+    })
+    assert response.status_code == 200
+    assert response.json['inserted'] == 1200
+
+
+def test_artisan_account_delete_fits_budget(app, client):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        db.session.add_all(Product(name=f'Pot {i}', price=i, category='Pottery', artisan_id=artisan_id)
+                           for i in range(20))
+        db.session.commit()
+    login(client, artisan_id, 'artisan')
+    assert client.post('/artisan/account/delete').status_code == 302
+    with app.app_context():
+        assert db.session.get(Artisan, artisan_id) is None
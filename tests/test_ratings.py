@@ -0,0 +1,86 @@
+from sqlalchemy import func, text
+
+from conftest import login, make_artisan, make_user
+from models import db, Artisan, Rating, reconcile_artisan_ratings
+
+
+def rate(client, artisan_id, stars):
+    return client.post(f'/artisan/{artisan_id}/rate', data={'rating': str(stars)})
+
+
+def assert_counters_match(app, artisan_id):
+    """The denormalised counters agree with a fresh aggregate over ratings"""
+    with app.app_context():
+        artisan = db.session.get(Artisan, artisan_id)
+        total, count, average = db.session.query(
+            func.coalesce(func.sum(Rating.rating), 0), func.count(Rating.id), func.avg(Rating.rating)
+        ).filter(Rating.artisan_id == artisan_id).one()
+        assert (artisan.rating_sum, artisan.total_ratings) == (total, count)
+        assert artisan.rating == (round(average, 1) if count else 0)
+
+
+def test_rate_rerate_and_delete(app):
+    artisan_id = make_artisan(app)
+    clients = []
+    for name, stars in (('Asha', 5), ('Ravi', 4), ('Meena', 2)):
+        client = app.test_client()
+        login(client, make_user(app, name), 'user')
+        assert rate(client, artisan_id, stars).status_code == 302
+        assert_counters_match(app, artisan_id)
+        clients.append(client)
+
+    rate(clients[1], artisan_id, 1)  # re-rate replaces the vote
+    assert_counters_match(app, artisan_id)
+    with app.app_context():
+        assert db.session.get(Artisan, artisan_id).total_ratings == 3
+
+    clients[0].get(f'/artisan/{artisan_id}/rating/delete')
+    assert_counters_match(app, artisan_id)
+    for client in clients[1:]:
+        client.get(f'/artisan/{artisan_id}/rating/delete')
+    assert_counters_match(app, artisan_id)
+    with app.app_context():
+        artisan = db.session.get(Artisan, artisan_id)
+        assert (artisan.rating_sum, artisan.total_ratings, artisan.rating) == (0, 0, 0)
+
+
+def test_invalid_rating_leaves_counters(app, client):
+    artisan_id = make_artisan(app)
+    login(client, make_user(app), 'user')
+    rate(client, artisan_id, 6)
+    rate(client, artisan_id, 0)
+    assert_counters_match(app, artisan_id)
+    with app.app_context():
+        assert db.session.get(Artisan, artisan_id).total_ratings == 0
+
+
+def test_reconcile_repairs_drift(app):
+    artisan_id, other_id = make_artisan(app), make_artisan(app, 'Weaver', 'Weaving')
+    for name, stars in (('Asha', 5), ('Ravi', 3)):
+        client = app.test_client()
+        login(client, make_user(app, name), 'user')
+        rate(client, artisan_id, stars)
+    with app.app_context():
+        db.session.execute(text('UPDATE artisans SET rating_sum = 40, total_ratings = 9, rating = 4.4 WHERE id = :id'),
+                           {'id': artisan_id})
+        db.session.commit()
+
+        assert reconcile_artisan_ratings(fix=False) == [(artisan_id, (40, 9), (8, 2))]
+        assert db.session.get(Artisan, artisan_id).rating_sum == 40  # --check leaves it
+        assert reconcile_artisan_ratings() == [(artisan_id, (40, 9), (8, 2))]
+        assert reconcile_artisan_ratings() == []
+    assert_counters_match(app, artisan_id)
+    assert_counters_match(app, other_id)
+
+
+def test_reconcile_command(app):
+    artisan_id = make_artisan(app)
+    with app.app_context():
+        db.session.execute(text('UPDATE artisans SET rating_sum = 7, total_ratings = 2 WHERE id = :id'),
+                           {'id': artisan_id})
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert '1 artisan(s) found out of sync.' in runner.invoke(args=['reconcile-ratings', '--check']).output
+    assert '1 artisan(s) repaired out of sync.' in runner.invoke(args=['reconcile-ratings']).output
+    assert '0 artisan(s) found out of sync.' in runner.invoke(args=['reconcile-ratings', '--check']).output
+    assert_counters_match(app, artisan_id)
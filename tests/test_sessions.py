@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from conftest import make_user
+from models import db, User
+import passwords
+import sessions
+
+
+def store_of(app):
+    return app.session_interface.store
+
+
+def session_id(client, app):
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME'])
+    return cookie.value if cookie else None
+
+
+def set_password(app, user_id, password):
+    with app.app_context():
+        db.session.get(User, user_id).password = passwords.hash_password(password)
+        db.session.commit()
+
+
+def test_anonymous_session_is_short_lived(app, client):
+    before = time.time()
+    assert client.get('/user/dashboard').status_code == 302
+    sid = session_id(client, app)
+    assert sid is not None  # holding the flashed "Please login" message
+    expires_at, _ = store_of(app).get(sid)
+    assert expires_at <= time.time() + app.config['SESSION_ANONYMOUS_LIFETIME']
+    assert expires_at >= before + app.config['SESSION_ANONYMOUS_LIFETIME']
+
+
+def test_login_regenerates_session(app, client):
+    user_id = make_user(app)
+    set_password(app, user_id, 'correct horse')
+    client.get('/user/dashboard')
+    anonymous_sid = session_id(client, app)
+    assert anonymous_sid is not None
+
+    client.post('/login', data={'email': 'buyer@example.test', 'password': 'correct horse'})
+    sid = session_id(client, app)
+    assert sid not in (None, anonymous_sid)
+    assert store_of(app).get(anonymous_sid) is None
+    expires_at, _ = store_of(app).get(sid)
+    assert expires_at >= time.time() + app.permanent_session_lifetime.total_seconds() - 60
+    assert client.get('/user/dashboard').status_code == 200
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return sessions.MemorySessionStore()
+    return sessions.SQLiteSessionStore(str(tmp_path / 'sessions.db'))
+
+
+def test_expired_sessions_are_hidden_and_swept(store):
+    store.set('old', '{}', time.time() - 1)
+    store.set('live', '{}', time.time() + 60)
+    assert store.get('old') is None
+    assert store.get('live') is not None
+
+    store._last_sweep = time.time() - sessions.SWEEP_INTERVAL  # the next write sweeps
+    store.set('new', '{}', time.time() + 60)
+    if isinstance(store, sessions.MemorySessionStore):
+        assert set(store._sessions) == {'live', 'new'}
+    else:
+        assert {sid for (sid,) in store._connect().execute('SELECT sid FROM sessions')} == {'live', 'new'}
+
+
+def test_expired_session_cookie_starts_over(app, client):
+    user_id = make_user(app)
+    set_password(app, user_id, 'correct horse')
+    client.post('/login', data={'email': 'buyer@example.test', 'password': 'correct horse'})
+    sid = session_id(client, app)
+    expires_at, payload = store_of(app).get(sid)
+    store_of(app).set(sid, payload, time.time() - 1)
+    assert client.get('/user/dashboard').status_code == 302  # back to the login page
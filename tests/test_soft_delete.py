@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from conftest import login
+from models import db, Artisan, Chat, Product, User, Wishlist
+
+
+def make_accounts(app, deleted=False):
+    """A user, and an artisan with one product; deleted hides both of the latter"""
+    with app.app_context():
+        user = User(name='Buyer', email='buyer@example.test', password='x')
+        artisan = Artisan(name='Potter', email='potter@example.test', password='x', craft_type='Pottery',
+                          location='Jaipur', contact='0000000000')
+        db.session.add_all([user, artisan])
+        db.session.flush()
+        product = Product(artisan_id=artisan.id, name='Vase', description='', price=10)
+        db.session.add(product)
+        db.session.flush()
+        if deleted:
+            artisan.deleted_at = product.deleted_at = datetime.now()
+        db.session.commit()
+        return user.id, artisan.id, product.id
+
+
+def test_wishlist_add_and_duplicate(app, client):
+    user_id, _, product_id = make_accounts(app)
+    login(client, user_id, 'user')
+    assert client.get(f'/wishlist/add/{product_id}').status_code == 302
+    assert b'Product already in wishlist!' in client.get(f'/wishlist/add/{product_id}', follow_redirects=True).data
+    with app.app_context():
+        assert Wishlist.query.count() == 1
+
+
+def test_wishlist_add_deleted_product(app, client):
+    user_id, _, product_id = make_accounts(app, deleted=True)
+    login(client, user_id, 'user')
+    assert client.get(f'/wishlist/add/{product_id}').status_code == 404
+    assert client.get('/wishlist/add/999').status_code == 404
+    with app.app_context():
+        assert Wishlist.query.count() == 0
+
+
+def test_start_chat_with_deleted_artisan(app, client):
+    user_id, artisan_id, _ = make_accounts(app, deleted=True)
+    login(client, user_id, 'user')
+    assert client.get(f'/chat/start/{artisan_id}').status_code == 404
+    assert client.get('/chat/start/999').status_code == 404
+    with app.app_context():
+        assert Chat.query.count() == 0
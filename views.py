@@ -0,0 +1,773 @@
+"""The storefront: directory, search, browse, accounts, products, ratings
+and wishlists, with the cached reads they share.
+
+Registered as the 'main' blueprint by app.create_app(); the chat and admin
+pages live in chat_views and admin_views.
+"""
+from datetime import datetime
+import time
+import uuid
+import zipfile
+
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify, redirect, render_template, request,
+                   session, stream_with_context, url_for)
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
+
+from auth import current_principal, login_required
+from cache import MISSING, current_cache as cache
+from models import db, IST, User, Artisan, Product, Wishlist, Rating
+from ratelimit import RateLimiter
+import assets
+import browse
+import catalog
+import database
+import deletes
+import feeds
+import images
+import jobs
+import metrics
+import passwords
+import search
+import taxonomy
+
+bp = Blueprint('main', __name__)
+
+# Login attempt limits, checked before any password is hashed
+@bp.record_once
+def create_login_limiters(state):
+    config = state.app.config
+    state.app.extensions['login_limiters'] = {
+        scope: RateLimiter(*config[f'LOGIN_RATE_LIMIT_{scope.upper()}'])
+        for scope in ('ip', 'email') if config[f'LOGIN_RATE_LIMIT_{scope.upper()}']
+    }
+
+def login_throttled(email):
+    """Seconds the client must wait before another login attempt, or 0"""
+    keys = {'ip': request.remote_addr, 'email': (email or '').strip().lower()}
+    limiters = current_app.extensions['login_limiters']
+    return max((limiter.hit(keys[scope]) for scope, limiter in limiters.items()), default=0)
+
+def login_succeeded(email):
+    limiters = current_app.extensions['login_limiters']
+    if 'email' in limiters:
+        limiters['email'].reset((email or '').strip().lower())
+
+def authenticate(account, password):
+    """Check a password, upgrading the stored hash if the hash settings changed"""
+    if account is None or not passwords.verify_password(account.password, password):
+        return False
+    if passwords.needs_rehash(account.password):
+        account.password = passwords.hash_password(password)
+        db.session.commit()
+    return True
+
+# Helper function for file uploads
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp','jfif'}
+
+UPLOAD_URL_PREFIX = '/static/uploads'
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+@jobs.task('images.process')
+def process_upload(path):
+    images.process_image(path)
+
+def store_image(data, extension):
+    """Store image bytes and queue their resized variants; returns the URL
+
+    The variants job is enqueued when the request's transaction commits.
+    Raises ValueError if the data is not a readable image.
+    """
+    with metrics.timed('upload'):
+        path, url = images.save_original(data, extension, current_app.config['UPLOAD_FOLDER'], UPLOAD_URL_PREFIX)
+    # Uploads are content-addressed, so one job per file is enough
+    jobs.enqueue_after_commit('images.process', idempotency_key=f'images.process:{path}', path=path)
+    return url
+
+def store_upload(file):
+    """Store an uploaded image file; see store_image"""
+    return store_image(file.read(), file.filename.rsplit('.', 1)[1].lower())
+
+@bp.app_template_filter('image_variant')
+def image_variant(image_url, variant):
+    url = images.variant_url(image_url, variant, current_app.config['UPLOAD_FOLDER'], UPLOAD_URL_PREFIX)
+    return assets.versioned_url(url)
+
+def image_variant_pending(image_url, variant):
+    return images.variant_pending(image_url, variant, current_app.config['UPLOAD_FOLDER'], UPLOAD_URL_PREFIX)
+
+# Artisan directory (keyset pagination on rating, id)
+BIO_PREVIEW_LENGTH = 100
+
+def encode_cursor(rating, artisan_id):
+    return f"{rating}_{artisan_id}"
+
+def decode_cursor(cursor):
+    """Parse a 'rating_id' cursor, aborting with 400 if it is malformed"""
+    try:
+        rating, artisan_id = cursor.split('_', 1)
+        return float(rating), int(artisan_id)
+    except (AttributeError, ValueError):
+        abort(400)
+
+def cursor_arg():
+    """The request's ?cursor= in canonical form, so equivalent spellings
+    share cache entries; aborts with 400 if it is malformed"""
+    cursor = request.args.get('cursor')
+    return encode_cursor(*decode_cursor(cursor)) if cursor else None
+
+def get_artisan_page(cursor=None, limit=None):
+    """Return one page of artisan cards and the cursor for the next page"""
+    limit = limit or current_app.config['ARTISANS_PER_PAGE']
+    rating = Artisan.rating
+    query = db.session.query(
+        Artisan.id,
+        Artisan.name,
+        Artisan.craft_type,
+        Artisan.location,
+        func.substr(Artisan.bio, 1, BIO_PREVIEW_LENGTH + 1).label('bio'),
+        Artisan.rating,
+        Artisan.image_url,
+    )
+    if cursor:
+        after_rating, after_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            rating < after_rating,
+            and_(rating == after_rating, Artisan.id < after_id),
+        ))
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(rating.desc(), Artisan.id.desc()).limit(limit + 1).all()
+
+    artisans = []
+    for row in rows[:limit]:
+        bio = row.bio or ''
+        artisans.append({
+            'id': row.id,
+            'name': row.name,
+            'craft_type': row.craft_type,
+            'location': row.location,
+            'bio': bio[:BIO_PREVIEW_LENGTH],
+            'bio_truncated': len(bio) > BIO_PREVIEW_LENGTH,
+            'rating': row.rating or 0.0,
+            'image_url': row.image_url,
+        })
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = artisans[-1]
+        next_cursor = encode_cursor(last['rating'], last['id'])
+    return artisans, next_cursor
+
+# Caching
+# Per-artisan entries are deleted when that artisan's data changes. Directory
+# pages depend on every artisan's rating, so their keys carry a generation
+# token that any directory change replaces; browse facet counts likewise
+# depend on every artisan and product.
+ARTISAN_FIELDS = ('id', 'name', 'craft_type', 'location', 'bio', 'contact', 'image_url', 'rating', 'total_ratings')
+PRODUCT_FIELDS = ('id', 'name', 'description', 'price', 'category', 'image_url', 'artisan_id')
+DIRECTORY_GENERATION_KEY = 'directory:generation'
+BROWSE_GENERATION_KEY = 'browse:generation'
+GENERATION_TTL = 24 * 60 * 60
+
+def to_dict(obj, fields):
+    return {field: getattr(obj, field) for field in fields}
+
+def artisan_key(artisan_id):
+    return f'artisan:{artisan_id}'
+
+def artisan_products_key(artisan_id):
+    return f'artisan:{artisan_id}:products'
+
+def directory_generation():
+    return cache.get_or_set(DIRECTORY_GENERATION_KEY, lambda: uuid.uuid4().hex, ttl=GENERATION_TTL)
+
+def invalidate_artisan(artisan_id, profile=False, products=False, directory=False):
+    """Drop the cached data affected by a write to an artisan"""
+    keys = []
+    if profile:
+        keys.append(artisan_key(artisan_id))
+    if products:
+        keys.append(artisan_products_key(artisan_id))
+    cache.delete(*keys)
+    if directory:
+        cache.set(DIRECTORY_GENERATION_KEY, uuid.uuid4().hex, ttl=GENERATION_TTL)
+    if directory or products:
+        cache.set(BROWSE_GENERATION_KEY, uuid.uuid4().hex, ttl=GENERATION_TTL)
+
+def browse_generation():
+    return cache.get_or_set(BROWSE_GENERATION_KEY, lambda: uuid.uuid4().hex, ttl=GENERATION_TTL)
+
+FEEDS_GENERATION_KEY = 'feeds:generation'
+
+def feeds_generation():
+    return cache.get_or_set(FEEDS_GENERATION_KEY, lambda: uuid.uuid4().hex, ttl=GENERATION_TTL)
+
+def feeds_refreshed():
+    cache.set(FEEDS_GENERATION_KEY, uuid.uuid4().hex, ttl=GENERATION_TTL)
+
+@jobs.task('feeds.refresh')
+def refresh_feeds_job(interval):
+    feeds.refresh()
+    feeds_refreshed()
+    feeds.schedule_refresh(jobs.get_queue(), interval, int(time.time() // interval) + 1)
+
+def get_cached_trending():
+    key = f'feeds:{feeds_generation()}:trending'
+    return cache.get_or_set(key, lambda: feeds.trending_products(current_app.config['FEED_SIZE']))
+
+def get_cached_artisan_recommendations(artisan_id, product_ids):
+    key = f'feeds:{feeds_generation()}:artisan:{artisan_id}'
+    return cache.get_or_set(key, lambda: feeds.recommended_products(
+        product_ids, exclude_artisan_id=artisan_id, limit=current_app.config['FEED_SIZE']))
+
+def get_cached_artisan_page(cursor):
+    key = f'directory:{directory_generation()}:page:{cursor or ""}'
+    return cache.get_or_set(key, lambda: get_artisan_page(cursor))
+
+def get_cached_artisan(artisan_id):
+    def load():
+        artisan = db.session.get(Artisan, artisan_id)
+        return to_dict(artisan, ARTISAN_FIELDS) if artisan else None
+    return cache.get_or_set(artisan_key(artisan_id), load)
+
+def get_cached_products(artisan_id):
+    def load():
+        products = Product.query.filter_by(artisan_id=artisan_id).order_by(Product.id)
+        return [to_dict(p, PRODUCT_FIELDS) for p in products]
+    return cache.get_or_set(artisan_products_key(artisan_id), load)
+
+# Routes
+@bp.route('/')
+@database.read_replica
+def index():
+    cursor = cursor_arg()
+    
+    # The card grid is the same for every visitor, so it is cached rendered
+    key = f'fragment:directory:{directory_generation()}:{cursor or ""}'
+    cards_html = cache.get(key)
+    if cards_html is MISSING:
+        artisans, next_cursor = get_cached_artisan_page(cursor)
+        cards_html = render_template('_artisan_cards.html', artisans=artisans, next_cursor=next_cursor)
+        # A card still showing an original while its variant is processed
+        # would be kept until the directory changes, so wait for the variants
+        if not any(image_variant_pending(artisan['image_url'], 'card') for artisan in artisans):
+            cache.set(key, cards_html)
+    trending = get_cached_trending() if not cursor else []
+    return render_template('index.html', cards_html=cards_html, trending=trending)
+
+@bp.route('/api/artisans')
+@database.read_replica
+def api_artisans():
+    artisans, next_cursor = get_cached_artisan_page(cursor_arg())
+    artisans = [
+        dict(artisan,
+             url=url_for('main.view_artisan_profile', artisan_id=artisan['id']),
+             image_url=image_variant(artisan['image_url'], 'card'))
+        for artisan in artisans
+    ]
+    return jsonify(artisans=artisans, next_cursor=next_cursor)
+
+# Search
+def run_search():
+    """Search products and artisans using the request's query arguments"""
+    query = request.args.get('q', '').strip()
+    category = request.args.get('category', '').strip() or None
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    limit = min(request.args.get('limit', current_app.config['SEARCH_RESULTS_LIMIT'], type=int),
+                current_app.config['SEARCH_RESULTS_LIMIT'])
+    products = search.search_products(query, category, min_price, max_price, limit)
+    # Price and category only narrow products, so skip artisans when filtering
+    filtered = category or min_price is not None or max_price is not None
+    artisans = [] if filtered else search.search_artisans(query, limit)
+    return query, products, artisans
+
+@bp.route('/search')
+@database.read_replica
+def search_page():
+    query, products, artisans = run_search()
+    return render_template('search.html', query=query, products=products, artisans=artisans)
+
+@bp.route('/api/search')
+@database.read_replica
+def api_search():
+    query, products, artisans = run_search()
+    return jsonify(
+        query=query,
+        products=[{
+            'id': p.id,
+            'name': p.name,
+            'category': p.category,
+            'price': p.price,
+            'image_url': image_variant(p.image_url, 'thumb'),
+            'url': url_for('main.view_artisan_profile', artisan_id=p.artisan_id),
+        } for p in products],
+        artisans=[{
+            'id': a.id,
+            'name': a.name,
+            'craft_type': a.craft_type,
+            'location': a.location,
+            'url': url_for('main.view_artisan_profile', artisan_id=a.id),
+        } for a in artisans],
+    )
+
+# Faceted browse
+def browse_filters():
+    """browse.Filters from the request's query arguments; raises ValueError"""
+    args = request.args
+    filters = {
+        'craft': args.get('craft') or None,
+        'city': args.get('city') or None,
+        'category': args.get('category') or None,
+        'price': args.get('price') or None,
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+    }
+    for name, vocabulary in (('craft', taxonomy.CRAFTS), ('city', taxonomy.CITIES),
+                             ('category', taxonomy.CATEGORIES)):
+        if filters[name] and filters[name] not in vocabulary:
+            raise ValueError(f'unknown {name} {filters[name]!r}')
+    
+    # ?near=<city> or ?lat=..&lon=.., within ?radius_km=
+    near = args.get('near')
+    if near:
+        city = near if near in taxonomy.CITIES else taxonomy.city_slug(near)
+        if city is None:
+            raise ValueError(f'unknown place {near!r}')
+        filters['point'] = taxonomy.city_coordinates(city)
+    elif 'lat' in args or 'lon' in args:
+        latitude, longitude = args.get('lat', type=float), args.get('lon', type=float)
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError('lat and lon must both be valid coordinates')
+        filters['point'] = (latitude, longitude)
+    if 'point' in filters:
+        filters['radius_km'] = args.get('radius_km', current_app.config['BROWSE_DEFAULT_RADIUS_KM'], type=float)
+    return browse.Filters(**filters)
+
+def get_cached_browse_summary(kind, filters):
+    """Total and facet counts, cached until an artisan or product changes"""
+    key = f'browse:{browse_generation()}:{kind}:{filters.cache_key()}'
+    return cache.get_or_set(key, lambda: {
+        'total': browse.count(kind, filters),
+        'facets': browse.describe_facets(browse.facet_counts(kind, filters)),
+    })
+
+@bp.route('/api/browse/<kind>')
+@database.read_replica
+def api_browse(kind):
+    """Filtered artisans or products with facet counts"""
+    if kind not in browse.FACETS:
+        abort(404)
+    try:
+        filters = browse_filters()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    limit = min(request.args.get('limit', current_app.config['BROWSE_PAGE_SIZE'], type=int), current_app.config['BROWSE_PAGE_SIZE'])
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    if kind == 'artisans':
+        results, next_offset = browse.browse_artisans(filters, limit, offset)
+        for artisan in results:
+            artisan['url'] = url_for('main.view_artisan_profile', artisan_id=artisan['id'])
+            artisan['image_url'] = image_variant(artisan['image_url'], 'card')
+    else:
+        results, next_offset = browse.browse_products(filters, limit, offset)
+        for product in results:
+            product['url'] = url_for('main.view_artisan_profile', artisan_id=product['artisan_id'])
+            product['image_url'] = image_variant(product['image_url'], 'thumb')
+    
+    summary = get_cached_browse_summary(kind, filters)
+    return jsonify(results=results, next_offset=next_offset, **summary)
+
+# User Authentication Routes
+@bp.route('/signup', methods=['GET', 'POST'])
+def signup():
+    if request.method == 'POST':
+        name = request.form.get('name')
+        email = request.form.get('email')
+        password = request.form.get('password')
+        
+        if User.query.filter_by(email=email).first():
+            flash('Email already registered!', 'error')
+            return redirect(url_for('main.signup'))
+        
+        hashed_password = passwords.hash_password(password)
+        new_user = User(name=name, email=email, password=hashed_password)
+        db.session.add(new_user)
+        db.session.commit()
+        
+        flash('Account created successfully! Please login.', 'success')
+        return redirect(url_for('main.login'))
+    
+    return render_template('signup.html')
+
+@bp.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        
+        retry_after = login_throttled(email)
+        if retry_after:
+            flash(f'Too many login attempts. Please try again in {retry_after} seconds.', 'error')
+            return render_template('login.html'), 429, {'Retry-After': str(retry_after)}
+        
+        user = User.query.filter_by(email=email).first()
+        
+        if authenticate(user, password):
+            login_succeeded(email)
+            session.regenerate()
+            session['user_id'] = user.id
+            session['user_type'] = 'user'
+            flash('Logged in successfully!', 'success')
+            return redirect(url_for('main.index'))
+        else:
+            flash('Invalid email or password!', 'error')
+    
+    return render_template('login.html')
+
+@bp.route('/logout')
+def logout():
+    session.clear()
+    flash('Logged out successfully!', 'success')
+    return redirect(url_for('main.index'))
+
+# Artisan Authentication Routes
+@bp.route('/artisan/signup', methods=['GET', 'POST'])
+def new_artisan():
+    if request.method == 'POST':
+        name = request.form.get('name')
+        email = request.form.get('email')
+        password = request.form.get('password')
+        craft_type = request.form.get('craft_type')
+        location = request.form.get('location')
+        bio = request.form.get('bio')
+        contact = request.form.get('contact')
+        
+        if Artisan.query.filter_by(email=email).first():
+            flash('Email already registered!', 'error')
+            return redirect(url_for('main.new_artisan'))
+        
+        # Handle image upload
+        image_url = None
+        if 'image' in request.files:
+            file = request.files['image']
+            if file and allowed_file(file.filename):
+                try:
+                    image_url = store_upload(file)
+                except ValueError as e:
+                    flash(str(e), 'error')
+                    return redirect(url_for('main.new_artisan'))
+        
+        hashed_password = passwords.hash_password(password)
+        new_artisan = Artisan(
+            name=name,
+            email=email,
+            password=hashed_password,
+            craft_type=craft_type,
+            location=location,
+            bio=bio,
+            contact=contact,
+            image_url=image_url
+        )
+        db.session.add(new_artisan)
+        db.session.commit()
+        invalidate_artisan(new_artisan.id, directory=True)
+        
+        flash('Artisan account created successfully! Please login.', 'success')
+        return redirect(url_for('main.artisan_login'))
+    
+    return render_template('new_artisan.html')
+
+@bp.route('/artisan/login', methods=['GET', 'POST'])
+def artisan_login():
+    if request.method == 'POST':
+        email = request.form.get('email')
+        password = request.form.get('password')
+        
+        retry_after = login_throttled(email)
+        if retry_after:
+            flash(f'Too many login attempts. Please try again in {retry_after} seconds.', 'error')
+            return render_template('artisan_login.html'), 429, {'Retry-After': str(retry_after)}
+        
+        artisan = Artisan.query.filter_by(email=email).first()
+        
+        if authenticate(artisan, password):
+            login_succeeded(email)
+            session.regenerate()
+            session['user_id'] = artisan.id
+            session['user_type'] = 'artisan'
+            flash('Logged in successfully!', 'success')
+            return redirect(url_for('main.artisan_dashboard'))
+        else:
+            flash('Invalid email or password!', 'error')
+    
+    return render_template('artisan_login.html')
+
+# Artisan Dashboard
+@bp.route('/artisan/dashboard')
+@login_required('artisan', 'Please login as artisan first!')
+def artisan_dashboard():
+    artisan = current_principal()
+    products = Product.query.filter_by(artisan_id=artisan.id).all()
+    return render_template('artisan_dashboard.html', artisan=artisan, products=products)
+
+# User Dashboard
+@bp.route('/user/dashboard')
+@login_required('user')
+def user_dashboard():
+    user = current_principal()
+    wishlist_products = (Product.query
+                         .join(Wishlist, Wishlist.product_id == Product.id)
+                         .filter(Wishlist.user_id == user.id)
+                         .order_by(Wishlist.added_at)
+                         .all())
+    recommended = feeds.recommended_products([p.id for p in wishlist_products], limit=current_app.config['FEED_SIZE'])
+    
+    return render_template('user_dashboard.html', user=user, wishlist_products=wishlist_products,
+                           recommended=recommended)
+
+# Product Management
+@bp.route('/artisan/product/add', methods=['GET', 'POST'])
+@login_required('artisan', 'Please login as artisan first!')
+def add_product():
+    if request.method == 'POST':
+        name = request.form.get('name')
+        description = request.form.get('description')
+        price = request.form.get('price')
+        category = request.form.get('category')
+        
+        # Handle image upload
+        image_url = None
+        if 'image' in request.files:
+            file = request.files['image']
+            if file and allowed_file(file.filename):
+                try:
+                    image_url = store_upload(file)
+                except ValueError as e:
+                    flash(str(e), 'error')
+                    return redirect(url_for('main.add_product'))
+        
+        new_product = Product(
+            name=name,
+            description=description,
+            price=float(price),
+            category=category,
+            image_url=image_url,
+            artisan_id=session['user_id']
+        )
+        db.session.add(new_product)
+        db.session.commit()
+        invalidate_artisan(session['user_id'], products=True)
+        
+        flash('Product added successfully!', 'success')
+        return redirect(url_for('main.artisan_dashboard'))
+    
+    return render_template('add_product.html')
+
+def import_catalog(artisan_id, stream, fmt, images_zip=None):
+    result = catalog.import_products(
+        artisan_id, stream, fmt, images_zip,
+        store_image=store_image,
+        image_extensions=ALLOWED_EXTENSIONS,
+        upload_url_prefix=UPLOAD_URL_PREFIX,
+        batch_size=current_app.config['CATALOG_IMPORT_BATCH_SIZE'],
+        max_image_size=current_app.config['MAX_CONTENT_LENGTH'],  # as for a single uploaded image
+    )
+    if result.inserted:
+        invalidate_artisan(artisan_id, products=True)
+    return result
+
+def catalog_export_response(fmt, artisan_id=None, filename='products'):
+    if fmt not in catalog.FORMATS:
+        abort(400)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(catalog.export_products(fmt, artisan_id)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}.{fmt}'},
+    )
+
+@bp.route('/artisan/products/import', methods=['POST'])
+@login_required('artisan', 'Please login as artisan first!')
+def import_products():
+    # Catalogs and their image zips may be much larger than a single upload;
+    # werkzeug spools big files to disk, so this doesn't raise memory use
+    request.max_content_length = current_app.config['CATALOG_IMPORT_MAX_SIZE']
+    wants_json = request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html
+    
+    file = request.files.get('file')
+    if not file or not file.filename:
+        if wants_json:
+            return jsonify(error='Please choose a CSV or JSONL file!'), 400
+        flash('Please choose a CSV or JSONL file!', 'error')
+        return redirect(url_for('main.artisan_dashboard'))
+    fmt = request.form.get('format') or catalog.detect_format(file.filename)
+    images_zip = request.files.get('images')
+    
+    try:
+        result = import_catalog(session['user_id'], file.stream, fmt,
+                                images_zip.stream if images_zip and images_zip.filename else None)
+    except (zipfile.BadZipFile, UnicodeDecodeError) as e:
+        if wants_json:
+            return jsonify(error=f'Could not read the upload: {e}'), 400
+        flash(f'Could not read the upload: {e}', 'error')
+        return redirect(url_for('main.artisan_dashboard'))
+    
+    if wants_json:
+        return jsonify(result.to_dict())
+    flash(f'Imported {result.inserted} products, {result.failed} rows skipped.',
+          'success' if not result.failed else 'info')
+    for line, message in result.errors[:5]:
+        flash(f'Line {line}: {message}', 'error')
+    return redirect(url_for('main.artisan_dashboard'))
+
+@bp.route('/artisan/products/export')
+@login_required('artisan', 'Please login as artisan first!')
+def export_products():
+    fmt = request.args.get('format', 'csv')
+    return catalog_export_response(fmt, session['user_id'], filename='my-products')
+
+@bp.route('/artisan/product/delete/<int:product_id>')
+@login_required('artisan', 'Unauthorized!', 'main.index')
+def delete_product(product_id):
+    product = Product.query.get_or_404(product_id)
+    if product.artisan_id != session['user_id']:
+        flash('Unauthorized!', 'error')
+        return redirect(url_for('main.artisan_dashboard'))
+    
+    deletes.delete_product(product)
+    db.session.commit()
+    invalidate_artisan(product.artisan_id, products=True)
+    flash('Product deleted successfully!', 'success')
+    return redirect(url_for('main.artisan_dashboard'))
+
+@bp.route('/artisan/account/delete', methods=['POST'])
+@login_required('artisan', 'Unauthorized!', 'main.index')
+def delete_artisan_account():
+    artisan = current_principal()
+    # Hidden at once; products, chats and ratings are purged in the background
+    deletes.delete_artisan(artisan)
+    db.session.commit()
+    invalidate_artisan(artisan.id, profile=True, products=True, directory=True)
+    session.clear()
+    flash('Your artisan account has been deleted.', 'success')
+    return redirect(url_for('main.index'))
+
+# View Artisan Profile and Products
+@bp.route('/artisan/<int:artisan_id>')
+def view_artisan_profile(artisan_id):
+    artisan = get_cached_artisan(artisan_id)
+    if artisan is None:
+        abort(404)
+    products = get_cached_products(artisan_id)
+    recommended = get_cached_artisan_recommendations(artisan_id, [p['id'] for p in products])
+    
+    # Get wishlist product IDs for logged-in user
+    wishlist_product_ids = []
+    if 'user_id' in session and session.get('user_type') == 'user':
+        wishlist_product_ids = set(db.session.scalars(
+            select(Wishlist.product_id)
+            .join(Product, Product.id == Wishlist.product_id)
+            .filter(Wishlist.user_id == session['user_id'], Product.artisan_id == artisan_id)
+        ))
+    
+    # Get user's rating for this artisan if exists
+    user_rating = None
+    if 'user_id' in session and session.get('user_type') == 'user':
+        user_rating = Rating.query.filter_by(
+            user_id=session['user_id'], 
+            artisan_id=artisan_id
+        ).first()
+    
+    return render_template('artisan_profile.html', 
+                         artisan=artisan, 
+                         products=products,
+                         wishlist_product_ids=wishlist_product_ids,
+                         user_rating=user_rating,
+                         recommended=recommended)
+
+# Rating Routes
+@bp.route('/artisan/<int:artisan_id>/rate', methods=['POST'])
+@login_required('user')
+def rate_artisan(artisan_id):
+    rating_value = request.form.get('rating')
+    if not rating_value or not rating_value.isdigit() or int(rating_value) < 1 or int(rating_value) > 5:
+        flash('Invalid rating value!', 'error')
+        return redirect(url_for('main.view_artisan_profile', artisan_id=artisan_id))
+    
+    Artisan.query.get_or_404(artisan_id)
+    
+    # Check if user already rated this artisan
+    existing_rating = Rating.query.filter_by(
+        user_id=session['user_id'], 
+        artisan_id=artisan_id
+    ).first()
+    
+    if existing_rating:
+        # Update existing rating
+        existing_rating.rating = int(rating_value)
+        existing_rating.updated_at = datetime.now(IST)
+        flash('Rating updated successfully!', 'success')
+    else:
+        # Create new rating
+        new_rating = Rating(
+            user_id=session['user_id'],
+            artisan_id=artisan_id,
+            rating=int(rating_value)
+        )
+        db.session.add(new_rating)
+        flash('Rating added successfully!', 'success')
+    
+    # Artisan rating counters are updated by the Rating flush events
+    db.session.commit()
+    invalidate_artisan(artisan_id, profile=True, directory=True)
+    
+    return redirect(url_for('main.view_artisan_profile', artisan_id=artisan_id))
+
+@bp.route('/artisan/<int:artisan_id>/rating/delete')
+@login_required('user', 'Unauthorized!')
+def delete_rating(artisan_id):
+    rating = Rating.query.filter_by(
+        user_id=session['user_id'],
+        artisan_id=artisan_id
+    ).first()
+    
+    if rating:
+        db.session.delete(rating)
+        db.session.commit()
+        invalidate_artisan(artisan_id, profile=True, directory=True)
+        flash('Rating deleted successfully!', 'success')
+    
+    return redirect(url_for('main.view_artisan_profile', artisan_id=artisan_id))
+
+# Wishlist Management
+@bp.route('/wishlist/add/<int:product_id>')
+@login_required('user')
+def add_to_wishlist(product_id):
+    Product.query.get_or_404(product_id)  # deleted products are hidden too
+    # The unique (user_id, product_id) index rejects duplicates
+    try:
+        db.session.add(Wishlist(user_id=session['user_id'], product_id=product_id))
+        db.session.commit()
+        flash('Added to wishlist!', 'success')
+    except IntegrityError:
+        db.session.rollback()
+        if not Wishlist.query.filter_by(user_id=session['user_id'], product_id=product_id).first():
+            raise
+        flash('Product already in wishlist!', 'info')
+    
+    return redirect(request.referrer or url_for('main.index'))
+
+@bp.route('/wishlist/remove/<int:product_id>')
+@login_required('user')
+def remove_from_wishlist(product_id):
+    wishlist_item = Wishlist.query.filter_by(user_id=session['user_id'], product_id=product_id).first()
+    if wishlist_item:
+        db.session.delete(wishlist_item)
+        db.session.commit()
+        flash('Removed from wishlist!', 'success')
+    
+    return redirect(request.referrer or url_for('main.user_dashboard'))
@@ -0,0 +1,4 @@
+"""WSGI entry point: `wsgi:app` for gunicorn or any other WSGI server"""
+from app import create_app
+
+app = create_app()